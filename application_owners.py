@@ -0,0 +1,237 @@
+from concurrent.futures import ThreadPoolExecutor
+from github import Github, UnknownObjectException
+from rest_client import get_session
+from metrics import get_metrics
+
+import csv
+import io
+import json
+import logging
+import os
+import pandas as pd
+import requests
+import threading
+import time
+
+# Constant variables
+GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+CIGNA_SERVICE_NOW_REST_URL = os.getenv('CIGNA_SERVICE_NOW_REST_URL')
+SERVICE_NOW_USERNAME = os.getenv('SERVICE_NOW_USERNAME')
+SERVICE_NOW_PASSWORD = os.getenv('SERVICE_NOW_PASSWORD')
+OWNER_REPO = os.getenv('OWNER_REPO', 'NiyiOdumosu/kafka-application-owner')
+OWNER_FILE = 'application_owners.csv'
+OWNER_CACHE_PATH = os.getenv('OWNER_CACHE_PATH', '.owner_cache.json')
+OWNER_CACHE_TTL_SECONDS = int(os.getenv('OWNER_CACHE_TTL_SECONDS', str(24 * 60 * 60)))
+OWNER_LOOKUP_WORKERS = int(os.getenv('OWNER_LOOKUP_WORKERS', '8'))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def service_now_session():
+    return get_session('service_now', (SERVICE_NOW_USERNAME, SERVICE_NOW_PASSWORD))
+
+
+def read_ba_id(filename):
+    """
+    Return the first ba.id of a topic_configs_{env}.csv file, or None if no row has one.
+    """
+    ba_ids = pd.read_csv(filename, usecols=['ba.id'])['ba.id'].dropna()
+    return str(ba_ids.iloc[0]) if not ba_ids.empty else None
+
+
+class OwnerCache:
+    """
+    BA id to application owner cache shared across runs.
+
+    Entries older than ttl seconds are ignored so owner changes in ServiceNow are picked up eventually.
+    BA ids that do not exist in ServiceNow are cached as None.
+    """
+
+    def __init__(self, path=OWNER_CACHE_PATH, ttl=OWNER_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r') as cache_file:
+                self._entries = json.load(cache_file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self._entries = {}
+
+    def get(self, ba_id):
+        """
+        Return (found, owners) for a BA id. found is False if the BA id is not cached or its entry expired.
+        """
+        with self._lock:
+            entry = self._entries.get(ba_id)
+        if entry is None or time.time() - entry['fetched_at'] > self.ttl:
+            return False, None
+        return True, entry['owners']
+
+    def last_known(self, ba_id):
+        """
+        Return the cached owners of a BA id even if its entry expired, or None if it was never cached.
+        """
+        with self._lock:
+            entry = self._entries.get(ba_id)
+        return entry['owners'] if entry else None
+
+    def put(self, ba_id, owners):
+        with self._lock:
+            self._entries[ba_id] = {'owners': owners, 'fetched_at': time.time()}
+
+    def save(self):
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as cache_file:
+                json.dump(self._entries, cache_file, indent=4, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+
+def lookup_owner(ba_id):
+    """
+    Look up the application owner contacts of a BA id in ServiceNow.
+
+    Returns:
+    str: The owner email addresses, or None if the BA id does not exist in ServiceNow.
+    """
+    first_response = service_now_session().get(CIGNA_SERVICE_NOW_REST_URL + ba_id)
+    first_response.raise_for_status()
+    first_result = first_response.json()
+    if not first_result.get('result'):
+        logger.error(f"The ba.id {ba_id} does not exist in ServiceNow")
+        return None
+
+    service_now_request = first_result["result"][0]["it_application_owner"]["link"]
+    second_response = service_now_session().get(service_now_request)
+    second_response.raise_for_status()
+    application_owners = second_response.json()["result"]['u_addl_email_addresses']
+    logger.info(f"Application owner contact info for {ba_id} is - {application_owners}")
+    return application_owners
+
+
+def try_lookup_owner(ba_id):
+    """
+    Look up the application owner of a BA id like lookup_owner, without raising if ServiceNow fails.
+
+    Returns:
+    tuple: (looked_up, owners). looked_up is False if the lookup failed, e.g. on a 404 or a rate limit.
+    """
+    try:
+        return True, lookup_owner(ba_id)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"The application owner of {ba_id} could not be looked up in ServiceNow due to - {e}")
+        return False, None
+
+
+def resolve_owners(ba_ids, cache, max_workers=OWNER_LOOKUP_WORKERS):
+    """
+    Resolve the owners of many BA ids, looking each one up at most once.
+
+    Cached owners are used while they are fresh. The remaining BA ids are looked up in ServiceNow concurrently.
+    If a lookup fails, the last cached owners of the BA id are kept, or None if it was never cached, and the
+    BA id is looked up again by the next run.
+
+    Parameters:
+    - ba_ids (iterable of str): The BA ids. Duplicates are looked up once.
+    - cache (OwnerCache): The owner cache.
+    - max_workers (int): The maximum number of concurrent ServiceNow lookups.
+
+    Returns:
+    dict: {ba_id: owners} for every BA id. owners is None for BA ids that do not exist in ServiceNow.
+    """
+    owners = {}
+    missing = []
+    for ba_id in dict.fromkeys(ba_ids):
+        found, cached_owners = cache.get(ba_id)
+        if found:
+            logger.info(f"Using the cached application owner of {ba_id}")
+            owners[ba_id] = cached_owners
+        else:
+            missing.append(ba_id)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for ba_id, (looked_up, ba_owners) in zip(missing, executor.map(try_lookup_owner, missing)):
+                if looked_up:
+                    cache.put(ba_id, ba_owners)
+                    owners[ba_id] = ba_owners
+                else:
+                    owners[ba_id] = cache.last_known(ba_id)
+    return owners
+
+
+def parse_owner_file(content):
+    """
+    Parse application_owners.csv into {ba_id: owners}. Later lines win over earlier ones.
+    """
+    return {row[0].strip(): row[1] for row in csv.reader(io.StringIO(content), skipinitialspace=True) if len(row) >= 2}
+
+
+def render_owner_file(owners):
+    lines = []
+    for ba_id, ba_owners in owners.items():
+        lines.append(f"{ba_id}, \"{ba_owners}\"\n")
+    return ''.join(lines)
+
+
+def update_owner_file(owners, branch='main'):
+    """
+    Merge resolved owners into application_owners.csv of the owner repository with at most one commit.
+
+    Parameters:
+    - owners (dict): {ba_id: owners} from resolve_owners. BA ids without owners are ignored.
+    - branch (str): The branch to commit to.
+
+    Returns:
+    bool: True if the file was written, False if the owner set did not change.
+    """
+    repo = Github(GITHUB_TOKEN).get_repo(OWNER_REPO)
+    try:
+        with get_metrics().timed('github', 'get_contents') as timer:
+            contents = repo.get_contents(OWNER_FILE, ref=branch)
+            timer.bytes_received = contents.size
+        current = parse_owner_file(contents.decoded_content.decode('utf-8'))
+    except UnknownObjectException:
+        contents = None
+        current = {}
+
+    updated = dict(current)
+    updated.update({ba_id: ba_owners for ba_id, ba_owners in owners.items() if ba_owners})
+    if updated == current:
+        logger.info(f"The application owners in {OWNER_FILE} are up to date")
+        return False
+
+    content = render_owner_file(updated)
+    if contents is not None:
+        with get_metrics().timed('github', 'update_file') as timer:
+            timer.bytes_sent = len(content)
+            repo.update_file(contents.path, "Updated application owners", content, contents.sha, branch=branch)
+        logger.info(f'Updated application owners in {OWNER_FILE}')
+    else:
+        with get_metrics().timed('github', 'create_file') as timer:
+            timer.bytes_sent = len(content)
+            repo.create_file(OWNER_FILE, "Added application owners", content, branch=branch)
+        logger.info(f'Created {OWNER_FILE}')
+    return True
+
+
+def sync_application_owners(filenames):
+    """
+    Resolve the owners of every topic_configs_{env}.csv changed in a pull request and record them.
+
+    Parameters:
+    - filenames (list of str): The changed topic configs files.
+
+    Returns:
+    dict: {ba_id: owners} for every BA id found in the files.
+    """
+    ba_ids = [ba_id for ba_id in (read_ba_id(filename) for filename in filenames) if ba_id]
+    if not ba_ids:
+        return {}
+    cache = OwnerCache()
+    owners = resolve_owners(ba_ids, cache)
+    cache.save()
+    update_owner_file(owners)
+    return owners
@@ -0,0 +1,319 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass
+
+import logging
+import os
+
+# Constant variables
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '8'))
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '100'))
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Outcome:
+    """
+    The result of applying a single change to a single resource.
+
+    Attributes:
+    - resource_type (str): 'topic', 'acl' or 'connector'.
+    - resource_id (str): The topic name, acl id or connector name.
+    - action (str): The operation that was attempted, e.g. 'create', 'update', 'delete'.
+    - status (str): One of SUCCEEDED, FAILED or SKIPPED.
+    - detail (str): Free-form detail such as the REST response or the validation error.
+    """
+    resource_type: str
+    resource_id: str
+    action: str
+    status: str
+    detail: str = ''
+
+    @property
+    def failed(self):
+        return self.status == FAILED
+
+
+@dataclass
+class Operation:
+    """
+    A single pending change that the apply engine can execute.
+
+    Attributes:
+    - resource_type (str): 'topic', 'acl' or 'connector'.
+    - resource_id (str): The topic name, acl id or connector name.
+    - action (str): The operation that will be attempted.
+    - func (callable): The function that performs the change. It must return an Outcome.
+    - args (tuple): Positional arguments passed to func.
+    - cache_entry (tuple): Optional (application, env, definition_hash) recorded in the resource cache once the
+      operation has run. The hash is None for deletions.
+    - batch (callable): Optional function that applies many operations at once. It is called with a list of
+      operations sharing the same batch function and must return one Outcome per operation, in the same order.
+    """
+    resource_type: str
+    resource_id: str
+    action: str
+    func: object
+    args: tuple = ()
+    cache_entry: tuple = None
+    batch: object = None
+
+    def skip(self, reason):
+        return Outcome(self.resource_type, self.resource_id, self.action, SKIPPED, reason)
+
+
+def run_operation(operation):
+    """
+    Execute one operation and turn anything it raises into a failed Outcome.
+
+    Parameters:
+    - operation (Operation): The operation to execute.
+
+    Returns:
+    Outcome: The outcome reported by the operation, or a failed outcome if it raised.
+    """
+    try:
+        outcome = operation.func(*operation.args)
+    except Exception as e:
+        logger.error(f"The {operation.resource_type} {operation.resource_id} failed to {operation.action} due to - {e}")
+        return Outcome(operation.resource_type, operation.resource_id, operation.action, FAILED, str(e))
+    if not isinstance(outcome, Outcome):
+        outcome = Outcome(operation.resource_type, operation.resource_id, operation.action, SUCCEEDED)
+    return outcome
+
+
+def run_batch(batch, operations):
+    """
+    Execute a batch of operations and turn anything it raises into failed Outcomes.
+
+    Parameters:
+    - batch (callable): The batch function shared by the operations.
+    - operations (list of Operation): The operations to execute together.
+
+    Returns:
+    list: One Outcome per operation, in the same order.
+    """
+    try:
+        outcomes = batch(operations)
+        if len(outcomes) != len(operations):
+            raise RuntimeError(f"{batch.__name__} returned {len(outcomes)} outcome(s) for {len(operations)} operation(s)")
+    except Exception as e:
+        logger.error(f"The batch of {len(operations)} {operations[0].resource_type} operation(s) failed due to - {e}")
+        return [Outcome(operation.resource_type, operation.resource_id, operation.action, FAILED, str(e))
+                for operation in operations]
+    return outcomes
+
+
+def run_phase(executor, operations, batch_size=BATCH_SIZE):
+    """
+    Run the operations of one phase concurrently.
+
+    Operations with a batch function are grouped by that function into chunks of up to batch_size operations,
+    and each chunk runs as one task. The other operations run one task each.
+
+    Returns:
+    list: One Outcome per operation, in the same order as operations.
+    """
+    outcomes = [None] * len(operations)
+    single_futures = {}
+    batches = {}
+    for index, operation in enumerate(operations):
+        if operation.batch is None:
+            # Each task runs in a copy of the caller's context, so it sees the caller's cluster target
+            single_futures[index] = executor.submit(copy_context().run, run_operation, operation)
+        else:
+            batches.setdefault(operation.batch, []).append(index)
+
+    batch_futures = []
+    for batch, indexes in batches.items():
+        for start in range(0, len(indexes), batch_size):
+            chunk = indexes[start:start + batch_size]
+            batch_futures.append((chunk, executor.submit(copy_context().run, run_batch, batch,
+                                                         [operations[index] for index in chunk])))
+
+    for index, future in single_futures.items():
+        outcomes[index] = future.result()
+    for indexes, future in batch_futures:
+        for index, outcome in zip(indexes, future.result()):
+            outcomes[index] = outcome
+    return outcomes
+
+
+def run_phases(phases, max_workers=MAX_WORKERS, after_phase=None, batch_size=BATCH_SIZE):
+    """
+    Run groups of operations one phase after the other, running the operations of each phase concurrently.
+
+    Operations inside a phase are independent of each other. A phase only starts once every operation
+    of the previous phase has finished, so topics can be created before the ACLs and connectors that
+    reference them. If any operation in a phase fails, every later phase is skipped.
+
+    Parameters:
+    - phases (list of tuples): (phase_name, list of Operation) in the order they must run.
+    - max_workers (int): The maximum number of operations running at the same time.
+    - after_phase (callable): Optional function called with no arguments after each phase that ran.
+    - batch_size (int): The maximum number of operations sent in one batch, see run_phase.
+
+    Returns:
+    list: A list of Outcome objects, one per operation, in phase order.
+    """
+    outcomes = []
+    blocked_by = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for phase_name, operations in phases:
+            if not operations:
+                continue
+            if blocked_by:
+                logger.error(f"Skipping the {phase_name} phase because the {blocked_by} phase failed")
+                outcomes.extend(operation.skip(f"{blocked_by} phase failed") for operation in operations)
+                continue
+
+            logger.info(f"Running the {phase_name} phase with {len(operations)} operation(s)")
+            phase_outcomes = run_phase(executor, operations, batch_size)
+            outcomes.extend(phase_outcomes)
+            if after_phase:
+                after_phase()
+            if any(outcome.failed for outcome in phase_outcomes):
+                blocked_by = phase_name
+    return outcomes
+
+
+def run_graph(phases, prerequisites, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE):
+    """
+    Run operations as a dependency graph, starting each one as soon as all of its prerequisites have succeeded.
+
+    There is no barrier between phases: independent branches of the graph run concurrently, up to max_workers
+    at a time. If an operation fails or is skipped, everything that depends on it, directly or not, is skipped,
+    while the rest of the graph carries on.
+
+    Ready operations that share a batch function are held back and sent together, in chunks of up to batch_size,
+    once batch_size of them are ready or none of the others with the same batch function can still become ready.
+
+    Parameters:
+    - phases (list of tuples): (phase_name, list of Operation). The phases only fix the order of the operations
+      and of the returned outcomes.
+    - prerequisites (dict): {index: set of indexes} of the operations, in phase order, that must succeed before
+      the operation at index can start.
+    - max_workers (int): The maximum number of tasks running at the same time.
+    - batch_size (int): The maximum number of operations sent in one batch.
+
+    Returns:
+    list: A list of Outcome objects, one per operation, in phase order.
+    """
+    operations = [operation for _, phase_operations in phases for operation in phase_operations]
+    outcomes = [None] * len(operations)
+    dependents = {index: [] for index in range(len(operations))}
+    pending = {}
+    for index in range(len(operations)):
+        pending[index] = len(prerequisites.get(index, ()))
+        for prerequisite in prerequisites.get(index, ()):
+            dependents[prerequisite].append(index)
+    # Operations of each batch function that are not ready yet and may still become ready
+    waiting = {}
+    for operation in operations:
+        if operation.batch is not None:
+            waiting[operation.batch] = waiting.get(operation.batch, 0) + 1
+
+    ready = deque(index for index in range(len(operations)) if not pending[index])
+    held = {}
+    running = {}
+
+    def finish(index, outcome):
+        outcomes[index] = outcome
+        blocked = deque()
+        if outcome.status != SUCCEEDED:
+            blocked.extend((dependent, index) for dependent in dependents[index])
+        else:
+            for dependent in dependents[index]:
+                pending[dependent] -= 1
+                if not pending[dependent] and outcomes[dependent] is None:
+                    ready.append(dependent)
+        while blocked:
+            dependent, cause = blocked.popleft()
+            if outcomes[dependent] is not None:
+                continue
+            operation = operations[dependent]
+            outcomes[dependent] = operation.skip(f"{operations[cause].resource_type} {operations[cause].resource_id} "
+                                                 f"did not {operations[cause].action}")
+            if operation.batch is not None:
+                waiting[operation.batch] -= 1
+            blocked.extend((grand_dependent, dependent) for grand_dependent in dependents[dependent])
+
+    def submit_batch(batch, indexes):
+        future = executor.submit(copy_context().run, run_batch, batch, [operations[index] for index in indexes])
+        running[future] = indexes
+
+    logger.info(f"Running {len(operations)} operation(s) with "
+                f"{sum(len(indexes) for indexes in prerequisites.values())} dependenc(ies)")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while ready or held or running:
+            while ready:
+                index = ready.popleft()
+                operation = operations[index]
+                if operation.batch is None:
+                    # Each task runs in a copy of the caller's context, so it sees the caller's cluster target
+                    running[executor.submit(copy_context().run, run_operation, operation)] = [index]
+                else:
+                    held.setdefault(operation.batch, []).append(index)
+                    waiting[operation.batch] -= 1
+
+            for batch in list(held):
+                indexes = held[batch]
+                while len(indexes) >= batch_size:
+                    submit_batch(batch, indexes[:batch_size])
+                    indexes = indexes[batch_size:]
+                if indexes and (not waiting[batch] or not running):
+                    submit_batch(batch, indexes)
+                    indexes = []
+                if indexes:
+                    held[batch] = indexes
+                else:
+                    del held[batch]
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                indexes = running.pop(future)
+                if len(indexes) == 1 and operations[indexes[0]].batch is None:
+                    finish(indexes[0], future.result())
+                else:
+                    for index, outcome in zip(indexes, future.result()):
+                        finish(index, outcome)
+
+    # Only a dependency cycle leaves operations that never became ready
+    for index, outcome in enumerate(outcomes):
+        if outcome is None:
+            outcomes[index] = operations[index].skip("dependency cycle")
+    return outcomes
+
+
+def summarize_outcomes(outcomes):
+    """
+    Log a one line summary per outcome and the totals for the run.
+
+    Parameters:
+    - outcomes (list of Outcome): The outcomes returned by run_phases or run_graph.
+
+    Returns:
+    bool: True if no operation failed.
+    """
+    for outcome in outcomes:
+        message = f"{outcome.status.upper()} - {outcome.action} {outcome.resource_type} {outcome.resource_id}"
+        if outcome.detail:
+            message += f" - {outcome.detail}"
+        if outcome.status == SUCCEEDED:
+            logger.info(message)
+        else:
+            logger.error(message)
+
+    totals = {status: sum(1 for outcome in outcomes if outcome.status == status) for status in (SUCCEEDED, FAILED, SKIPPED)}
+    logger.info(f"Applied {len(outcomes)} change(s): {totals[SUCCEEDED]} succeeded, {totals[FAILED]} failed, {totals[SKIPPED]} skipped")
+    return totals[FAILED] == 0 and totals[SKIPPED] == 0
@@ -0,0 +1,308 @@
+from fake_cluster import DEFAULT_CLUSTER_ID, FakeCluster, FakeClusterServer
+
+import click
+import copy
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+# Constant variables
+ACL_OPERATIONS = ('READ', 'WRITE', 'DESCRIBE', 'DESCRIBE_CONFIGS')
+DAY_MS = 86400000
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def synthetic_topic(topic_name, partitions_count=4, retention_ms=DAY_MS):
+    return {
+        'topic_name': topic_name,
+        'partitions_count': str(partitions_count),
+        'replication_factor': 1,
+        'configs': [
+            {'name': 'cleanup.policy', 'value': 'delete'},
+            {'name': 'compression.type', 'value': 'producer'},
+            {'name': 'retention.ms', 'value': retention_ms},
+            {'name': 'max.message.bytes', 'value': 1048588},
+        ],
+    }
+
+
+def synthetic_acls(principal, topic_name, count):
+    """
+    Return count (acl_id, acl) tuples granting principal access to topic_name, named like the acls files.
+    """
+    return [(f"{principal}-{topic_name}-{operation}", {
+        'resource_type': 'TOPIC',
+        'resource_name': topic_name,
+        'pattern_type': 'LITERAL',
+        'principal': principal,
+        'host': '*',
+        'operation': operation,
+        'permission': 'ALLOW',
+    }) for operation in ACL_OPERATIONS[:count]]
+
+
+def synthetic_connector(topic_name, tasks_max=1):
+    return {
+        'connector.class': 'io.confluent.kafka.connect.datagen.DatagenConnector',
+        'kafka.topic': topic_name,
+        'value.converter': 'org.apache.kafka.connect.json.JsonConverter',
+        'output.data.format': 'JSON',
+        'quickstart': 'ORDERS',
+        'tasks.max': str(tasks_max),
+    }
+
+
+def generate_tree(env, topics, applications, acls_per_topic, connectors):
+    """
+    Generate the resources of a synthetic repository.
+
+    Parameters:
+    - env (str): The environment of the generated files.
+    - topics (int): The total number of topics, spread evenly over the applications.
+    - applications (int): The number of application folders.
+    - acls_per_topic (int): The number of ACLs granted on each topic, at most len(ACL_OPERATIONS).
+    - connectors (int): The total number of connectors, each writing to a topic of its application.
+
+    Returns:
+    dict: {application: {'topics': list of topics, 'acls': list of (acl_id, acl), 'connectors': {name: config}}}
+    """
+    tree = {}
+    for index in range(applications):
+        application = f'application{index + 1}'
+        principal = f'User:{application}svc'
+        application_topics = [synthetic_topic(f'{application}_topic{number}_{env}')
+                              for number in range(topics // applications + (index < topics % applications))]
+        tree[application] = {
+            'topics': application_topics,
+            'acls': [acl for topic in application_topics
+                     for acl in synthetic_acls(principal, topic['topic_name'], acls_per_topic)],
+            'connectors': {f'{application}-datagen{number}-{env}': synthetic_connector(
+                application_topics[number % len(application_topics)]['topic_name'])
+                for number in range(connectors // applications + (index < connectors % applications))
+                if application_topics},
+        }
+    return tree
+
+
+def mutate_tree(tree, env, change_ratio, acls_per_topic, seed=0):
+    """
+    Return a copy of tree with a share of its resources changed, added and removed, as a commit would.
+
+    In every application, change_ratio of the topics get a new retention.ms, as many new topics are added with
+    their ACLs, half as many topics are removed with their ACLs and change_ratio of the connectors get a new
+    tasks.max. Topics used by connectors are never removed.
+    """
+    rng = random.Random(seed)
+    mutated = copy.deepcopy(tree)
+    for application, resources in mutated.items():
+        topics = resources['topics']
+        count = int(len(topics) * change_ratio)
+        for topic in rng.sample(topics, count):
+            topic['configs'][2]['value'] = DAY_MS * rng.randint(2, 7)
+
+        connector_topics = {config['kafka.topic'] for config in resources['connectors'].values()}
+        removable = [topic['topic_name'] for topic in topics if topic['topic_name'] not in connector_topics]
+        removed = set(rng.sample(removable, min(count // 2, len(removable))))
+        resources['topics'] = [topic for topic in topics if topic['topic_name'] not in removed]
+        resources['acls'] = [(acl_id, acl) for acl_id, acl in resources['acls'] if acl['resource_name'] not in removed]
+
+        principal = f'User:{application}svc'
+        for number in range(count):
+            topic = synthetic_topic(f'{application}_newtopic{number}_{env}')
+            resources['topics'].append(topic)
+            resources['acls'].extend(synthetic_acls(principal, topic['topic_name'], acls_per_topic))
+
+        connector_names = sorted(resources['connectors'])
+        for name in rng.sample(connector_names, int(len(connector_names) * change_ratio)):
+            resources['connectors'][name]['tasks.max'] = str(rng.randint(2, 8))
+    return mutated
+
+
+def write_tree(root, env, tree):
+    """
+    Write a synthetic tree as application*/ folders, replacing any previous version.
+    """
+    for application, resources in tree.items():
+        application_dir = os.path.join(root, application)
+        shutil.rmtree(application_dir, ignore_errors=True)
+        for folder in ('topics', 'acls', 'connectors'):
+            os.makedirs(os.path.join(application_dir, folder))
+        with open(os.path.join(application_dir, 'topics', f'topics_{env}.json'), 'w') as topics_file:
+            json.dump([{topic['topic_name']: topic} for topic in resources['topics']], topics_file, indent=4)
+        with open(os.path.join(application_dir, 'acls', f'acls_{env}.json'), 'w') as acls_file:
+            json.dump([{acl_id: acl} for acl_id, acl in resources['acls']], acls_file, indent=4)
+        for name, config in resources['connectors'].items():
+            with open(os.path.join(application_dir, 'connectors', f'{name}.json'), 'w') as connector_file:
+                json.dump(config, connector_file, indent=2)
+
+
+def git(root, *args):
+    result = subprocess.run(['git', *args], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed - {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def commit_tree(root, message):
+    git(root, 'add', '-A')
+    git(root, '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost', 'commit', '-q', '-m', message)
+    return git(root, 'rev-parse', 'HEAD')
+
+
+def measure(func, *args):
+    """
+    Run func and measure its wall time and the peak memory allocated by Python while it ran.
+
+    Returns:
+    tuple: (result, seconds, peak_bytes)
+    """
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        result = func(*args)
+        seconds = time.monotonic() - started
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak_bytes
+
+
+def configure_environment(root, server_url, env):
+    """
+    Point the pipeline at the fake cluster and keep every file it writes inside root.
+
+    Must run before pipeline or rest_client are imported, since their settings are read at import time.
+    """
+    kafka_configs = os.path.join(root, 'kafka-configs')
+    with open(kafka_configs, 'w') as script:
+        # Lists no SCRAM users and accepts every alter, so users are created without a Kafka cluster
+        script.write('#!/bin/sh\nexit 0\n')
+    os.chmod(kafka_configs, 0o755)
+    os.environ.update({
+        'REST_URL': server_url,
+        'CONNECT_REST_URL': server_url,
+        'KAFKA_CLUSTER_ID': DEFAULT_CLUSTER_ID,
+        'ENV': env,
+        'KAFKA_CONFIGS': kafka_configs,
+        'BOOTSTRAP_URL': 'localhost:9092',
+        'CLIENT_PROPERTIES': os.path.join(root, 'client.properties'),
+        'RESOURCE_CACHE_PATH': os.path.join(root, '.resource_cache.db'),
+        'CHANGELOG_PATH': os.path.join(root, 'CHANGELOG.md'),
+        'AUDIT_LOG_PATH': os.path.join(root, 'audit_log.jsonl'),
+    })
+    # Exercise the REST Proxy path even where an Admin client is configured
+    os.environ.pop('ADMIN_CLIENT_CONFIG', None)
+
+
+def diff_changes(changes, env, previous_revision, latest_revision):
+    """
+    Run the topic and ACL differs over every changed file, without building operations.
+
+    Returns:
+    int: The number of changed resources found.
+    """
+    from git_blobs import GitBlobReader
+    from pipeline import find_changed_acls, find_changed_topics, load_resources_from_git
+
+    changed = 0
+    with GitBlobReader() as blob_reader:
+        for change in changes:
+            if change.path.endswith(f'topics_{env}.json'):
+                differ = find_changed_topics
+            elif change.path.endswith(f'acls_{env}.json'):
+                differ = find_changed_acls
+            else:
+                continue
+            source = load_resources_from_git(blob_reader, previous_revision, change.previous_path or change.path)
+            feature = load_resources_from_git(blob_reader, latest_revision, change.path)
+            changed += len(differ(source, feature))
+    return changed
+
+
+def report(rows):
+    click.echo(f"{'stage':<10} {'seconds':>10} {'requests':>10} {'peak MiB':>10} {'changes':>10} {'failed':>10}")
+    for stage, seconds, requests, peak_bytes, changes, failed in rows:
+        click.echo(f"{stage:<10} {seconds:>10.3f} {requests:>10} {peak_bytes / 1024 / 1024:>10.1f} {changes:>10} {failed:>10}")
+
+
+@click.command()
+@click.option('--topics', default=1000, show_default=True, help='The total number of topics in the repository.')
+@click.option('--applications', default=10, show_default=True, help='The number of application folders.')
+@click.option('--acls-per-topic', default=2, show_default=True, type=click.IntRange(0, len(ACL_OPERATIONS)), help='The number of ACLs per topic.')
+@click.option('--connectors', default=50, show_default=True, help='The total number of connectors.')
+@click.option('--change-ratio', default=0.1, show_default=True, help='The share of resources the benchmarked commit changes.')
+@click.option('--latency-ms', default=0.0, show_default=True, help='The latency added to every fake REST call.')
+@click.option('--jitter-ms', default=0.0, show_default=True, help='Up to this much latency is added at random to every call.')
+@click.option('--error-rate', default=0.0, show_default=True, help='The share of write calls that fail.')
+@click.option('--error-status', default=500, show_default=True, help='The status code of the failed calls.')
+@click.option('--connector-startup-ms', default=0.0, show_default=True, help='How long a deployed connector takes to reach RUNNING.')
+@click.option('--env', default='dev', show_default=True, help='The environment of the generated files.')
+@click.option('--seed', default=0, show_default=True, help='The seed of the generated changes and injected errors.')
+@click.option('--keep', is_flag=True, help='Keep the generated repository and print its path.')
+def main(topics, applications, acls_per_topic, connectors, change_ratio, latency_ms, jitter_ms, error_rate,
+         error_status, connector_startup_ms, env, seed, keep):
+    """
+    Benchmark the differs and deploy_changes against a fake REST Proxy and Connect on a synthetic repository.
+    """
+    root = tempfile.mkdtemp(prefix='kafkamanager-benchmark-')
+    cwd = os.getcwd()
+    cluster = FakeCluster(latency=latency_ms / 1000, jitter=jitter_ms / 1000, error_rate=error_rate,
+                          error_status=error_status, connector_startup=connector_startup_ms / 1000, seed=seed)
+    try:
+        baseline = generate_tree(env, topics, applications, acls_per_topic, connectors)
+        changed = mutate_tree(baseline, env, change_ratio, acls_per_topic, seed)
+        git(root, 'init', '-q')
+        write_tree(root, env, baseline)
+        previous_revision = commit_tree(root, 'baseline')
+        write_tree(root, env, changed)
+        latest_revision = commit_tree(root, 'change')
+        cluster.load(topics=(topic for resources in baseline.values() for topic in resources['topics']),
+                     acls=(acl for resources in baseline.values() for _, acl in resources['acls']),
+                     connectors={name: config for resources in baseline.values()
+                                 for name, config in resources['connectors'].items()})
+
+        with FakeClusterServer(cluster) as server:
+            configure_environment(root, server.url, env)
+            os.chdir(root)
+            from file_changes import changes_from_git_diff
+            from apply_engine import SUCCEEDED
+            from metrics import get_metrics
+            from pipeline import close_sessions, deploy_changes
+
+            changes = changes_from_git_diff(previous_revision, latest_revision, merge_base=False)
+            rows = []
+            diffed, seconds, peak_bytes = measure(diff_changes, changes, env, previous_revision, latest_revision)
+            rows.append(('diff', seconds, 0, peak_bytes, diffed, 0))
+
+            cluster.reset_counts()
+            try:
+                outcomes, seconds, peak_bytes = measure(deploy_changes, changes, env, previous_revision,
+                                                        latest_revision, False)
+            finally:
+                close_sessions()
+            rows.append(('deploy', seconds, cluster.total_requests(), peak_bytes, len(outcomes),
+                         sum(1 for outcome in outcomes if outcome.status != SUCCEEDED)))
+
+        for (method, route), count in sorted(cluster.request_counts.items()):
+            logger.info(f"{count} {method} {route} request(s)")
+        get_metrics().log_summary()
+        report(rows)
+    finally:
+        os.chdir(cwd)
+        if keep:
+            click.echo(f"The generated repository is in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+from github import UnknownObjectException
+from git_blobs import GitBlobReader
+from metrics import get_metrics
+
+import base64
+import io
+import json
+import logging
+import os
+import threading
+
+# Constant variables
+BLOB_CACHE_DIR = os.getenv('BLOB_CACHE_DIR', '.blob_cache')
+BLOB_FETCH_WORKERS = int(os.getenv('BLOB_FETCH_WORKERS', '8'))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BlobCache:
+    """
+    On-disk cache of file contents keyed by git blob SHA.
+
+    Blobs and trees are immutable, so entries never need to be invalidated.
+    """
+
+    def __init__(self, cache_dir=BLOB_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, kind, sha):
+        return os.path.join(self.cache_dir, kind, sha[:2], sha)
+
+    def _read(self, kind, sha):
+        try:
+            with open(self._path(kind, sha), 'rb') as cache_file:
+                return cache_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, kind, sha, content):
+        path = self._path(kind, sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a concurrent reader never sees a partial entry
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(content)
+        os.replace(temp_path, path)
+
+    def get_blob(self, sha):
+        return self._read('blobs', sha)
+
+    def put_blob(self, sha, content):
+        self._write('blobs', sha, content)
+
+    def get_tree(self, commit_sha):
+        content = self._read('trees', commit_sha)
+        return json.loads(content) if content is not None else None
+
+    def put_tree(self, commit_sha, tree):
+        self._write('trees', commit_sha, json.dumps(tree).encode('utf-8'))
+
+
+class GitHubBlobFetcher:
+    """
+    Fetch the content of many files at two commits with the Git Trees and Blobs APIs.
+
+    Each commit's tree is listed once with a single recursive call. The blobs of the requested files are then
+    deduplicated by SHA, so a file that did not change between the commits is downloaded once, and the missing
+    ones are downloaded concurrently. Trees and blobs are kept in a BlobCache, so fetching the same commits
+    again costs no API calls. If GitHub truncates the listing of a very large tree, the paths missing from it
+    are looked up one by one with the Contents API instead of being read as absent.
+    """
+
+    def __init__(self, repo, cache=None, max_workers=BLOB_FETCH_WORKERS):
+        self.repo = repo
+        self.cache = cache or BlobCache()
+        self.max_workers = max_workers
+        self._trees = {}
+        self._truncated = set()
+        self._blobs = {}
+
+    def tree(self, commit_sha):
+        """
+        Return the files of a commit.
+
+        Returns:
+        dict: {path: blob_sha} for every file in the commit.
+        """
+        if commit_sha in self._trees:
+            return self._trees[commit_sha]
+        tree = self.cache.get_tree(commit_sha)
+        if tree is None:
+            with get_metrics().timed('github', 'get_git_tree'):
+                git_tree = self.repo.get_git_tree(commit_sha, recursive=True)
+            tree = {element.path: element.sha for element in git_tree.tree if element.type == 'blob'}
+            if git_tree.raw_data.get('truncated'):
+                # Only complete listings are cached, a missing path must not read as a removed file
+                logger.warning(f"The tree of {commit_sha} is too large to be listed in full, "
+                               f"missing files are looked up one by one")
+                self._truncated.add(commit_sha)
+            else:
+                self.cache.put_tree(commit_sha, tree)
+        self._trees[commit_sha] = tree
+        return tree
+
+    def blob_sha(self, commit_sha, path):
+        """
+        Return the blob SHA of a file at a commit, or None if the file does not exist at that commit.
+        """
+        tree = self.tree(commit_sha)
+        if path in tree or commit_sha not in self._truncated:
+            return tree.get(path)
+        try:
+            with get_metrics().timed('github', 'get_contents'):
+                contents = self.repo.get_contents(path, ref=commit_sha)
+            sha = None if isinstance(contents, list) else contents.sha
+        except UnknownObjectException:
+            sha = None
+        tree[path] = sha
+        return sha
+
+    def _download(self, sha):
+        content = self.cache.get_blob(sha)
+        if content is None:
+            with get_metrics().timed('github', 'get_git_blob') as timer:
+                blob = self.repo.get_git_blob(sha)
+                content = base64.b64decode(blob.content) if blob.encoding == 'base64' else blob.content.encode('utf-8')
+                timer.bytes_received = len(content)
+            self.cache.put_blob(sha, content)
+        return content
+
+    def prefetch(self, revisions, paths):
+        """
+        Download the content of every path at every revision.
+
+        Parameters:
+        - revisions (list of str): The commit SHAs.
+        - paths (list of str): The file paths. Paths missing from a commit are ignored.
+        """
+        shas = {self.blob_sha(revision, path) for revision in revisions for path in paths} - {None}
+        missing = [sha for sha in shas if sha not in self._blobs]
+        if not missing:
+            return
+        logger.info(f"Fetching {len(missing)} blob(s) for {len(paths)} file(s)")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for sha, content in zip(missing, executor.map(self._download, missing)):
+                self._blobs[sha] = content
+
+    def read(self, revision, path):
+        """
+        Read a file as it was at the given commit.
+
+        Returns:
+        bytes: The file content, or None if the file does not exist at that commit.
+        """
+        sha = self.blob_sha(revision, path)
+        if sha is None:
+            return None
+        if sha not in self._blobs:
+            self._blobs[sha] = self._download(sha)
+        return self._blobs[sha]
+
+    def open(self, revision, path):
+        """
+        Open a file as it was at the given commit, like GitBlobReader.open. Blobs are downloaded whole by the
+        API, so the stream wraps the downloaded content without copying it.
+        """
+        content = self.read(revision, path)
+        return io.BytesIO(content) if content is not None else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LocalBlobFetcher(GitBlobReader):
+    """
+    Read the files from the local clone instead of the GitHub API. Both commits must be fetched.
+    """
+
+    def prefetch(self, revisions, paths):
+        pass
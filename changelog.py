@@ -0,0 +1,134 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from cluster_targets import current_target
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# Constant variables
+CHANGELOG_PATH = os.getenv('CHANGELOG_PATH', 'CHANGELOG.md')
+AUDIT_LOG_PATH = os.getenv('AUDIT_LOG_PATH', 'audit_log.jsonl')
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_changelog = None
+_changelog_lock = threading.Lock()
+
+
+@dataclass
+class ChangeRecord:
+    """
+    One change made to the cluster, as written to the audit log.
+
+    Attributes:
+    - run_id (str): The id of the pipeline run that made the change.
+    - commit_sha (str): The commit being deployed.
+    - timestamp (str): When the change finished, in ISO 8601.
+    - resource_type (str): 'topic', 'acl' or 'connector'.
+    - resource_id (str): The topic name, acl id or connector name.
+    - action (str): The attempted operation, e.g. 'create'.
+    - request (str): The HTTP method and URL of the request.
+    - status (str): The status of the Outcome.
+    - latency_ms (float): The duration of the request in milliseconds.
+    - message (str): The human-readable changelog line.
+    - cluster (str): The name of the cluster target the change was made on.
+    """
+    run_id: str
+    commit_sha: str
+    timestamp: str
+    resource_type: str
+    resource_id: str
+    action: str
+    request: str
+    status: str
+    latency_ms: float
+    message: str
+    cluster: str = None
+
+
+class ChangelogSink:
+    """
+    Buffer of the changes made during a run, shared by every worker.
+
+    Records are only kept in memory until flush(), which appends them to the Markdown changelog and to the
+    JSON Lines audit log with one write per file, so concurrent operations never interleave their lines.
+    """
+
+    def __init__(self, run_id=None, commit_sha=None, changelog_path=CHANGELOG_PATH, audit_log_path=AUDIT_LOG_PATH):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.commit_sha = commit_sha
+        self.changelog_path = changelog_path
+        self.audit_log_path = audit_log_path
+        self._records = []
+        self._lock = threading.Lock()
+
+    def record(self, outcome, request, message, started=None):
+        """
+        Buffer one change.
+
+        Parameters:
+        - outcome (Outcome): The outcome of the change.
+        - request (str): The HTTP method and URL of the request, e.g. 'POST http://rest-proxy/v3/...'.
+        - message (str): The human-readable changelog line.
+        - started (float): The time.monotonic() value taken before the request, used for the latency.
+
+        Returns:
+        Outcome: The given outcome, so callers can record and return in one statement.
+        """
+        latency_ms = round((time.monotonic() - started) * 1000, 3) if started is not None else None
+        record = ChangeRecord(self.run_id, self.commit_sha, datetime.now().isoformat(), outcome.resource_type,
+                              outcome.resource_id, outcome.action, request, outcome.status, latency_ms, message,
+                              current_target().name)
+        with self._lock:
+            self._records.append(record)
+        return outcome
+
+    def flush(self):
+        """
+        Write the buffered records to the changelog and the audit log and clear the buffer.
+
+        Returns:
+        int: The number of records written.
+        """
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return 0
+        with open(self.changelog_path, 'a') as changelog_file:
+            changelog_file.write(''.join(f"{record.timestamp} - [{record.cluster}] {record.message}\n" for record in records))
+        with open(self.audit_log_path, 'a') as audit_log_file:
+            audit_log_file.write(''.join(json.dumps(asdict(record)) + "\n" for record in records))
+        logger.info(f"Wrote {len(records)} change(s) of run {self.run_id} to {self.changelog_path} and {self.audit_log_path}")
+        return len(records)
+
+
+def start_changelog(commit_sha=None, run_id=None):
+    """
+    Start the shared changelog of a new run. Records still buffered from a previous run are flushed first.
+
+    Returns:
+    ChangelogSink: The shared changelog.
+    """
+    global _changelog
+    with _changelog_lock:
+        if _changelog is not None:
+            _changelog.flush()
+        _changelog = ChangelogSink(run_id, commit_sha)
+        return _changelog
+
+
+def get_changelog():
+    """
+    Return the shared changelog, starting one without a commit SHA on first use.
+    """
+    global _changelog
+    with _changelog_lock:
+        if _changelog is None:
+            _changelog = ChangelogSink()
+        return _changelog
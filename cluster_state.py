@@ -0,0 +1,320 @@
+from rest_client import connect_session, rest_proxy_session
+from cluster_targets import current_target
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+# Constant variables
+REFRESH_SNAPSHOT_AFTER_WRITES = os.getenv('REFRESH_SNAPSHOT_AFTER_WRITES', 'false').lower() == 'true'
+ACL_FIELDS = ('resource_type', 'resource_name', 'pattern_type', 'principal', 'host', 'operation', 'permission')
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_snapshots = {}
+_connect_snapshots = {}
+_snapshot_lock = threading.Lock()
+_load_locks = {}
+
+
+def acl_key(acl):
+    """
+    Build a hashable key for an ACL binding so it can be looked up in the snapshot.
+
+    Parameters:
+    - acl (dict): Dictionary with the ACL_FIELDS of an ACL binding.
+
+    Returns:
+    tuple: The normalised values of the ACL_FIELDS.
+    """
+    return tuple(str(acl[field]) if field in ('resource_name', 'principal', 'host') else str(acl[field]).upper()
+                 for field in ACL_FIELDS)
+
+
+class ClusterSnapshot:
+    """
+    In-memory index of the topics, topic configs and ACLs of a Kafka cluster.
+
+    The snapshot is fetched with three list calls to the REST Proxy instead of one GET per resource.
+    Writes made by the pipeline are recorded on the snapshot so later checks in the same run see them,
+    and refresh() re-reads the whole cluster when an exact view is needed.
+    """
+
+    def __init__(self, session, rest_proxy_url, cluster_id):
+        self.session = session
+        self.base_url = f'{rest_proxy_url}/v3/clusters/{cluster_id}'
+        self.topics = {}
+        self.configs = {}
+        self.acls = set()
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def _list(self, url):
+        items = []
+        while url:
+            response = self.session.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"Listing {url} returned {response.status_code} - {response.text}")
+            body = response.json()
+            items.extend(body.get('data', []))
+            url = (body.get('metadata') or {}).get('next')
+        return items
+
+    def refresh(self):
+        """
+        Fetch the topic list, every topic config and the ACL list and rebuild the index.
+        """
+        topics = self._list(f'{self.base_url}/topics')
+        configs = self._list(f'{self.base_url}/topics/-/configs')
+        acls = self._list(f'{self.base_url}/acls')
+
+        with self._lock:
+            self.topics = {topic['topic_name']: topic for topic in topics}
+            self.configs = {}
+            for config in configs:
+                self.configs.setdefault(config['topic_name'], {})[config['name']] = config.get('value')
+            self.acls = {acl_key(acl) for acl in acls}
+            self.loaded = True
+        logger.info(f"Loaded a snapshot of {len(self.topics)} topic(s) and {len(self.acls)} acl(s)")
+        return self
+
+    def has_topic(self, topic_name):
+        with self._lock:
+            return topic_name in self.topics
+
+    def get_topic(self, topic_name):
+        """
+        Return the REST Proxy definition of a topic, or None if it does not exist.
+        """
+        with self._lock:
+            return self.topics.get(topic_name)
+
+    def topic_configs(self, topic_name):
+        """
+        Return the current configs of a topic as a {config_name: value} dictionary.
+        """
+        with self._lock:
+            return dict(self.configs.get(topic_name, {}))
+
+    def has_acl(self, acl):
+        with self._lock:
+            return acl_key(acl) in self.acls
+
+    def topic_names(self):
+        with self._lock:
+            return set(self.topics)
+
+    def acl_keys(self):
+        with self._lock:
+            return set(self.acls)
+
+    def fingerprint(self, topic_names=(), acls=()):
+        """
+        Hash the current state of the given topics and ACLs.
+
+        Only the resources a change set touches are hashed, so changes made to unrelated resources do not
+        alter the fingerprint.
+
+        Parameters:
+        - topic_names (iterable of str): The topics to include, whether they exist or not.
+        - acls (iterable of dicts): The ACL bindings to include, whether they exist or not.
+
+        Returns:
+        str: The sha256 hex digest of the state.
+        """
+        with self._lock:
+            topics = {}
+            for topic_name in sorted(set(topic_names)):
+                topic = self.topics.get(topic_name)
+                topics[topic_name] = None if topic is None else {
+                    'partitions_count': topic.get('partitions_count'),
+                    'replication_factor': topic.get('replication_factor'),
+                    'configs': self.configs.get(topic_name, {}),
+                }
+            acl_state = sorted([list(key), key in self.acls] for key in {acl_key(acl) for acl in acls})
+        state = json.dumps({'topics': topics, 'acls': acl_state}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(state.encode('utf-8')).hexdigest()
+
+    def record_topic(self, topic):
+        """
+        Record a topic created by the pipeline.
+
+        Parameters:
+        - topic (dict): The topic definition that was sent to the REST Proxy.
+        """
+        with self._lock:
+            self.topics[topic['topic_name']] = {
+                'topic_name': topic['topic_name'],
+                'partitions_count': int(topic['partitions_count']),
+                'replication_factor': topic.get('replication_factor'),
+            }
+            self.configs[topic['topic_name']] = {config['name']: str(config['value']) for config in topic.get('configs', [])}
+
+    def record_partitions(self, topic_name, partitions_count):
+        with self._lock:
+            if topic_name in self.topics:
+                self.topics[topic_name] = dict(self.topics[topic_name], partitions_count=int(partitions_count))
+
+    def record_configs(self, topic_name, configs):
+        """
+        Record configs altered by the pipeline.
+
+        Parameters:
+        - topic_name (str): The name of the topic.
+        - configs (list of dicts): The configs that were altered. Configs with a DELETE operation are removed.
+        """
+        with self._lock:
+            current = self.configs.setdefault(topic_name, {})
+            for config in configs:
+                if config.get('operation', 'SET').upper() == 'DELETE':
+                    current.pop(config['name'], None)
+                else:
+                    current[config['name']] = str(config['value'])
+
+    def forget_topic(self, topic_name):
+        with self._lock:
+            self.topics.pop(topic_name, None)
+            self.configs.pop(topic_name, None)
+
+    def record_acl(self, acl):
+        with self._lock:
+            self.acls.add(acl_key(acl))
+
+    def forget_acl(self, acl):
+        with self._lock:
+            self.acls.discard(acl_key(acl))
+
+
+def connect_value(value):
+    """
+    Serialize a connector config value the way Connect reports it: strings as is, anything else as json,
+    e.g. true as 'true' rather than 'True'.
+    """
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def connector_differences(desired, live):
+    """
+    Compare a rendered connector config with the config Connect reports for it.
+
+    Connect reports every config value as a string and adds the connector name to the config, so desired values
+    are serialized with connect_value and the name is only compared if the desired config sets it.
+
+    Returns:
+    list: The sorted names of the configs that differ. The list is empty if the configs match.
+    """
+    desired = {key: connect_value(value) for key, value in desired.items()}
+    live = {key: connect_value(value) for key, value in live.items() if key != 'name' or 'name' in desired}
+    return sorted(key for key in desired.keys() | live.keys() if desired.get(key) != live.get(key))
+
+
+class ConnectSnapshot:
+    """
+    In-memory index of the connectors of a Connect cluster, with their configs and statuses.
+
+    The snapshot is fetched with a single GET /connectors?expand=info&expand=status call instead of one GET
+    per connector. Writes made by the pipeline are recorded on it.
+    """
+
+    def __init__(self, session, connect_rest_url):
+        self.session = session
+        self.url = f'{connect_rest_url}/connectors'
+        self.configs = {}
+        self.statuses = {}
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """
+        Fetch the config and status of every connector and rebuild the index.
+        """
+        response = self.session.get(self.url, params={'expand': ['info', 'status']})
+        if response.status_code != 200:
+            raise RuntimeError(f"Listing {self.url} returned {response.status_code} - {response.text}")
+        connectors = response.json()
+        with self._lock:
+            self.configs = {name: connector.get('info', {}).get('config', {}) for name, connector in connectors.items()}
+            self.statuses = {name: connector.get('status') for name, connector in connectors.items()}
+        logger.info(f"Loaded a snapshot of {len(self.configs)} connector(s)")
+        return self
+
+    def connector_configs(self):
+        """
+        Return the config of every connector as a {connector_name: config} dictionary.
+        """
+        with self._lock:
+            return dict(self.configs)
+
+    def get_config(self, connector_name):
+        """
+        Return the live config of a connector, or None if it is not deployed.
+        """
+        with self._lock:
+            return self.configs.get(connector_name)
+
+    def get_status(self, connector_name):
+        with self._lock:
+            return self.statuses.get(connector_name)
+
+    def record_config(self, connector_name, config):
+        with self._lock:
+            self.configs[connector_name] = {key: connect_value(value) for key, value in config.items()}
+            self.statuses.pop(connector_name, None)
+
+    def forget_connector(self, connector_name):
+        with self._lock:
+            self.configs.pop(connector_name, None)
+            self.statuses.pop(connector_name, None)
+
+
+def load_lock(kind, target_name):
+    """
+    Return the lock that guards loading one kind of snapshot of one target, so the snapshots of different
+    targets are loaded concurrently while each one is still loaded only once.
+    """
+    with _snapshot_lock:
+        return _load_locks.setdefault((kind, target_name), threading.Lock())
+
+
+def get_cluster_snapshot():
+    """
+    Return the snapshot of the current cluster target, loading it on first use.
+
+    Returns:
+    ClusterSnapshot: The shared snapshot of the target for this run.
+    """
+    target = current_target()
+    with load_lock('cluster', target.name):
+        if target.name not in _snapshots:
+            _snapshots[target.name] = ClusterSnapshot(rest_proxy_session(), target.rest_url, target.cluster_id).refresh()
+        return _snapshots[target.name]
+
+
+def get_connect_snapshot():
+    """
+    Return the snapshot of the Connect cluster of the current cluster target, loading it on first use.
+
+    Returns:
+    ConnectSnapshot: The shared connector snapshot of the target for this run.
+    """
+    target = current_target()
+    with load_lock('connect', target.name):
+        if target.name not in _connect_snapshots:
+            _connect_snapshots[target.name] = ConnectSnapshot(connect_session(), target.connect_rest_url).refresh()
+        return _connect_snapshots[target.name]
+
+
+def refresh_cluster_snapshot():
+    """
+    Re-read the shared snapshot from the cluster if REFRESH_SNAPSHOT_AFTER_WRITES is enabled. The connector
+    snapshot is only re-read if it was loaded.
+    """
+    if REFRESH_SNAPSHOT_AFTER_WRITES:
+        get_cluster_snapshot().refresh()
+        with _snapshot_lock:
+            connect_snapshot = _connect_snapshots.get(current_target().name)
+        if connect_snapshot is not None:
+            connect_snapshot.refresh()
@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from apply_engine import MAX_WORKERS
+
+import json
+import logging
+import os
+import string
+
+# Constant variables
+CLUSTER_INVENTORY = os.getenv('CLUSTER_INVENTORY', 'clusters.json')
+REST_PROXY_URL = os.getenv('REST_URL')
+CLUSTER_ID = os.getenv('KAFKA_CLUSTER_ID')
+CONNECT_REST_URL = os.getenv('CONNECT_REST_URL')
+ENV = os.getenv('ENV')
+REST_BASIC_AUTH_USER = os.getenv('REST_BASIC_AUTH_USER')
+REST_BASIC_AUTH_PASS = os.getenv('REST_BASIC_AUTH_PASS')
+CONNECT_BASIC_AUTH_USER = os.getenv('CONNECT_BASIC_AUTH_USER')
+CONNECT_BASIC_AUTH_PASS = os.getenv('CONNECT_BASIC_AUTH_PASS')
+BOOTSTRAP_URL = os.getenv('BOOTSTRAP_URL')
+CLIENT_PROPERTIES = os.getenv('CLIENT_PROPERTIES')
+ADMIN_CLIENT_CONFIG = os.getenv('ADMIN_CLIENT_CONFIG')
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_current_target = ContextVar('cluster_target', default=None)
+_default_target = None
+
+
+@dataclass(frozen=True)
+class ClusterTarget:
+    """
+    A Kafka cluster the pipeline deploys to, with its REST Proxy, Connect and CLI settings.
+
+    Attributes:
+    - name (str): Unique name of the target, e.g. 'prd-us-east'. It names the target's HTTP sessions, cluster
+      snapshot, resource cache entries and changelog records.
+    - env (str): The environment whose files are deployed to the target, e.g. 'prd'.
+    - rest_url (str): The base URL of the REST Proxy.
+    - cluster_id (str): The Kafka cluster id.
+    - connect_rest_url (str): The base URL of the Connect REST API.
+    - rest_auth (tuple): Basic auth (user, password) for the REST Proxy, or None.
+    - connect_auth (tuple): Basic auth (user, password) for Connect, or None.
+    - bootstrap_url (str): The bootstrap servers used by kafka-configs.
+    - client_properties (str): The client properties file used by kafka-configs.
+    - admin_client_config (str): Optional client properties file for the Kafka Admin client.
+    - max_workers (int): The maximum number of concurrent operations on the target.
+    - pool_size (int): The number of HTTP connections kept open per host, or None for HTTP_POOL_SIZE.
+    """
+    name: str
+    env: str
+    rest_url: str
+    cluster_id: str
+    connect_rest_url: str = None
+    rest_auth: tuple = None
+    connect_auth: tuple = None
+    bootstrap_url: str = None
+    client_properties: str = None
+    admin_client_config: str = None
+    max_workers: int = MAX_WORKERS
+    pool_size: int = None
+
+
+def default_target():
+    """
+    Return the target configured through the REST_URL, KAFKA_CLUSTER_ID, CONNECT_REST_URL and ENV variables,
+    used whenever no other target is active.
+    """
+    global _default_target
+    if _default_target is None:
+        _default_target = ClusterTarget(
+            name=ENV or 'default',
+            env=ENV,
+            rest_url=REST_PROXY_URL,
+            cluster_id=CLUSTER_ID,
+            connect_rest_url=CONNECT_REST_URL,
+            rest_auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS),
+            connect_auth=(CONNECT_BASIC_AUTH_USER, CONNECT_BASIC_AUTH_PASS),
+            bootstrap_url=BOOTSTRAP_URL,
+            client_properties=CLIENT_PROPERTIES,
+            admin_client_config=ADMIN_CLIENT_CONFIG,
+        )
+    return _default_target
+
+
+def current_target():
+    """
+    Return the target of the calling thread, see use_target.
+    """
+    return _current_target.get() or default_target()
+
+
+@contextmanager
+def use_target(target):
+    """
+    Make target the current target of the calling thread for the body of a with statement.
+
+    Worker threads do not inherit it; apply_engine runs each operation in a copy of the submitting context.
+    """
+    token = _current_target.set(target)
+    try:
+        yield target
+    finally:
+        _current_target.reset(token)
+
+
+def load_inventory(path=CLUSTER_INVENTORY):
+    """
+    Read the cluster inventory.
+
+    The file is a json object with a "clusters" list, one object per target with the ClusterTarget attributes.
+    ${VARIABLE} references are substituted from the environment, so credentials stay out of the file.
+
+    Example:
+        {"clusters": [{"name": "prd-us-east", "env": "prd", "rest_url": "https://rest.us-east:8082",
+                       "cluster_id": "lkc-123", "connect_rest_url": "https://connect.us-east:8083",
+                       "rest_auth": ["${PRD_REST_USER}", "${PRD_REST_PASS}"], "max_workers": 16}]}
+
+    Returns:
+    list: ClusterTarget objects in the order of the file.
+
+    Raises:
+    ValueError: If a target is missing a required attribute, has an unknown one, or two targets share a name.
+    """
+    with open(path, 'r') as inventory_file:
+        inventory = json.loads(string.Template(inventory_file.read()).substitute(**os.environ))
+    targets = []
+    for cluster in inventory.get('clusters', []):
+        for auth in ('rest_auth', 'connect_auth'):
+            if cluster.get(auth) is not None:
+                cluster[auth] = tuple(cluster[auth])
+        try:
+            targets.append(ClusterTarget(**cluster))
+        except TypeError as e:
+            raise ValueError(f"Invalid cluster {cluster.get('name')} in {path} - {e}")
+    names = [target.name for target in targets]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"The cluster names {', '.join(duplicates)} are used more than once in {path}")
+    return targets
+
+
+def select_targets(targets, names=None, envs=None):
+    """
+    Filter the inventory by target names and environments. Empty filters select every target.
+
+    Raises:
+    ValueError: If a requested name is not in the inventory.
+    """
+    known = {target.name for target in targets}
+    unknown = sorted(set(names or ()) - known)
+    if unknown:
+        raise ValueError(f"The clusters {', '.join(unknown)} are not in the inventory")
+    return [target for target in targets
+            if (not names or target.name in names) and (not envs or target.env in envs)]
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from apply_engine import FAILED, MAX_WORKERS, SUCCEEDED, Outcome
+from cluster_targets import current_target
+from metrics import get_metrics
+from rest_client import connect_session
+
+import logging
+import os
+import requests
+import time
+
+# Constant variables
+CONNECTOR_WAIT_TIMEOUT = float(os.getenv('CONNECTOR_WAIT_TIMEOUT', '300'))
+CONNECTOR_POLL_INTERVAL = float(os.getenv('CONNECTOR_POLL_INTERVAL', '1'))
+CONNECTOR_MAX_POLL_INTERVAL = float(os.getenv('CONNECTOR_MAX_POLL_INTERVAL', '15'))
+RESTART_FAILED_TASKS = os.getenv('RESTART_FAILED_TASKS', 'false').lower() == 'true'
+MAX_TASK_RESTARTS = int(os.getenv('MAX_TASK_RESTARTS', '1'))
+
+RUNNING = 'RUNNING'
+PAUSED = 'PAUSED'
+CONNECTOR_FAILED = 'FAILED'
+RESTARTED = 'RESTARTED'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def connector_state(status):
+    """
+    Reduce a Connect status response to the state of the connector as a whole.
+
+    Parameters:
+    - status (dict): The body of GET /connectors/{name}/status.
+
+    Returns:
+    tuple: (state, failed_task_ids). The state is RUNNING once the connector and all of its tasks run, PAUSED
+    if the connector is paused, FAILED if the connector or any task failed, and otherwise the state Connect
+    reports while it is still starting, e.g. UNASSIGNED. A running connector without tasks is still starting.
+    """
+    state = status.get('connector', {}).get('state', 'UNASSIGNED')
+    tasks = status.get('tasks', [])
+    failed_tasks = [task['id'] for task in tasks if task.get('state') == CONNECTOR_FAILED]
+    if state == CONNECTOR_FAILED or failed_tasks:
+        return CONNECTOR_FAILED, failed_tasks
+    if state == PAUSED:
+        return PAUSED, []
+    starting = [task.get('state', 'UNASSIGNED') for task in tasks if task.get('state') != RUNNING]
+    if state == RUNNING and (starting or not tasks):
+        return (starting[0] if starting else 'UNASSIGNED'), []
+    return state, []
+
+
+def restart_task(connector_name, task_id):
+    """
+    Restart one task of a connector.
+
+    Returns:
+    bool: True if Connect accepted the restart.
+    """
+    url = f"{current_target().connect_rest_url}/connectors/{connector_name}/tasks/{task_id}/restart"
+    response = connect_session().post(url)
+    if response.status_code in (200, 202, 204):
+        logger.info(f"Restarted the failed task {task_id} of the connector {connector_name}")
+        return True
+    logger.error(f"Restarting the task {task_id} of the connector {connector_name} returned {response.status_code} - {response.text}")
+    return False
+
+
+def check_connector(connector_name, restarts, restart_failed_tasks=RESTART_FAILED_TASKS, max_task_restarts=MAX_TASK_RESTARTS):
+    """
+    Fetch the status of a connector once, and restart its failed tasks if that is enabled and they have not
+    been restarted max_task_restarts times yet.
+
+    Parameters:
+    - connector_name (str): The connector to check.
+    - restarts (dict): {task_id: number of restarts} of the connector, updated in place.
+    - restart_failed_tasks (bool): Restart failed tasks instead of reporting the connector as failed.
+    - max_task_restarts (int): The number of times a task may be restarted.
+
+    Returns:
+    tuple: (state, detail) where state is one of the connector_state states or RESTARTED.
+    """
+    url = f"{current_target().connect_rest_url}/connectors/{connector_name}/status"
+    try:
+        response = connect_session().get(url)
+    except requests.exceptions.RequestException as e:
+        return 'UNKNOWN', f"the status could not be read - {e}"
+    if response.status_code == 404:
+        # A connector that was just created may not be registered by the worker yet
+        return 'UNASSIGNED', "not registered yet"
+    if response.status_code != 200:
+        return 'UNKNOWN', f"{response.status_code} - {response.text}"
+
+    try:
+        status = response.json()
+    except ValueError as e:
+        return 'UNKNOWN', f"the status is not valid json - {e}"
+    state, failed_tasks = connector_state(status)
+    if state != CONNECTOR_FAILED:
+        return state, state
+    if restart_failed_tasks and failed_tasks and all(restarts.get(task_id, 0) < max_task_restarts for task_id in failed_tasks):
+        for task_id in failed_tasks:
+            restarts[task_id] = restarts.get(task_id, 0) + 1
+            if not restart_task(connector_name, task_id):
+                return CONNECTOR_FAILED, f"task {task_id} failed and could not be restarted"
+        return RESTARTED, f"restarted the failed task(s) {', '.join(str(task_id) for task_id in failed_tasks)}"
+    if not failed_tasks:
+        return CONNECTOR_FAILED, f"connector failed - {first_line(status['connector'].get('trace'))}"
+    traces = {task['id']: first_line(task.get('trace')) for task in status['tasks'] if task['id'] in failed_tasks}
+    return CONNECTOR_FAILED, '; '.join(f"task {task_id} failed - {trace}" for task_id, trace in traces.items())
+
+
+def first_line(trace):
+    """
+    Return the first line of a Connect stack trace, which holds the exception and its message.
+    """
+    return (trace or 'no trace').strip().split('\n')[0]
+
+
+def deployed_connectors(outcomes):
+    """
+    Return the names of the connectors that were deployed successfully, in the order of the outcomes.
+    """
+    return [outcome.resource_id for outcome in outcomes
+            if outcome.resource_type == 'connector' and outcome.action == 'deploy' and outcome.status == SUCCEEDED]
+
+
+def wait_for_connectors(connector_names, timeout=CONNECTOR_WAIT_TIMEOUT, poll_interval=CONNECTOR_POLL_INTERVAL,
+                        max_poll_interval=CONNECTOR_MAX_POLL_INTERVAL, restart_failed_tasks=RESTART_FAILED_TASKS,
+                        max_task_restarts=MAX_TASK_RESTARTS, max_workers=MAX_WORKERS):
+    """
+    Wait until every connector and its tasks are RUNNING on the Connect cluster of the current target.
+
+    The connectors are polled in rounds. Every round fetches the status of all pending connectors concurrently,
+    then sleeps once for all of them. The sleep starts at poll_interval and doubles every round up to
+    max_poll_interval, and goes back to poll_interval after a task is restarted. The whole wait ends at the
+    timeout, so waiting for many connectors takes about as long as waiting for the slowest one.
+
+    Parameters:
+    - connector_names (list of str): The connectors to wait for.
+    - timeout (float): The overall deadline in seconds.
+    - poll_interval (float): The first pause between two rounds in seconds.
+    - max_poll_interval (float): The longest pause between two rounds in seconds.
+    - restart_failed_tasks (bool): Restart failed tasks up to max_task_restarts times before giving up on them.
+    - max_task_restarts (int): The number of times a task may be restarted.
+    - max_workers (int): The maximum number of concurrent status requests.
+
+    Returns:
+    list: One 'wait' Outcome per connector, in the order of connector_names. It succeeds with the time to
+    RUNNING (or PAUSED) in its detail, and fails if the connector failed or did not converge before the timeout.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    pending = {connector_name: {} for connector_name in dict.fromkeys(connector_names)}
+    last_states = {}
+    results = {}
+    interval = poll_interval
+    logger.info(f"Waiting up to {timeout:g}s for {len(pending)} connector(s) to reach RUNNING")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        while pending:
+            names = sorted(pending)
+            # Each status request runs in a copy of the caller's context, so it uses the caller's cluster target
+            futures = [executor.submit(copy_context().run, check_connector, connector_name, pending[connector_name],
+                                       restart_failed_tasks, max_task_restarts) for connector_name in names]
+            restarted = False
+            for connector_name, future in zip(names, futures):
+                state, detail = future.result()
+                elapsed = time.monotonic() - started
+                if state in (RUNNING, PAUSED):
+                    logger.info(f"The connector {connector_name} is {state} after {elapsed:.1f}s")
+                    get_metrics().observe('connector', f'time to {state}', elapsed)
+                    results[connector_name] = Outcome('connector', connector_name, 'wait', SUCCEEDED,
+                                                      f"{state} after {elapsed:.1f}s")
+                    del pending[connector_name]
+                elif state == CONNECTOR_FAILED:
+                    logger.error(f"The connector {connector_name} failed after {elapsed:.1f}s - {detail}")
+                    get_metrics().observe('connector', 'time to FAILED', elapsed, error=True)
+                    results[connector_name] = Outcome('connector', connector_name, 'wait', FAILED, detail)
+                    del pending[connector_name]
+                else:
+                    restarted = restarted or state == RESTARTED
+                    last_states[connector_name] = detail
+
+            remaining = deadline - time.monotonic()
+            if pending and remaining <= 0:
+                for connector_name in pending:
+                    logger.error(f"The connector {connector_name} is not RUNNING after {timeout:g}s")
+                    results[connector_name] = Outcome('connector', connector_name, 'wait', FAILED,
+                                                      f"not RUNNING after {timeout:g}s, last seen {last_states[connector_name]}")
+                break
+            if pending:
+                if restarted:
+                    interval = poll_interval
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, max_poll_interval)
+    return [results[connector_name] for connector_name in dict.fromkeys(connector_names)]
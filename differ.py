@@ -0,0 +1,187 @@
+from dataclasses import dataclass
+from resource_stream import NEW, REMOVED, canonical_json, diff_resource_streams, resource_hash
+
+import logging
+
+# Change kinds
+PARTITION_INCREASE = 'partition_increase'
+PARTITION_DECREASE = 'partition_decrease'
+REPLICATION_CHANGE = 'replication_change'
+CONFIG_SET = 'config_set'
+CONFIG_DELETE = 'config_delete'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TopicChange:
+    """
+    A single change to an existing topic.
+
+    Attributes:
+    - topic_name (str): The name of the topic.
+    - kind (str): One of PARTITION_INCREASE, PARTITION_DECREASE, REPLICATION_CHANGE, CONFIG_SET or CONFIG_DELETE.
+    - name (str): The config name for config changes, otherwise the changed field.
+    - old_value: The value before the change, or None for a newly set config.
+    - new_value: The value after the change, or None for a deleted config.
+    """
+    topic_name: str
+    kind: str
+    name: str
+    old_value: object = None
+    new_value: object = None
+
+    def to_config(self):
+        """
+        Return the config entry sent to the REST Proxy configs:alter endpoint for a config change.
+        """
+        if self.kind == CONFIG_DELETE:
+            return {"name": self.name, "operation": "DELETE"}
+        return {"name": self.name, "value": self.new_value}
+
+
+def index_resources(resources):
+    """
+    Merge the list of single key dictionaries used by the topics and acls files into one dictionary.
+
+    Parameters:
+    - resources (list of dicts): e.g. [{"topic_a": {...}}, {"topic_b": {...}}]
+
+    Returns:
+    dict: {resource_id: definition}
+    """
+    index = {}
+    for value in resources:
+        index.update(value)
+    return index
+
+
+def normalise_topic(topic):
+    """
+    Normalise a topic definition so it can be compared by key.
+
+    Parameters:
+    - topic (dict): A topic definition with partitions_count, replication_factor and a list of configs.
+
+    Returns:
+    tuple: (partitions_count, replication_factor, {config_name: value})
+    """
+    partitions_count = topic.get('partitions_count')
+    partitions_count = int(partitions_count) if partitions_count not in (None, '') else None
+    configs = {config['name']: config.get('value') for config in topic.get('configs', [])}
+    return partitions_count, topic.get('replication_factor'), configs
+
+
+def diff_topic(topic_name, source_topic, feature_topic):
+    """
+    Compare two definitions of the same topic.
+
+    Parameters:
+    - topic_name (str): The name of the topic.
+    - source_topic (dict): The definition before the change.
+    - feature_topic (dict): The definition after the change.
+
+    Returns:
+    list: A list of TopicChange records. The list is empty if the definitions are equivalent.
+    """
+    source_partitions, source_replication, source_configs = normalise_topic(source_topic)
+    feature_partitions, feature_replication, feature_configs = normalise_topic(feature_topic)
+
+    changes = []
+    if feature_partitions is not None and source_partitions != feature_partitions:
+        kind = PARTITION_DECREASE if source_partitions is not None and feature_partitions < source_partitions else PARTITION_INCREASE
+        changes.append(TopicChange(topic_name, kind, 'partitions_count', source_partitions, feature_partitions))
+
+    if str(source_replication) != str(feature_replication):
+        changes.append(TopicChange(topic_name, REPLICATION_CHANGE, 'replication_factor', source_replication, feature_replication))
+
+    for name, value in feature_configs.items():
+        if name not in source_configs or source_configs[name] != value:
+            changes.append(TopicChange(topic_name, CONFIG_SET, name, source_configs.get(name), value))
+
+    for name, value in source_configs.items():
+        if name not in feature_configs:
+            changes.append(TopicChange(topic_name, CONFIG_DELETE, name, value, None))
+    return changes
+
+
+def is_applied(topic_name, feature_topic, applied_hashes, feature_hashes):
+    # Hash each new or changed definition once, to check it against the cache and to record it after the apply
+    feature_hashes[topic_name] = resource_hash(feature_topic)
+    return bool(applied_hashes) and applied_hashes.get(topic_name) == feature_hashes[topic_name]
+
+
+def diff_topics(source_topics, feature_topics, applied_hashes=None, feature_hashes=None):
+    """
+    Compare two sets of topics by name.
+
+    Definitions are compared by their canonical json first, and only topics whose definition moved are diffed
+    config by config. Topics whose definition hash matches applied_hashes were already applied by an earlier
+    run and are left out.
+
+    Parameters:
+    - source_topics (dict): {topic_name: definition} before the change.
+    - feature_topics (dict): {topic_name: definition} after the change.
+    - applied_hashes (dict): Optional {topic_name: hash} of the definitions last applied successfully.
+    - feature_hashes (dict): Optional dictionary filled with {topic_name: hash} for every new or changed topic.
+
+    Returns:
+    tuple: (new, removed, changed)
+        - new: {topic_name: definition} of topics only in feature_topics.
+        - removed: {topic_name: definition} of topics only in source_topics.
+        - changed: {topic_name: list of TopicChange} of topics whose definition changed.
+    """
+    if feature_hashes is None:
+        feature_hashes = {}
+    new = {}
+    removed = {}
+    changed = {}
+    for topic_name, source_topic in source_topics.items():
+        feature_topic = feature_topics.get(topic_name)
+        if feature_topic is None:
+            removed[topic_name] = source_topic
+            continue
+        if canonical_json(source_topic) == canonical_json(feature_topic) or is_applied(topic_name, feature_topic, applied_hashes, feature_hashes):
+            continue
+        changes = diff_topic(topic_name, source_topic, feature_topic)
+        if changes:
+            changed[topic_name] = changes
+
+    for topic_name, feature_topic in feature_topics.items():
+        if topic_name not in source_topics and not is_applied(topic_name, feature_topic, applied_hashes, feature_hashes):
+            new[topic_name] = feature_topic
+    return new, removed, changed
+
+
+def diff_topic_streams(source_pairs, feature_pairs, applied_hashes=None, feature_hashes=None):
+    """
+    Compare two streams of topics by name with bounded memory.
+
+    Parameters:
+    - source_pairs (iterator): (topic_name, definition) tuples before the change, e.g. from resource_stream.iter_resources.
+    - feature_pairs (iterator): (topic_name, definition) tuples after the change.
+    - applied_hashes (dict): Optional {topic_name: hash} of the definitions last applied successfully.
+    - feature_hashes (dict): Optional dictionary filled with {topic_name: hash} for every new or changed topic.
+
+    Returns:
+    tuple: (new, removed, changed) in the same format as diff_topics.
+    """
+    if feature_hashes is None:
+        feature_hashes = {}
+    new = {}
+    removed = {}
+    changed = {}
+    for change_type, topic_name, source_topic, feature_topic in diff_resource_streams(source_pairs, feature_pairs):
+        if change_type != REMOVED and is_applied(topic_name, feature_topic, applied_hashes, feature_hashes):
+            continue
+        if change_type == NEW:
+            new[topic_name] = feature_topic
+        elif change_type == REMOVED:
+            removed[topic_name] = source_topic
+        else:
+            changes = diff_topic(topic_name, source_topic, feature_topic)
+            if changes:
+                changed[topic_name] = changes
+    return new, removed, changed
@@ -0,0 +1,332 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+# Constant variables
+DEFAULT_CLUSTER_ID = 'fake-cluster'
+DEFAULT_PAGE_SIZE = 1000
+ACL_FIELDS = ('resource_type', 'resource_name', 'pattern_type', 'principal', 'host', 'operation', 'permission')
+# ACL fields whose values are enums, which the REST Proxy accepts in any case
+ACL_ENUM_FIELDS = ('resource_type', 'pattern_type', 'operation', 'permission')
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def binding_key(acl):
+    """
+    Identify an ACL binding the way the broker does. Kept independent of cluster_state.acl_key, so the pipeline
+    is checked against the server's behaviour rather than its own.
+    """
+    return tuple(str(acl[field]).upper() if field in ACL_ENUM_FIELDS else str(acl[field]) for field in ACL_FIELDS)
+
+
+class FakeCluster:
+    """
+    In-memory stand-in for the REST Proxy v3 and Kafka Connect endpoints the pipeline calls.
+
+    Every request is counted per route. Each request can be delayed by latency seconds (plus up to jitter seconds),
+    and a share of the writes, given by error_rate, fails with error_status so retries and failure handling can
+    be exercised. A deployed connector reports UNASSIGNED until connector_startup seconds after its last PUT or
+    task restart, and the connectors in failed_tasks report a FAILED task until it is restarted.
+
+    Attributes:
+    - cluster_id (str): The cluster id served under /v3/clusters/{cluster_id}.
+    - topics (dict): {topic_name: topic} in the REST Proxy format.
+    - configs (dict): {topic_name: {config_name: value}} with every value as a string.
+    - acls (dict): {binding_key: acl} in the REST Proxy format.
+    - connectors (dict): {connector_name: config}.
+    - failed_tasks (set): The names of the connectors whose task 0 fails.
+    - request_counts (dict): {(method, route): count}.
+    """
+
+    def __init__(self, cluster_id=DEFAULT_CLUSTER_ID, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                 page_size=DEFAULT_PAGE_SIZE, connector_startup=0.0, seed=None):
+        self.cluster_id = cluster_id
+        self.base_url = ''
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.connector_startup = connector_startup
+        self.topics = {}
+        self.configs = {}
+        self.acls = {}
+        self.connectors = {}
+        self.failed_tasks = set()
+        self.request_counts = {}
+        self._started_at = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        prefix = re.escape(f'/v3/clusters/{cluster_id}')
+        self._routes = [
+            ('GET', re.compile(prefix + r'/topics/?$'), 'topics', self.list_topics),
+            ('POST', re.compile(prefix + r'/topics/?$'), 'topics', self.create_topic),
+            ('GET', re.compile(prefix + r'/topics/-/configs$'), 'topic configs', self.list_configs),
+            ('POST', re.compile(prefix + r'/topics/(?P<name>[^/]+)/configs:alter$'), 'configs:alter', self.alter_configs),
+            ('GET', re.compile(prefix + r'/topics/(?P<name>[^/]+)$'), 'topic', self.get_topic),
+            ('PATCH', re.compile(prefix + r'/topics/(?P<name>[^/]+)$'), 'topic', self.update_topic),
+            ('DELETE', re.compile(prefix + r'/topics/(?P<name>[^/]+)$'), 'topic', self.delete_topic),
+            ('GET', re.compile(prefix + r'/acls/?$'), 'acls', self.list_acls),
+            ('POST', re.compile(prefix + r'/acls/?$'), 'acls', self.create_acl),
+            ('POST', re.compile(prefix + r'/acls:batch$'), 'acls:batch', self.create_acl_batch),
+            ('DELETE', re.compile(prefix + r'/acls/?$'), 'acls', self.delete_acls),
+            ('GET', re.compile(r'/connectors/?$'), 'connectors', self.list_connectors),
+            ('PUT', re.compile(r'/connectors/(?P<name>[^/]+)/config$'), 'connector config', self.put_connector),
+            ('GET', re.compile(r'/connectors/(?P<name>[^/]+)/status$'), 'connector status', self.get_connector_status),
+            ('POST', re.compile(r'/connectors/(?P<name>[^/]+)/tasks/(?P<task_id>[0-9]+)/restart$'), 'task restart',
+             self.restart_task),
+            ('DELETE', re.compile(r'/connectors/(?P<name>[^/]+)$'), 'connector', self.delete_connector),
+        ]
+
+    def load(self, topics=(), acls=(), connectors=None):
+        """
+        Seed the cluster with existing resources.
+
+        Parameters:
+        - topics (iterable of dicts): Topic definitions in the format of the topics files.
+        - acls (iterable of dicts): ACLs in the format of the acls files.
+        - connectors (dict): {connector_name: config}.
+        """
+        with self._lock:
+            for topic in topics:
+                self._add_topic(topic)
+            for acl in acls:
+                self.acls[binding_key(acl)] = dict(acl)
+            self.connectors.update(connectors or {})
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.request_counts.values())
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts = {}
+
+    def handle(self, method, path, query, body):
+        """
+        Serve one request.
+
+        Returns:
+        tuple: (status_code, response body or None)
+        """
+        for route_method, pattern, route_name, handler in self._routes:
+            if route_method != method:
+                continue
+            match = pattern.match(path)
+            if not match:
+                continue
+            with self._lock:
+                self.request_counts[(method, route_name)] = self.request_counts.get((method, route_name), 0) + 1
+                failed = method != 'GET' and self.error_rate and self._random.random() < self.error_rate
+                delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+            if delay:
+                time.sleep(delay)
+            if failed:
+                return self.error_status, {'error_code': self.error_status, 'message': 'injected error'}
+            with self._lock:
+                return handler(query=query, body=body, **match.groupdict())
+        with self._lock:
+            self.request_counts[(method, 'unknown')] = self.request_counts.get((method, 'unknown'), 0) + 1
+        return 404, {'error_code': 404, 'message': f'{method} {path} is not served by the fake cluster'}
+
+    def _add_topic(self, topic):
+        self.topics[topic['topic_name']] = {
+            'topic_name': topic['topic_name'],
+            'partitions_count': int(topic['partitions_count']),
+            'replication_factor': int(topic.get('replication_factor') or 1),
+        }
+        self.configs[topic['topic_name']] = {config['name']: str(config['value']) for config in topic.get('configs', [])}
+
+    def _page(self, items, query, path):
+        offset = int(query.get('offset', ['0'])[0])
+        page = items[offset:offset + self.page_size]
+        next_url = None
+        if offset + self.page_size < len(items):
+            next_url = f"{self.base_url}/v3/clusters/{self.cluster_id}/{path}?offset={offset + self.page_size}"
+        return 200, {'data': page, 'metadata': {'next': next_url}}
+
+    def list_topics(self, query, body):
+        return self._page(list(self.topics.values()), query, 'topics')
+
+    def create_topic(self, query, body):
+        topic = json.loads(body)
+        if topic['topic_name'] in self.topics:
+            return 400, {'error_code': 40002, 'message': f"Topic '{topic['topic_name']}' already exists."}
+        self._add_topic(topic)
+        return 201, self.topics[topic['topic_name']]
+
+    def get_topic(self, query, body, name):
+        if name not in self.topics:
+            return 404, {'error_code': 40403, 'message': 'This server does not host this topic-partition.'}
+        return 200, self.topics[name]
+
+    def update_topic(self, query, body, name):
+        if name not in self.topics:
+            return 404, {'error_code': 40403, 'message': 'This server does not host this topic-partition.'}
+        partitions_count = int(json.loads(body)['partitions_count'])
+        if partitions_count < self.topics[name]['partitions_count']:
+            return 400, {'error_code': 40002, 'message': 'Topic currently has more partitions than requested.'}
+        self.topics[name]['partitions_count'] = partitions_count
+        return 200, self.topics[name]
+
+    def delete_topic(self, query, body, name):
+        if self.topics.pop(name, None) is None:
+            return 404, {'error_code': 40403, 'message': 'This server does not host this topic-partition.'}
+        self.configs.pop(name, None)
+        return 204, None
+
+    def list_configs(self, query, body):
+        configs = [{'topic_name': topic_name, 'name': name, 'value': value}
+                   for topic_name, topic_configs in self.configs.items() for name, value in topic_configs.items()]
+        return self._page(configs, query, 'topics/-/configs')
+
+    def alter_configs(self, query, body, name):
+        if name not in self.topics:
+            return 404, {'error_code': 40403, 'message': 'This server does not host this topic-partition.'}
+        for config in json.loads(body)['data']:
+            if config.get('operation', 'SET').upper() == 'DELETE':
+                self.configs[name].pop(config['name'], None)
+            else:
+                self.configs[name][config['name']] = str(config['value'])
+        return 204, None
+
+    def list_acls(self, query, body):
+        return self._page(list(self.acls.values()), query, 'acls')
+
+    def create_acl(self, query, body):
+        acl = json.loads(body)
+        self.acls[binding_key(acl)] = acl
+        return 201, None
+
+    def create_acl_batch(self, query, body):
+        for acl in json.loads(body)['data']:
+            self.acls[binding_key(acl)] = acl
+        return 204, None
+
+    def delete_acls(self, query, body):
+        # Fields missing from the filter match anything, like the ANY value
+        acl_filter = binding_key({field: query[field][0] if field in query else 'ANY' for field in ACL_FIELDS})
+        deleted = [acl for key, acl in self.acls.items()
+                   if all(value == 'ANY' or value == field_value for value, field_value in zip(acl_filter, key))]
+        for acl in deleted:
+            del self.acls[binding_key(acl)]
+        return 200, {'data': deleted}
+
+    def list_connectors(self, query, body):
+        expand = query.get('expand', [])
+        if not expand:
+            return 200, sorted(self.connectors)
+        connectors = {}
+        for name, config in self.connectors.items():
+            connector = {}
+            if 'info' in expand:
+                connector['info'] = {'name': name, 'config': dict(config, name=name), 'tasks': [], 'type': 'source'}
+            if 'status' in expand:
+                connector['status'] = self._connector_status(name)
+            connectors[name] = connector
+        return 200, connectors
+
+    def put_connector(self, query, body, name):
+        created = name not in self.connectors
+        self.connectors[name] = json.loads(body)
+        self._started_at[name] = time.monotonic()
+        return (201 if created else 200), {'name': name, 'config': self.connectors[name], 'tasks': []}
+
+    def delete_connector(self, query, body, name):
+        if self.connectors.pop(name, None) is None:
+            return 404, {'error_code': 404, 'message': f'Connector {name} not found'}
+        self._started_at.pop(name, None)
+        return 204, None
+
+    def _connector_status(self, name):
+        started_at = self._started_at.get(name)
+        if started_at is not None and time.monotonic() - started_at < self.connector_startup:
+            return {'name': name, 'connector': {'state': 'UNASSIGNED', 'worker_id': 'fake:8083'}, 'tasks': []}
+        task = {'id': 0, 'state': 'RUNNING', 'worker_id': 'fake:8083'}
+        if name in self.failed_tasks:
+            task.update(state='FAILED', trace='org.apache.kafka.connect.errors.ConnectException: injected failure')
+        return {'name': name, 'connector': {'state': 'RUNNING', 'worker_id': 'fake:8083'}, 'tasks': [task]}
+
+    def get_connector_status(self, query, body, name):
+        if name not in self.connectors:
+            return 404, {'error_code': 404, 'message': f'No status found for connector {name}'}
+        return 200, self._connector_status(name)
+
+    def restart_task(self, query, body, name, task_id):
+        if name not in self.connectors or task_id != '0':
+            return 404, {'error_code': 404, 'message': f'Unknown task {name}-{task_id}'}
+        self.failed_tasks.discard(name)
+        self._started_at[name] = time.monotonic()
+        return 204, None
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _serve(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        status, payload = self.server.cluster.handle(self.command, url.path, query, body)
+        content = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeClusterServer:
+    """
+    Serve a FakeCluster over HTTP on a local port from a background thread.
+
+    The same server answers both the REST Proxy and the Connect paths, so REST_URL and CONNECT_REST_URL can both
+    point to its url.
+    """
+
+    def __init__(self, cluster=None, host='127.0.0.1', port=0):
+        self.cluster = cluster or FakeCluster()
+        self._server = ThreadingHTTPServer((host, port), FakeRequestHandler)
+        self._server.daemon_threads = True
+        self._server.cluster = self.cluster
+        self.cluster.base_url = self.url
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Serving the fake cluster {self.cluster.cluster_id} on {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from subprocess import PIPE
+from metrics import get_metrics
+
+import logging
+import subprocess
+
+# Change statuses, named like the GitHub pull request files API
+ADDED = 'added'
+MODIFIED = 'modified'
+REMOVED = 'removed'
+RENAMED = 'renamed'
+
+# git diff --name-status letters mapped to the statuses above
+GIT_STATUSES = {'A': ADDED, 'M': MODIFIED, 'D': REMOVED, 'R': RENAMED, 'C': ADDED, 'T': MODIFIED}
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FileChange:
+    """
+    A file changed between two revisions.
+
+    Attributes:
+    - path (str): The path of the file after the change.
+    - status (str): One of ADDED, MODIFIED, REMOVED or RENAMED.
+    - previous_path (str): The path before the change for renamed files, otherwise None.
+    """
+    path: str
+    status: str
+    previous_path: str = None
+
+
+def changes_from_pull_request(pull_request):
+    """
+    List the files changed by a pull request from its aggregated file list.
+
+    The list is paginated by the GitHub client, so this costs one API call per 30 files instead of one per commit.
+
+    Parameters:
+    - pull_request (github.PullRequest): The pull request.
+
+    Returns:
+    list: FileChange records in the order GitHub returns them.
+    """
+    changes = []
+    with get_metrics().timed('github', 'pull request files'):
+        for file in pull_request.get_files():
+            status = file.status if file.status in (ADDED, REMOVED, RENAMED) else MODIFIED
+            previous_path = file.previous_filename if status == RENAMED else None
+            changes.append(FileChange(file.filename, status, previous_path))
+    return changes
+
+
+def parse_name_status(output):
+    """
+    Parse the output of git diff --name-status.
+
+    Parameters:
+    - output (str): One "<status>\t<path>" line per file, or "<status>\t<old path>\t<new path>" for renames and copies.
+
+    Returns:
+    list: FileChange records.
+    """
+    changes = []
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        fields = line.split('\t')
+        status = GIT_STATUSES.get(fields[0][:1])
+        if status is None:
+            logger.warning(f"Ignoring the unsupported git diff status {fields[0]} for {fields[-1]}")
+            continue
+        if fields[0][:1] in ('R', 'C'):
+            previous_path = fields[1] if status == RENAMED else None
+            changes.append(FileChange(fields[2], status, previous_path))
+        else:
+            changes.append(FileChange(fields[1], status))
+    return changes
+
+
+def changes_from_git_diff(base, head, repo_dir='.', merge_base=True):
+    """
+    List the files changed on head since it branched off base with a local git diff.
+
+    Parameters:
+    - base (str): The base revision.
+    - head (str): The head revision.
+    - repo_dir (str): The repository to run git in.
+    - merge_base (bool): Diff against the merge base of base and head (base...head) instead of base itself.
+
+    Returns:
+    list: FileChange records.
+
+    Raises:
+    RuntimeError: If git diff fails, e.g. because a revision is not available locally.
+    """
+    revisions = [f'{base}...{head}'] if merge_base else [base, head]
+    with get_metrics().timed('git', 'diff --name-status') as timer:
+        result = subprocess.run(['git', 'diff', '--name-status', '-M', *revisions],
+                                cwd=repo_dir, stdout=PIPE, stderr=PIPE, text=True)
+        timer.bytes_received = len(result.stdout)
+        timer.error = result.returncode != 0
+    if result.returncode != 0:
+        raise RuntimeError(f"git diff {' '.join(revisions)} failed - {result.stderr.strip()}")
+    return parse_name_status(result.stdout)
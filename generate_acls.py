@@ -1,42 +1,92 @@
+from resource_stream import write_json
+
 import pandas as pd
-import json
+import logging
 import click
 
 
-@click.command()
-@click.argument('acl_path')
-@click.argument('env')
-def main(acl_path, env):
-    df = pd.read_csv(f'{acl_path}/acl_configs_{env}.csv')
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ACL_FIELDS = ('resource_type', 'resource_name', 'pattern_type', 'principal', 'host', 'operation', 'permission')
+
+
+def validate_acls(df):
+    """
+    Validate every ACL at once with column masks. Every ACL field is required.
+
+    Parameters:
+    - df (DataFrame): The rows of acl_configs_{env}.csv.
+
+    Returns:
+    list: One error message per missing cell. The list is empty if every ACL is valid.
+    """
+    errors = []
+    for field in ACL_FIELDS:
+        if field not in df.columns:
+            errors.append(f"The column {field} is missing")
+            continue
+        for index in df.index[df[field].isna()]:
+            # The csv line number, counting the header as line 1
+            errors.append(f"Line {index + 2}: The {field} is missing")
+    return errors
+
 
-    acl_list = []
+def build_acls(df):
+    """
+    Build the content of acls_{env}.json from the validated ACL configs.
 
-    # Add document link to the future topic configs
+    Parameters:
+    - df (DataFrame): The rows of acl_configs_{env}.csv.
 
-    for index, row in df.iterrows():
-        acl_id = f"{row['principal']}-{row['resource_name']}-{row['operation']}"
-        topic_dict = {
-            f"{acl_id}":
-                {
-                        "resource_type": row['resource_type'],
-                        "resource_name": row['resource_name'],
-                        "pattern_type": row['pattern_type'],
-                        "principal": row['principal'],
-                        "host": row['host'],
-                        "operation": row['operation'],
-                        "permission": row['permission']
-                }
+    Returns:
+    list: One single key dictionary per ACL, keyed by principal-resource_name-operation.
+    """
+    acl_ids = (df['principal'].astype(str) + '-' + df['resource_name'].astype(str) + '-' + df['operation'].astype(str)).tolist()
+    records = df[list(ACL_FIELDS)].astype(str).to_dict('records')
+    return [{f"{acl_id}": record} for acl_id, record in zip(acl_ids, records)]
 
-            }
-        acl_list.append(topic_dict)
 
-    json_output = json.dumps(acl_list, indent=4)
+def generate_acls(acl_path, env, stream=False):
+    """
+    Generate acls_{env}.json from acl_configs_{env}.csv.
 
-    print(json_output)
+    Parameters:
+    - acl_path (str): The path of the application's acls folder.
+    - env (str): The environment, e.g. dev.
+    - stream (bool): Stream the json output to the file instead of returning it.
+
+    Returns:
+    str: The generated json, or None when it was streamed.
+
+    Raises:
+    ValueError: If any ACL is invalid. The message lists every invalid row.
+    """
+    df = pd.read_csv(f'{acl_path}/acl_configs_{env}.csv')
+
+    errors = validate_acls(df)
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    return write_json(build_acls(df), f'{acl_path}/acls_{env}.json', stream)
+
+
+@click.command()
+@click.argument('acl_path')
+@click.argument('env')
+@click.option('--stream', is_flag=True, help='Stream the json to the output file instead of printing it.')
+def main(acl_path, env, stream):
+    try:
+        json_output = generate_acls(acl_path, env, stream)
+    except ValueError as error:
+        for message in str(error).splitlines():
+            logger.error(message)
+        exit(1)
 
-    with open(f'{acl_path}/acls_{env}.json', 'w') as json_file:
-        json_file.write(json_output)
+    if json_output is not None:
+        print(json_output)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
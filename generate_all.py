@@ -0,0 +1,120 @@
+from concurrent.futures import ProcessPoolExecutor
+from generate_acls import generate_acls
+from generate_topics import generate_topics
+
+import click
+import glob
+import hashlib
+import json
+import logging
+import os
+
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = '.generate_cache.json'
+TOPIC_CONFIGS_PATTERN = os.path.join('*', 'topics', 'topic_configs_*.csv')
+ACL_CONFIGS_PATTERN = os.path.join('*', 'acls', 'acl_configs_*.csv')
+
+
+def discover_inputs(root, envs=()):
+    """
+    Find every topic and acl configs csv under the application folders.
+
+    Parameters:
+    - root (str): The repository root.
+    - envs (tuple of str): Only return the configs of these environments. All environments if empty.
+
+    Returns:
+    list: (kind, csv_path, output_path, folder, env) tuples, where kind is 'topics' or 'acls'.
+    """
+    inputs = []
+    for kind, pattern, prefix in (('topics', TOPIC_CONFIGS_PATTERN, 'topic_configs_'),
+                                  ('acls', ACL_CONFIGS_PATTERN, 'acl_configs_')):
+        for csv_path in sorted(glob.glob(os.path.join(root, pattern))):
+            folder = os.path.dirname(csv_path)
+            env = os.path.basename(csv_path)[len(prefix):-len('.csv')]
+            if envs and env not in envs:
+                continue
+            inputs.append((kind, csv_path, os.path.join(folder, f'{kind}_{env}.json'), folder, env))
+    return inputs
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r') as cache_file:
+            return json.load(cache_file)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return {}
+
+
+def save_cache(path, cache):
+    with open(path, 'w') as cache_file:
+        json.dump(cache, cache_file, indent=4, sort_keys=True)
+
+
+def generate_one(kind, folder, env):
+    """
+    Generate one json file. Runs in a worker process.
+
+    Returns:
+    str: An error message, or None if the file was generated.
+    """
+    generate = generate_topics if kind == 'topics' else generate_acls
+    try:
+        generate(folder, env, stream=True)
+    except ValueError as error:
+        return str(error)
+    except Exception as error:
+        return f"{type(error).__name__}: {error}"
+    return None
+
+
+@click.command()
+@click.option('--root', default='.', help='The repository root containing the application folders.')
+@click.option('--env', 'envs', multiple=True, help='Only regenerate this environment. Can be repeated.')
+@click.option('--workers', default=os.cpu_count(), type=int, help='The number of worker processes.')
+@click.option('--force', is_flag=True, help='Regenerate every file even if its configs did not change.')
+def main(root, envs, workers, force):
+    cache_path = os.path.join(root, CACHE_FILE)
+    cache = {} if force else load_cache(cache_path)
+
+    pending = []
+    for kind, csv_path, output_path, folder, env in discover_inputs(root, envs):
+        key = os.path.relpath(csv_path, root)
+        content_hash = hash_file(csv_path)
+        if cache.get(key) == content_hash and os.path.exists(output_path):
+            logger.info(f"Skipping {key} because it has not changed since the last run")
+            continue
+        pending.append((key, content_hash, kind, folder, env))
+
+    failed = False
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(key, content_hash, executor.submit(generate_one, kind, folder, env))
+                   for key, content_hash, kind, folder, env in pending]
+        for key, content_hash, future in futures:
+            error = future.result()
+            if error:
+                failed = True
+                cache.pop(key, None)
+                for message in error.splitlines():
+                    logger.error(f"{key}: {message}")
+            else:
+                cache[key] = content_hash
+                logger.info(f"Generated the json for {key}")
+
+    save_cache(cache_path, cache)
+    logger.info(f"Regenerated {len(pending)} file(s)")
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
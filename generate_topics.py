@@ -1,81 +1,160 @@
+from policy import VALID_CLEANUP_POLICY_TYPES, VALID_COMPRESSION_TYPES
+from resource_stream import write_json
+
 import pandas as pd
-import json
 import logging
 import click
 
 
-@click.command()
-@click.argument('topic_path')
-@click.argument('env')
-def main(topic_path, env):
-    df = pd.read_csv(f'{topic_path}/topic_configs_{env}.csv')
-
-    topics_list = []
-
-
-    # Set up logging
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-
-    # Add document link to the future topic configs
-
-    for index, row in df.iterrows():
-        topic_name = row['topic name']
-
-        # Set defaults for topic configs
-        cleanup_policy = 'delete' if str(row['cleanup.policy']) == "nan" else str(row['cleanup.policy'])
-        partitions_count = '4' if str(row['partition count']) == "nan" else str(int(row['partition count']))
-        compression_type = 'producer' if str(row['compression.type']) == "nan" else str(row['compression.type'])
-        retention_ms = 86400000 if str(row['retention.ms']) == "nan" else int(row['retention.ms'])
-        max_message_bytes = 1048588 if str(row['max.message.bytes']) == "nan" else int(row['max.message.bytes'])
-
-        # Topic Validation Logic
-        valid_compression_types = ("uncompressed", "zstd", "lz4", "snappy", "gzip", "producer")
-        valid_cleanup_policy_types = ('compact', 'delete', 'compact,delete')
-        # cleanup_policy = 'DELETE' if str(row['cleanup.policy']) in ("DELETE") else str(row['cleanup.policy'])
-
-        if not str(row['compression.type']) in valid_compression_types:
-            logger.error(f"Compression type is invalid. Should be one of {valid_compression_types}")
-            exit(1)
-
-        if not str(row['cleanup.policy']) in valid_cleanup_policy_types:
-            logger.error(f"Cleanup Policy type is invalid. Should be one of {valid_cleanup_policy_types}")
-            exit(1)
-
-        topic_dict = {
-            f"{topic_name}" : {
-            "topic_name": row['topic name'],
-            "partitions_count": partitions_count,
-            "replication_factor": 1,
-            "configs": [
-                {
-                    "name": "cleanup.policy",
-                    "value": cleanup_policy
-                },
-                {
-                    "name": "compression.type",
-                    "value": compression_type
-                },
-                {
-                    "name": "retention.ms",
-                    "value": retention_ms
-                },
-                {
-                    "name": "max.message.bytes",
-                    "value": max_message_bytes
-                }
-            ]
-          }
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defaults for topic configs
+DEFAULT_CLEANUP_POLICY = 'delete'
+DEFAULT_PARTITIONS_COUNT = 4
+DEFAULT_COMPRESSION_TYPE = 'producer'
+DEFAULT_RETENTION_MS = 86400000
+DEFAULT_MAX_MESSAGE_BYTES = 1048588
+
+
+def apply_defaults(df):
+    """
+    Fill the empty cells of the topic configs with their defaults, one column at a time.
+
+    Parameters:
+    - df (DataFrame): The rows of topic_configs_{env}.csv.
+
+    Returns:
+    DataFrame: A copy of df with defaults applied and numeric columns converted. Cells that are not valid
+    numbers are left as NaN so validate_topics can report them.
+    """
+    df = df.copy()
+    df['cleanup.policy'] = df['cleanup.policy'].fillna(DEFAULT_CLEANUP_POLICY).astype(str)
+    df['compression.type'] = df['compression.type'].fillna(DEFAULT_COMPRESSION_TYPE).astype(str)
+    for column, default in (('partition count', DEFAULT_PARTITIONS_COUNT),
+                            ('retention.ms', DEFAULT_RETENTION_MS),
+                            ('max.message.bytes', DEFAULT_MAX_MESSAGE_BYTES)):
+        numbers = pd.to_numeric(df[column], errors='coerce')
+        df[column] = numbers.where(df[column].notna(), default)
+    return df
+
+
+def validate_topics(df):
+    """
+    Validate every topic at once with column masks.
+
+    Parameters:
+    - df (DataFrame): The topic configs with defaults applied.
+
+    Returns:
+    list: One error message per invalid cell. The list is empty if every topic is valid.
+    """
+    checks = (
+        (df['topic name'].isna(), "The topic name is missing"),
+        (~df['compression.type'].isin(VALID_COMPRESSION_TYPES),
+         f"Compression type is invalid. Should be one of {VALID_COMPRESSION_TYPES}"),
+        (~df['cleanup.policy'].isin(VALID_CLEANUP_POLICY_TYPES),
+         f"Cleanup Policy type is invalid. Should be one of {VALID_CLEANUP_POLICY_TYPES}"),
+        (df['partition count'].isna(), "The partition count is not a number"),
+        (df['retention.ms'].isna(), "The retention.ms is not a number"),
+        (df['max.message.bytes'].isna(), "The max.message.bytes is not a number"),
+    )
+    errors = []
+    for mask, message in checks:
+        for index in df.index[mask]:
+            errors.append((index, message))
+    # Report by csv line number, counting the header as line 1
+    return [f"Line {index + 2} ({df.at[index, 'topic name']}): {message}" for index, message in sorted(errors, key=lambda error: error[0])]
+
+
+def build_topics(df):
+    """
+    Build the content of topics_{env}.json from the validated topic configs.
+
+    Parameters:
+    - df (DataFrame): The topic configs with defaults applied.
+
+    Returns:
+    list: One single key dictionary per topic.
+    """
+    columns = zip(
+        df['topic name'].tolist(),
+        df['partition count'].astype('int64').astype(str).tolist(),
+        df['cleanup.policy'].tolist(),
+        df['compression.type'].tolist(),
+        df['retention.ms'].astype('int64').tolist(),
+        df['max.message.bytes'].astype('int64').tolist(),
+    )
+    return [
+        {
+            f"{topic_name}": {
+                "topic_name": topic_name,
+                "partitions_count": partitions_count,
+                "replication_factor": 1,
+                "configs": [
+                    {
+                        "name": "cleanup.policy",
+                        "value": cleanup_policy
+                    },
+                    {
+                        "name": "compression.type",
+                        "value": compression_type
+                    },
+                    {
+                        "name": "retention.ms",
+                        "value": retention_ms
+                    },
+                    {
+                        "name": "max.message.bytes",
+                        "value": max_message_bytes
+                    }
+                ]
+            }
         }
-        topics_list.append(topic_dict)
+        for topic_name, partitions_count, cleanup_policy, compression_type, retention_ms, max_message_bytes in columns
+    ]
+
+
+def generate_topics(topic_path, env, stream=False):
+    """
+    Generate topics_{env}.json from topic_configs_{env}.csv.
+
+    Parameters:
+    - topic_path (str): The path of the application's topics folder.
+    - env (str): The environment, e.g. dev.
+    - stream (bool): Stream the json output to the file instead of returning it.
 
-    json_output = json.dumps(topics_list, indent=4)
+    Returns:
+    str: The generated json, or None when it was streamed.
 
-    print(json_output)
+    Raises:
+    ValueError: If any topic is invalid. The message lists every invalid row.
+    """
+    df = apply_defaults(pd.read_csv(f'{topic_path}/topic_configs_{env}.csv'))
+
+    errors = validate_topics(df)
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    return write_json(build_topics(df), f'{topic_path}/topics_{env}.json', stream)
+
+
+@click.command()
+@click.argument('topic_path')
+@click.argument('env')
+@click.option('--stream', is_flag=True, help='Stream the json to the output file instead of printing it.')
+def main(topic_path, env, stream):
+    try:
+        json_output = generate_topics(topic_path, env, stream)
+    except ValueError as error:
+        for message in str(error).splitlines():
+            logger.error(message)
+        exit(1)
 
-    with open(f'{topic_path}/topics_{env}.json', 'w') as json_file:
-        json_file.write(json_output)
+    if json_output is not None:
+        print(json_output)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,145 @@
+from subprocess import PIPE
+from metrics import get_metrics
+from resource_stream import CHUNK_SIZE, STREAMING_THRESHOLD_BYTES
+
+import logging
+import subprocess
+import tempfile
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class GitBlobReader:
+    """
+    Read file contents at any revision from a single long running `git cat-file --batch` process.
+
+    Every read is a request/response on the process pipes, so reading many files at two revisions costs
+    one process spawn instead of one per file. Reads are serialised with a lock, so one reader can be shared
+    between threads.
+    """
+
+    def __init__(self, repo_dir='.'):
+        self.repo_dir = repo_dir
+        self._process = None
+        self._check_process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(['git', 'cat-file', '--batch'], stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                                             cwd=self.repo_dir)
+        return self._process
+
+    def _request(self, revision, path):
+        """
+        Ask the process for a file and read the header of the response.
+
+        Returns:
+        tuple: (object_type, size), or None if the file does not exist at that revision.
+        """
+        process = self._start()
+        process.stdin.write(f"{revision}:{path}\n".encode('utf-8'))
+        process.stdin.flush()
+
+        header = process.stdout.readline().decode('utf-8').rstrip('\n')
+        parts = header.split(' ')
+        if len(parts) != 3:
+            # "<object> missing" or "<object> ambiguous"
+            logger.info(f"{path} does not exist at {revision}")
+            return None
+        return parts[1], int(parts[2])
+
+    def read(self, revision, path):
+        """
+        Read a file as it was at the given revision.
+
+        Parameters:
+        - revision (str): Any git revision, e.g. HEAD, HEAD~1 or a commit SHA.
+        - path (str): The path of the file relative to the repository root.
+
+        Returns:
+        bytes: The file content, or None if the file does not exist at that revision.
+        """
+        with self._lock, get_metrics().timed('git', 'cat-file') as timer:
+            response = self._request(revision, path)
+            if response is None:
+                return None
+            object_type, size = response
+            content = self._start().stdout.read(size)
+            timer.bytes_received = size
+            # Every object is followed by a newline
+            self._start().stdout.read(1)
+            if object_type != 'blob':
+                logger.error(f"{path} at {revision} is a {object_type}, not a file")
+                return None
+            return content
+
+    def open(self, revision, path, max_size=STREAMING_THRESHOLD_BYTES):
+        """
+        Open a file as it was at the given revision without holding all of it in memory.
+
+        The content is copied from the process in chunks into a spooled temporary file, which stays in memory
+        up to max_size bytes and moves to disk beyond that.
+
+        Returns:
+        file object: The content opened in binary mode at its start, or None if the file does not exist at
+        that revision. The caller closes it.
+        """
+        with self._lock, get_metrics().timed('git', 'cat-file') as timer:
+            response = self._request(revision, path)
+            if response is None:
+                return None
+            object_type, size = response
+            stdout = self._start().stdout
+            content = tempfile.SpooledTemporaryFile(max_size=max_size)
+            remaining = size
+            while remaining:
+                chunk = stdout.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    content.close()
+                    raise RuntimeError(f"git cat-file ended while reading {path} at {revision}")
+                content.write(chunk)
+                remaining -= len(chunk)
+            timer.bytes_received = size
+            stdout.read(1)
+            if object_type != 'blob':
+                content.close()
+                logger.error(f"{path} at {revision} is a {object_type}, not a file")
+                return None
+            content.seek(0)
+            return content
+
+    def blob_sha(self, revision, path):
+        """
+        Return the blob SHA of a file at the given revision, or None if the file does not exist at that revision.
+
+        Only the object header is read, from a second `git cat-file --batch-check` process.
+        """
+        with self._lock, get_metrics().timed('git', 'cat-file --batch-check'):
+            if self._check_process is None or self._check_process.poll() is not None:
+                self._check_process = subprocess.Popen(['git', 'cat-file', '--batch-check'], stdin=PIPE, stdout=PIPE,
+                                                       stderr=PIPE, cwd=self.repo_dir)
+            self._check_process.stdin.write(f"{revision}:{path}\n".encode('utf-8'))
+            self._check_process.stdin.flush()
+            parts = self._check_process.stdout.readline().decode('utf-8').rstrip('\n').split(' ')
+            if len(parts) != 3 or parts[1] != 'blob':
+                return None
+            return parts[0]
+
+    def close(self):
+        with self._lock:
+            for process in (self._process, self._check_process):
+                if process is not None:
+                    process.stdin.close()
+                    process.wait()
+            self._process = None
+            self._check_process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,190 @@
+from metrics import get_metrics
+from cluster_targets import current_target
+
+import logging
+import os
+import threading
+
+try:
+    from confluent_kafka import KafkaException
+    from confluent_kafka.admin import (AclBinding, AclBindingFilter, AclOperation, AclPermissionType, AdminClient,
+                                       AlterConfigOpType, ConfigEntry, ConfigResource, ResourcePatternType, ResourceType,
+                                       ScramCredentialInfo, ScramMechanism, UserScramCredentialUpsertion)
+except ImportError:
+    AdminClient = None
+
+# Constant variables
+ADMIN_REQUEST_TIMEOUT = float(os.getenv('ADMIN_REQUEST_TIMEOUT', '60'))
+# The number of iterations kafka-configs uses for SCRAM credentials
+SCRAM_ITERATIONS = int(os.getenv('SCRAM_ITERATIONS', '4096'))
+# The REST Proxy names the cluster resource CLUSTER, librdkafka names it BROKER
+ADMIN_RESOURCE_TYPES = {'CLUSTER': 'BROKER'}
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_admin_clients = {}
+_admin_client_lock = threading.Lock()
+
+
+def admin_available():
+    """
+    Return True if the Kafka Admin client can be used, i.e. confluent-kafka is installed and the current cluster
+    target has an admin client config (ADMIN_CLIENT_CONFIG for the default target).
+    """
+    return AdminClient is not None and bool(current_target().admin_client_config)
+
+
+def read_client_config(path):
+    """
+    Read a librdkafka client properties file, e.g. bootstrap.servers=broker:9092, into a dict.
+    """
+    config = {}
+    with open(path, 'r') as config_file:
+        for line in config_file:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            name, value = line.split('=', 1)
+            config[name.strip()] = value.strip()
+    return config
+
+
+def get_admin_client():
+    """
+    Return the shared Admin client of the current cluster target, creating it from its config on first use.
+
+    Raises:
+    RuntimeError: If the Admin client is not available.
+    """
+    if not admin_available():
+        raise RuntimeError("The Kafka Admin client requires confluent-kafka and ADMIN_CLIENT_CONFIG")
+    config_path = current_target().admin_client_config
+    with _admin_client_lock:
+        if config_path not in _admin_clients:
+            _admin_clients[config_path] = AdminClient(read_client_config(config_path))
+        return _admin_clients[config_path]
+
+
+def incremental_alter_topic_configs(configs_by_topic, timeout=ADMIN_REQUEST_TIMEOUT):
+    """
+    Alter the configs of many topics with a single incrementalAlterConfigs request.
+
+    Parameters:
+    - configs_by_topic (dict): {topic_name: list of config dicts}, each with a 'name' and either a 'value'
+      or a DELETE 'operation', as sent to the REST Proxy configs:alter endpoint.
+    - timeout (float): The request timeout in seconds.
+
+    Returns:
+    dict: {topic_name: error} where error is None if the configs of the topic were altered.
+    """
+    resources = {}
+    for topic_name, configs in configs_by_topic.items():
+        entries = []
+        for config in configs:
+            if config.get('operation', 'SET').upper() == 'DELETE':
+                entries.append(ConfigEntry(config['name'], None, incremental_operation=AlterConfigOpType.DELETE))
+            else:
+                entries.append(ConfigEntry(config['name'], str(config['value']), incremental_operation=AlterConfigOpType.SET))
+        resources[topic_name] = ConfigResource(ResourceType.TOPIC, topic_name, incremental_configs=entries)
+
+    with get_metrics().timed('admin', 'incrementalAlterConfigs') as timer:
+        futures = get_admin_client().incremental_alter_configs(list(resources.values()), request_timeout=timeout)
+        errors = {}
+        for topic_name, resource in resources.items():
+            try:
+                futures[resource].result()
+                errors[topic_name] = None
+            except KafkaException as e:
+                errors[topic_name] = str(e.args[0]) if e.args else str(e)
+        timer.error = any(errors.values())
+    return errors
+
+
+def acl_binding_args(acl):
+    """
+    Convert an ACL in the REST Proxy format, as used in the acls files, to AclBinding arguments.
+    """
+    resource_type = str(acl['resource_type']).upper()
+    return (ResourceType[ADMIN_RESOURCE_TYPES.get(resource_type, resource_type)], acl['resource_name'],
+            ResourcePatternType[str(acl['pattern_type']).upper()], acl['principal'], acl['host'],
+            AclOperation[str(acl['operation']).upper()], AclPermissionType[str(acl['permission']).upper()])
+
+
+def acl_results(futures, requests):
+    errors = []
+    for request in requests:
+        try:
+            futures[request].result()
+            errors.append(None)
+        except KafkaException as e:
+            errors.append(str(e.args[0]) if e.args else str(e))
+    return errors
+
+
+def create_acls(acls, timeout=ADMIN_REQUEST_TIMEOUT):
+    """
+    Create many ACL bindings with a single createAcls request.
+
+    Parameters:
+    - acls (list of dicts): The ACLs in the REST Proxy format.
+    - timeout (float): The request timeout in seconds.
+
+    Returns:
+    list: One error per ACL, in the same order. The error is None if the ACL was created.
+    """
+    bindings = [AclBinding(*acl_binding_args(acl)) for acl in acls]
+    with get_metrics().timed('admin', 'createAcls') as timer:
+        errors = acl_results(get_admin_client().create_acls(bindings, request_timeout=timeout), bindings)
+        timer.error = any(errors)
+    return errors
+
+
+def delete_acls(acls, timeout=ADMIN_REQUEST_TIMEOUT):
+    """
+    Delete many ACL bindings with a single deleteAcls request.
+
+    Each ACL is sent as an exact filter, so only the binding itself is deleted.
+
+    Parameters:
+    - acls (list of dicts): The ACLs in the REST Proxy format.
+    - timeout (float): The request timeout in seconds.
+
+    Returns:
+    list: One error per ACL, in the same order. The error is None if the filter was applied.
+    """
+    filters = [AclBindingFilter(*acl_binding_args(acl)) for acl in acls]
+    with get_metrics().timed('admin', 'deleteAcls') as timer:
+        errors = acl_results(get_admin_client().delete_acls(filters, request_timeout=timeout), filters)
+        timer.error = any(errors)
+    return errors
+
+
+def alter_user_scram_credentials(passwords_by_user, iterations=SCRAM_ITERATIONS, timeout=ADMIN_REQUEST_TIMEOUT):
+    """
+    Create or update the SCRAM-SHA-256 and SCRAM-SHA-512 credentials of many users with a single
+    alterUserScramCredentials request.
+
+    Parameters:
+    - passwords_by_user (dict): {user_principal: password}, without the User: prefix.
+    - iterations (int): The number of SCRAM iterations.
+    - timeout (float): The request timeout in seconds.
+
+    Returns:
+    dict: {user_principal: error} where error is None if the credentials of the user were stored.
+    """
+    alterations = [UserScramCredentialUpsertion(user_principal, ScramCredentialInfo(mechanism, iterations), password.encode('utf-8'))
+                   for user_principal, password in passwords_by_user.items()
+                   for mechanism in (ScramMechanism.SCRAM_SHA_256, ScramMechanism.SCRAM_SHA_512)]
+    with get_metrics().timed('admin', 'alterUserScramCredentials') as timer:
+        futures = get_admin_client().alter_user_scram_credentials(alterations, request_timeout=timeout)
+        errors = {}
+        for user_principal in passwords_by_user:
+            try:
+                futures[user_principal].result()
+                errors[user_principal] = None
+            except KafkaException as e:
+                errors[user_principal] = str(e.args[0]) if e.args else str(e)
+        timer.error = any(errors.values())
+    return errors
@@ -0,0 +1,244 @@
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+# Constant variables
+METRICS_PATH = os.getenv('METRICS_PATH')
+METRICS_FORMAT = os.getenv('METRICS_FORMAT', 'prometheus')
+METRICS_PREFIX = 'kafkamanager'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Path segments following these ones are resource names, replaced by a placeholder in HTTP call names
+NAMED_SEGMENTS = {'clusters': '{cluster_id}', 'topics': '{topic_name}', 'connectors': '{connector_name}',
+                  'brokers': '{broker_id}', 'consumer-groups': '{group_id}', 'tasks': '{task_id}'}
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class CallStats:
+    """
+    Counts, latency histogram and bytes of one kind of call.
+
+    Attributes:
+    - count (int): The number of calls.
+    - errors (int): The number of calls that raised or returned an error.
+    - seconds (float): The total duration of the calls.
+    - buckets (list of int): The number of calls per LATENCY_BUCKETS upper bound, not cumulative. The last
+      entry counts the calls slower than every bound.
+    - bytes_sent (int): The bytes sent, e.g. HTTP request bodies.
+    - bytes_received (int): The bytes received, e.g. HTTP response bodies or file contents.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def add(self, seconds, bytes_sent, bytes_received, error):
+        self.count += 1
+        self.errors += bool(error)
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+
+    def quantile(self, q):
+        """
+        Estimate a latency quantile from the histogram as the upper bound of the bucket that contains it.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+class Timer:
+    """
+    Handle yielded by Metrics.timed so the caller can report the bytes and the result of the call.
+    """
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = False
+
+
+class Metrics:
+    """
+    Thread-safe registry of the external calls and pipeline stages of a run.
+
+    Calls are keyed by kind, e.g. 'http', 'github', 'git', 'subprocess', 'admin' or 'stage', and by a low
+    cardinality name such as 'rest_proxy POST /v3/clusters/{cluster_id}/topics'.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, name, seconds, bytes_sent=0, bytes_received=0, error=False):
+        with self._lock:
+            stats = self._stats.get((kind, name))
+            if stats is None:
+                stats = self._stats[(kind, name)] = CallStats()
+            stats.add(seconds, bytes_sent, bytes_received, error)
+
+    @contextmanager
+    def timed(self, kind, name):
+        """
+        Time the body of a with statement. Exceptions are counted as errors and re-raised.
+
+        Example:
+            with get_metrics().timed('git', 'cat-file') as timer:
+                content = read()
+                timer.bytes_received = len(content)
+        """
+        timer = Timer()
+        started = time.monotonic()
+        try:
+            yield timer
+        except BaseException:
+            timer.error = True
+            raise
+        finally:
+            self.observe(kind, name, time.monotonic() - started, timer.bytes_sent, timer.bytes_received, timer.error)
+
+    def snapshot(self):
+        """
+        Return a copy of the statistics as {(kind, name): CallStats}.
+        """
+        with self._lock:
+            copies = {}
+            for key, stats in self._stats.items():
+                copy = CallStats()
+                copy.__dict__.update(stats.__dict__, buckets=list(stats.buckets))
+                copies[key] = copy
+            return copies
+
+    def summary(self):
+        """
+        Render the statistics as a table sorted by total time, slowest first.
+        """
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1].seconds, reverse=True)
+        width = max([len(name) for (_, name), _ in rows] + [4])
+        lines = [f"{'kind':<10} {'name':<{width}} {'count':>7} {'errors':>7} {'total s':>9} {'p50 s':>7} {'p95 s':>7} "
+                 f"{'max s':>7} {'sent KiB':>9} {'recv KiB':>9}"]
+        for (kind, name), stats in rows:
+            lines.append(f"{kind:<10} {name:<{width}} {stats.count:>7} {stats.errors:>7} {stats.seconds:>9.3f} "
+                         f"{stats.quantile(0.5):>7.3f} {stats.quantile(0.95):>7.3f} {stats.max_seconds:>7.3f} "
+                         f"{stats.bytes_sent / 1024:>9.1f} {stats.bytes_received / 1024:>9.1f}")
+        return "\n".join(lines)
+
+    def log_summary(self):
+        if self._stats:
+            logger.info("Calls and stages of this run:\n" + self.summary())
+
+    def render(self, metrics_format=METRICS_FORMAT):
+        """
+        Render the statistics in the Prometheus text format, or in OpenMetrics if metrics_format is 'openmetrics'.
+        """
+        openmetrics = metrics_format == 'openmetrics'
+        stats = sorted(self.snapshot().items())
+        lines = []
+
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+
+        family('call_duration_seconds', 'histogram', 'Duration of external calls and pipeline stages.')
+        for (kind, name), call in stats:
+            labels = f'kind="{escape_label(kind)}",name="{escape_label(name)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, call.buckets):
+                cumulative += count
+                lines.append(f'{METRICS_PREFIX}_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRICS_PREFIX}_call_duration_seconds_bucket{{{labels},le="+Inf"}} {call.count}')
+            lines.append(f'{METRICS_PREFIX}_call_duration_seconds_sum{{{labels}}} {call.seconds}')
+            lines.append(f'{METRICS_PREFIX}_call_duration_seconds_count{{{labels}}} {call.count}')
+
+        for name, attribute, help_text in (('call_errors', 'errors', 'Calls that failed.'),
+                                           ('call_sent_bytes', 'bytes_sent', 'Bytes sent by external calls.'),
+                                           ('call_received_bytes', 'bytes_received', 'Bytes received by external calls.')):
+            # OpenMetrics counter families are named without the _total suffix of their samples
+            family(name if openmetrics else f'{name}_total', 'counter', help_text)
+            for (kind, call_name), call in stats:
+                labels = f'kind="{escape_label(kind)}",name="{escape_label(call_name)}"'
+                lines.append(f'{METRICS_PREFIX}_{name}_total{{{labels}}} {getattr(call, attribute)}')
+
+        family('run_start_timestamp_seconds', 'gauge', 'When the run started.')
+        lines.append(f'{METRICS_PREFIX}_run_start_timestamp_seconds {self.started}')
+        if openmetrics:
+            lines.append('# EOF')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=METRICS_PATH, metrics_format=METRICS_FORMAT):
+        """
+        Write the statistics to a textfile, e.g. for the node_exporter textfile collector. Does nothing without a path.
+
+        The file is replaced atomically so a collector never reads a partial file.
+        """
+        if not path:
+            return
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write(self.render(metrics_format))
+        os.replace(temp_path, path)
+        logger.info(f"Wrote the metrics of this run to {path}")
+
+    def finish(self):
+        """
+        Log the summary table and export the metrics if METRICS_PATH is set.
+        """
+        self.log_summary()
+        try:
+            self.export()
+        except OSError as e:
+            logger.error(f"The metrics could not be written to {METRICS_PATH} due to - {e}")
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def http_call_name(service, method, url):
+    """
+    Name an HTTP call after its service, method and path, with resource names replaced by placeholders.
+
+    Example:
+        http_call_name('rest_proxy', 'POST', 'http://rest:8082/v3/clusters/abc/topics/orders/configs:alter')
+        returns 'rest_proxy POST /v3/clusters/{cluster_id}/topics/{topic_name}/configs:alter'
+    """
+    segments = urlsplit(url).path.split('/')
+    for index in range(1, len(segments)):
+        placeholder = NAMED_SEGMENTS.get(segments[index - 1])
+        if placeholder and segments[index] not in ('', '-'):
+            segments[index] = placeholder
+    return f"{service} {method} {'/'.join(segments)}"
+
+
+def get_metrics():
+    """
+    Return the metrics registry of this run, creating it on first use.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
@@ -1,33 +1,42 @@
 from github import Github
-from deepdiff import DeepDiff
-from datetime import datetime
 from subprocess import PIPE
 from botocore.exceptions import ClientError
-
+from rest_client import close_sessions, connect_session, rest_proxy_session
+from differ import CONFIG_DELETE, CONFIG_SET, PARTITION_DECREASE, PARTITION_INCREASE, REPLICATION_CHANGE, diff_topic_streams, diff_topics, index_resources
+from resource_stream import (NEW, REMOVED, STREAMING_THRESHOLD_BYTES, connector_hash, diff_resource_streams, iter_resource_stream,
+                             render_connector_config, resource_hash, resource_pairs)
+from resource_cache import ResourceCache, application_of
+from cluster_state import connector_differences, get_cluster_snapshot, get_connect_snapshot, refresh_cluster_snapshot
+from git_blobs import GitBlobReader
+from scram_users import alter_scram_user, describe_scram_users
+from changelog import get_changelog, start_changelog
+from metrics import get_metrics
+from file_changes import REMOVED as FILE_REMOVED, RENAMED, changes_from_git_diff
+from plan import plan_path, plan_resources, read_plan, write_plan
+from cluster_targets import CLUSTER_INVENTORY, current_target, load_inventory, select_targets, use_target
+from policy import Violation, get_policy, topic_document
+from kafka_admin import admin_available, alter_user_scram_credentials, create_acls, delete_acls, incremental_alter_topic_configs
+from connector_status import CONNECTOR_WAIT_TIMEOUT, deployed_connectors, wait_for_connectors
+from apply_engine import Operation, Outcome, FAILED, MAX_WORKERS, SUCCEEDED, run_graph, run_operation, summarize_outcomes
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import replace
+
+import click
+import io
 import json
 import logging
 import os
-import re
-import requests
 import string
 import secrets
 import subprocess
+import time
 import boto3
 
 # Constant variables
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 HEADERS = {'Content-type': 'application/json', 'Accept': 'application/json'}
-REST_PROXY_URL = os.getenv('REST_URL')
-CLUSTER_ID = os.getenv('KAFKA_CLUSTER_ID')
-CONNECT_REST_URL = os.getenv('CONNECT_REST_URL')
-REST_BASIC_AUTH_USER = os.getenv('REST_BASIC_AUTH_USER')
-REST_BASIC_AUTH_PASS = os.getenv('REST_BASIC_AUTH_PASS')
-CONNECT_BASIC_AUTH_USER = os.getenv('CONNECT_BASIC_AUTH_USER')
-CONNECT_BASIC_AUTH_PASS = os.getenv('CONNECT_BASIC_AUTH_PASS')
 ENV = os.getenv('ENV')
-CLIENT_PROPERTIES = os.getenv('CLIENT_PROPERTIES')
-BOOTSTRAP_URL = os.getenv('BOOTSTRAP_URL')
-KAFKA_CONFIGS = os.getenv('KAFKA_CONFIGS')
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_SESSION_TOKEN = os.getenv('AWS_SESSION_TOKEN')
@@ -65,106 +74,81 @@ def get_content_from_branches(source_file, source_branch, feature_file, feature_
         raise
 
 
-def find_changed_topics(source_topics, new_topics):
-    source_topics_dict = {}
-    feature_topics_dict = {}
+def find_changed_topics(source_topics, new_topics, applied_hashes=None, feature_hashes=None):
+    """
+    Compare source topics with feature topics and identify changes, deletions, and new additions.
 
-    for value in source_topics:
-        source_topics_dict.update(value)
+    Parameters:
+    - source_topics (list of dicts or iterator): List of dictionaries representing source topics, or
+      (topic_name, definition) tuples from resource_stream.iter_resources for files too large to load.
+    - new_topics (list of dicts or iterator): The feature topics, in the same format as source_topics.
+    - applied_hashes (dict): Optional {topic_name: hash} from the resource cache. Topics whose definition was
+      already applied by an earlier run are left out.
+    - feature_hashes (dict): Optional dictionary filled with {topic_name: hash} for every new or changed topic.
 
-    for value in new_topics:
-        feature_topics_dict.update(value)
+    Returns:
+    list: A list of dictionaries, one per changed topic, of the form {topic_name: value, 'type': str}
+        - 'new' and 'removed' topics map the topic name to its definition.
+        - 'update' topics map the topic name to a list of differ.TopicChange records.
+    """
+    if isinstance(source_topics, list) and isinstance(new_topics, list):
+        new, removed, changed = diff_topics(index_resources(source_topics), index_resources(new_topics),
+                                            applied_hashes, feature_hashes)
+    else:
+        new, removed, changed = diff_topic_streams(resource_pairs(source_topics), resource_pairs(new_topics),
+                                                   applied_hashes, feature_hashes)
 
     changed_topic_names = []
-    # Check for changes and deletions
-    for topic_name, source_topic in source_topics_dict.items():
-        updated_topic = feature_topics_dict.get(topic_name)
-
-        if updated_topic:
-            diff = DeepDiff(source_topic, updated_topic, ignore_order=True)
-            if diff:
-                # Check if this is a partition change
-                try:
-                    change_dict = find_changed_partitions(diff, feature_topics_dict, topic_name)
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-                except KeyError as ke:
-                    logger.info(f"Partitions do not need to be updated - {ke}")
-                    change_dict = find_changed_configs(diff, feature_topics_dict, topic_name)
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-            # Make sure the dict is not empty before adding it to the changed topic names list
-                if not change_dict:
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-
-        else:
-            # Topic was removed
-            changed_topic_names.append({topic_name: source_topics_dict.get(topic_name), "type": "removed"})
-
-    # Check for new additions
-    for topic_name in feature_topics_dict:
-        if topic_name not in source_topics_dict.keys():
-            changed_topic_names.append({topic_name: feature_topics_dict.get(topic_name), "type": "new"})
-
+    for topic_name, changes in changed.items():
+        changed_topic_names.append({topic_name: changes, "type": "update"})
+    for topic_name, topic in removed.items():
+        changed_topic_names.append({topic_name: topic, "type": "removed"})
+    for topic_name, topic in new.items():
+        changed_topic_names.append({topic_name: topic, "type": "new"})
     return changed_topic_names
 
 
-def find_changed_partitions(diff, feature_topics_dict, topic_name):
-    if diff['values_changed']["root[\'partitions_count\']"]:
-        for change_type, details in diff.items():
-            change_dict = {
-                "topic_name": topic_name,
-                "changes": []
-            }
-            for change in details:
-                if change == "root[\'partitions_count\']":
-                    configs_changes = re.findall(r"\['(.*?)'\]", change)
-                    change_dict["changes"].append({
-                        configs_changes[0]: details[change]['new_value']
-                    })
-                else:
-                    configs_changes = re.findall(r"configs'\]\[(.*)\]\[", change)
-                    if configs_changes:
-                        for index in configs_changes:
-                            prop_name = feature_topics_dict[topic_name]['configs'][int(index)]
-                            change_dict["changes"].append({
-                                "name": prop_name["name"],
-                                "value": details[change]['new_value']
-                            })
-    return change_dict
-
-
-def find_changed_configs(diff, feature_topics_dict, topic_name):
-    try:
-        if diff['values_changed']:
-            for change_type, details in diff.items():
-                change_dict = {
-                    "topic_name": topic_name,
-                    "changes": []
-                }
-
-                for change in details:
-                    configs_changes = re.findall(r"configs'\]\[(.*)\]\[", change)
-                    if configs_changes:
-                        for index in configs_changes:
-                            prop_name = feature_topics_dict[topic_name]['configs'][int(index)]
-                            change_dict["changes"].append({
-                                "name": prop_name["name"],
-                                "value": details[change]['new_value']
-                            })
-    except KeyError as ke:
-        logger.error(f"Configs could not be updated due to - {ke}")
-    return change_dict
+def process_changed_topics(changed_topic_names):
+    """
+    Turn the output of find_changed_topics into operations for the apply engine.
 
+    Parameters:
+    - changed_topic_names (list of dicts): The changed topics returned by find_changed_topics.
 
-def process_changed_topics(changed_topic_names):
-    for i, topic in enumerate(changed_topic_names):
+    Returns:
+    tuple: (upsert_operations, delete_operations) - lists of Operation objects.
+    """
+    upsert_operations = []
+    delete_operations = []
+    for topic in changed_topic_names:
         topic_name = list(topic.keys())[0]
         topic_configs = list(topic.values())[0]
         if topic['type'] == 'new':
-            add_new_topic(topic_configs)
+            upsert_operations.append(Operation('topic', topic_name, 'create', add_new_topic, (topic_configs,)))
         elif topic['type'] == 'update':
-            update_existing_topic(topic['changes']['topic_name'], topic['changes']['changes'])
+            upsert_operations.append(topic_update_operation(topic_name, topic_configs))
         else:
-            delete_topic(topic_name)
+            delete_operations.append(Operation('topic', topic_name, 'delete', delete_topic, (topic_name,)))
+    return upsert_operations, delete_operations
+
+
+def topic_update_operation(topic_name, topic_config):
+    """
+    Build the operation that updates an existing topic.
+
+    Updates that only alter configs are marked for batching with other topics through the Kafka Admin client. Whether
+    the batch is used is decided per cluster target when the change set is applied, see admin_batching.
+
+    Parameters:
+    - topic_name (str): The name of the Kafka topic.
+    - topic_config (list of TopicChange): The changes to the topic.
+
+    Returns:
+    Operation: The update operation.
+    """
+    config_only = all(change.kind in (CONFIG_SET, CONFIG_DELETE) for change in topic_config)
+    batch = alter_topic_configs_batch if config_only else None
+    return Operation('topic', topic_name, 'update', update_existing_topic, (topic_name, topic_config), batch=batch)
 
 
 def build_topic_rest_url(base_url, cluster_id):
@@ -188,49 +172,37 @@ def add_new_topic(topic):
     Parameters:
     - topic (dict): Dictionary representing the configuration of the new Kafka topic.
 
+    Returns:
+    Outcome: The result of creating the topic.
+
+    Notes:
+    The topic name, partition count and configs are checked against the policy before the change set is applied,
+    see check_policy.
     """
     topic_name = topic["topic_name"]
+    target = current_target()
+    rest_topic_url = build_topic_rest_url(target.rest_url, target.cluster_id)
 
-    retention_ms = topic['configs'][2]['value']
-    max_message_bytes = topic['configs'][3]['value']
-
-    if retention_ms > 604800000 or retention_ms == -1 or  max_message_bytes > 5242940:
-        logger.error(f"The retention.ms for {topic_name} is larger than 7 days OR the max message bytes is greater than 5 Mebibytes.")
-        exit(1)
-
-    pattern = r'^[a-zA-Z0-9]+(?:[_.-][a-zA-Z0-9]+)*$'
-
-    # Make sure topic name is valid
-    if re.match(pattern, topic_name):
-        logger.info("The topic is alphanumeric and follows the specified delimiter rules.")
-    else:
-        logger.error("The topic name contains invalid characters or does not follow the specified delimiter rules.")
-        exit(1)
-
-    if int(topic["partitions_count"]) > 32:
-        logger.error(f"Partition count can not be higher than 32")
-        exit(1)
-
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-
-    get_response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if get_response.status_code != 200:
+    if not get_cluster_snapshot().has_topic(topic_name):
         logger.info(f"Topic does not already exist. Please proceed with creating the topic")
     else:
         logger.error(f"Topic already exist. Will not create a the topic {topic_name}")
-        exit(1)
+        return Outcome('topic', topic_name, 'create', FAILED, "topic already exists")
 
     topic_json = json.dumps(topic)
 
-    response = requests.post(rest_topic_url, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS), data=topic_json, headers=HEADERS)
-    with open('CHANGELOG.md', 'a') as f:
-        if response.status_code == 201:
-            logger.info(f"The topic {topic['topic_name']} has been successfully created")
-            f.writelines(f"{datetime.now()} - The topic {topic['topic_name']} has been successfully created\n")
-        else:
-            logger.error(f"The topic {topic['topic_name']} returned {str(response.status_code)} due to the follwing reason: {response.text}" )
-            f.writelines(f"{datetime.now()} - The topic {topic['topic_name']} returned {str(response.status_code)} due to the follwing reason: {response.text}\n")
-    return topic_name
+    started = time.monotonic()
+    response = rest_proxy_session().post(rest_topic_url, data=topic_json, headers=HEADERS)
+    request = f"POST {rest_topic_url}"
+    if response.status_code == 201:
+        logger.info(f"The topic {topic['topic_name']} has been successfully created")
+        get_cluster_snapshot().record_topic(topic)
+        return get_changelog().record(Outcome('topic', topic_name, 'create', SUCCEEDED), request,
+                                      f"The topic {topic['topic_name']} has been successfully created", started)
+    else:
+        logger.error(f"The topic {topic['topic_name']} returned {str(response.status_code)} due to the follwing reason: {response.text}" )
+        return get_changelog().record(Outcome('topic', topic_name, 'create', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"The topic {topic['topic_name']} returned {str(response.status_code)} due to the follwing reason: {response.text}", started)
 
 
 def update_existing_topic(topic_name, topic_config):
@@ -239,59 +211,140 @@ def update_existing_topic(topic_name, topic_config):
 
     Parameters:
     - topic_name (str): The name of the Kafka topic to be updated.
-    - topic_config (dict): Dictionary containing the configuration changes for the Kafka topic.
+    - topic_config (list of TopicChange): The changes to the Kafka topic returned by find_changed_topics.
 
-    Raises:
-    SystemExit: If any of the update steps fail, the program exits with status code 1.
+    Returns:
+    Outcome: The first failed outcome of the update steps, or a successful outcome if every step succeeded.
 
     Notes:
-    This function first retrieves the current definition of the topic by making a GET request to the Kafka REST API.
+    This function first looks up the current definition of the topic in the cluster snapshot.
     It then updates the partition count using helper functions.
     Finally, it alters the topic configurations using a POST request to the Kafka REST API.
     """
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-    response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if response.status_code != 200:
-        logger.error(f"The topic {topic_name} failed to be updated due to {response.status_code} - {response.text}")
-        exit(1)
+    target = current_target()
+    rest_topic_url = build_topic_rest_url(target.rest_url, target.cluster_id)
+    current_topic_definition = get_cluster_snapshot().get_topic(topic_name)
+    if current_topic_definition is None:
+        logger.error(f"The topic {topic_name} failed to be updated because it does not exist")
+        return Outcome('topic', topic_name, 'update', FAILED, "topic does not exist")
+
+    outcomes = []
+    partition_changes = [change for change in topic_config if change.kind in (PARTITION_INCREASE, PARTITION_DECREASE)]
+    config_changes = [change.to_config() for change in topic_config if change.kind in (CONFIG_SET, CONFIG_DELETE)]
+    for change in topic_config:
+        if change.kind == REPLICATION_CHANGE:
+            logger.warning(f"The replication factor of {topic_name} can not be changed through the REST Proxy "
+                           f"({change.old_value} -> {change.new_value}). This change will be ignored.")
+    if partition_changes:
+        outcomes.append(update_partition_count(current_topic_definition, rest_topic_url,
+                                               partition_changes[0].new_value, topic_name))
+    # Only alter the configs once the partition change, if any, went through
+    if config_changes and not any(outcome.failed for outcome in outcomes):
+        outcomes.append(update_topic_configs(rest_topic_url, config_changes, topic_name))
+
+    for outcome in outcomes:
+        if outcome.failed:
+            return outcome
+    return Outcome('topic', topic_name, 'update', SUCCEEDED)
 
-    current_topic_definition = response.json()
 
-    # Check if the requested update is a config change
-    try:
-        if'name' in topic_config[0].keys():
-            update_topic_configs(rest_topic_url, topic_config, topic_name)
-        elif ('partitions_count' in topic_config[0].keys()) and ('name' in topic_config[1].keys()):
-                update_partition_count(current_topic_definition, rest_topic_url, topic_config[0]['partitions_count'], topic_name)
-                topic_config.pop(0)
-                update_topic_configs(rest_topic_url, topic_config, topic_name)
-    except IndexError:
-        logger.info(f"Partition count for {topic_name} needs to be updated")
-    if 'partitions_count' in topic_config[0].keys() and len(topic_config[0].keys()) == 1:
-        update_partition_count(current_topic_definition, rest_topic_url, topic_config[0]['partitions_count'], topic_name)
+def update_topic_configs(rest_topic_url, topic_config, topic_name):
+    """
+    Alter the configs of a Kafka topic.
 
+    Parameters:
+    - rest_topic_url (str): The REST API URL for Kafka topics.
+    - topic_config (list of dicts): The configs to alter, each with a 'name' and either a 'value' or a DELETE 'operation'.
+    - topic_name (str): The name of the Kafka topic.
 
-def update_topic_configs(rest_topic_url, topic_config, topic_name):
-    # Check if retention.ms is greater than 7 days and if max.message.bytes is more than 5 Mebibytes
-    for config in topic_config:
-        if (config['name'] == 'retention.ms' and config['value'] > 604800000) or (config['name'] == 'retention.ms' and config['value'] == -1):
-            logger.error(f"The retention.ms for {topic_name} is larger than 7 days")
-            exit(1)
-        if config['name'] == 'max.message.bytes' and config['value'] > 5242940:
-            logger.error(f"The max.message.bytes for {topic_name} is greater than 5 Mebibytes.")
-            exit(1)
+    Returns:
+    Outcome: The result of altering the configs.
+    """
+    topic_config = pending_topic_configs(topic_name, topic_config)
+    if not topic_config:
+        logger.info(f"The configs of {topic_name} already match the requested values")
+        return Outcome('topic', topic_name, 'update', SUCCEEDED, "configs already up to date")
 
     updated_Configs = "{\"data\":" + json.dumps(topic_config) + "}"
     logger.info("altering configs to " + updated_Configs)
-    with open('CHANGELOG.md', 'a') as f:
-        response = requests.post(f"{rest_topic_url}{topic_name}" + "/configs:alter",
-                                 auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS), data=updated_Configs, headers=HEADERS)
-        if response.status_code == 204:
-            f.writelines(f"{datetime.now()} - The configs {updated_Configs} was successfully applied to {topic_name}\n")
-            logger.info(f"The configs {updated_Configs} was successfully applied to {topic_name}\n")
+    started = time.monotonic()
+    response = rest_proxy_session().post(f"{rest_topic_url}{topic_name}" + "/configs:alter", data=updated_Configs, headers=HEADERS)
+    request = f"POST {rest_topic_url}{topic_name}/configs:alter"
+    if response.status_code == 204:
+        logger.info(f"The configs {updated_Configs} was successfully applied to {topic_name}\n")
+        get_cluster_snapshot().record_configs(topic_name, topic_config)
+        return get_changelog().record(Outcome('topic', topic_name, 'update', SUCCEEDED), request,
+                                      f"The configs {updated_Configs} was successfully applied to {topic_name}", started)
+    else:
+        logger.error(f"Topic configs failed to be applied to the topic due to {str(response.status_code)} this is the reason: {response.text}\n")
+        return get_changelog().record(Outcome('topic', topic_name, 'update', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"Topic configs failed to be applied to the topic {topic_name} due to {str(response.status_code)} this is the reason: {response.text}", started)
+
+
+def pending_topic_configs(topic_name, topic_config):
+    """
+    Leave out the configs that already have the requested value on the cluster.
+    """
+    current_configs = get_cluster_snapshot().topic_configs(topic_name)
+    return [config for config in topic_config
+            if 'value' not in config or current_configs.get(config['name']) != str(config['value'])]
+
+
+def alter_topic_configs_batch(operations):
+    """
+    Alter the configs of many topics with one incrementalAlterConfigs request through the Kafka Admin client.
+
+    Every topic gets its own outcome and changelog record, so a rejected topic does not fail the rest of the batch. Falls back to one REST Proxy update per topic if the Admin client is not
+    available, e.g. when running a plan built on another machine.
+
+    Parameters:
+    - operations (list of Operation): Config-only topic updates built by topic_update_operation.
+
+    Returns:
+    list: One Outcome per operation, in the same order.
+    """
+    if not admin_available():
+        return [run_operation(operation) for operation in operations]
+
+    outcomes = [None] * len(operations)
+    pending = {}
+    for index, operation in enumerate(operations):
+        topic_name, topic_config = operation.args
+        if not get_cluster_snapshot().has_topic(topic_name):
+            logger.error(f"The topic {topic_name} failed to be updated because it does not exist")
+            outcomes[index] = Outcome('topic', topic_name, 'update', FAILED, "topic does not exist")
+            continue
+        config_changes = pending_topic_configs(topic_name, [change.to_config() for change in topic_config])
+        if not config_changes:
+            logger.info(f"The configs of {topic_name} already match the requested values")
+            outcomes[index] = Outcome('topic', topic_name, 'update', SUCCEEDED, "configs already up to date")
+            continue
+        indexes, configs = pending.setdefault(topic_name, ([], {}))
+        indexes.append(index)
+        # A later change to the same config of the same topic wins
+        configs.update({config['name']: config for config in config_changes})
+    if not pending:
+        return outcomes
+
+    configs_by_topic = {topic_name: list(configs.values()) for topic_name, (_, configs) in pending.items()}
+    started = time.monotonic()
+    errors = incremental_alter_topic_configs(configs_by_topic)
+    request = f"incrementalAlterConfigs {len(configs_by_topic)} topic(s)"
+    for topic_name, (indexes, _) in pending.items():
+        updated_Configs = json.dumps(configs_by_topic[topic_name])
+        error = errors.get(topic_name, "no result returned for the topic")
+        if error is None:
+            logger.info(f"The configs {updated_Configs} was successfully applied to {topic_name}")
+            get_cluster_snapshot().record_configs(topic_name, configs_by_topic[topic_name])
+            outcome = get_changelog().record(Outcome('topic', topic_name, 'update', SUCCEEDED), request,
+                                             f"The configs {updated_Configs} was successfully applied to {topic_name}", started)
         else:
-            f.writelines(f"Topic configs failed to be applied to the topic due to {str(response.status_code)} this is the reason: {response.text}\n")
-            logger.error(f"Topic configs failed to be applied to the topic due to {str(response.status_code)} this is the reason: {response.text}\n")
+            logger.error(f"Topic configs failed to be applied to the topic {topic_name} due to {error}")
+            outcome = get_changelog().record(Outcome('topic', topic_name, 'update', FAILED, error), request,
+                                             f"Topic configs failed to be applied to the topic {topic_name} due to {error}", started)
+        for index in indexes:
+            outcomes[index] = outcome
+    return outcomes
 
 
 def update_partition_count(current_topic_definition, rest_topic_url, partition_count, topic_name):
@@ -304,37 +357,35 @@ def update_partition_count(current_topic_definition, rest_topic_url, partition_c
     - partition_count (str): Partition count.
     - topic_name (str): The name of the Kafka topic.
 
-    Raises:
-    SystemExit: If the partition count update fails, the program exits with status code 1.
+    Returns:
+    Outcome: The result of the partition count update.
     """
     current_partitions_count = current_topic_definition['partitions_count']
 
     # Check if the requested update is the partition count
-    try:
-        new_partition_count = int(partition_count)
-        if new_partition_count == current_partitions_count:
-            logger.info(f"Requested partition count and current partition count is the same - {new_partition_count}")
-        if new_partition_count > 32:
-            logger.error(f"Partition count can not be higher than 32")
-            exit(1)
-        if new_partition_count > current_partitions_count:
-            logger.info(f"A requested increase of partitions for topic  {topic_name} is from "
-                        f"{str(current_partitions_count)} to {str(new_partition_count)}")
-            partition_response = requests.patch(f"{rest_topic_url}{topic_name}",
-                                                auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS),
-                                                data="{\"partitions_count\":" + str(new_partition_count) + "}")
-            with open('CHANGELOG.md', 'a') as f:
-                if partition_response.status_code != 200:
-                    logger.info(
-                        f"The partition increase failed for topic {topic_name} due to {str(partition_response.status_code)} -  {partition_response.text}")
-                    f.writelines(f"{datetime.now()} - The partition increase for topic {topic_name} was successful\n")
-                    exit(1)
-                logger.info(f"The partition increase for topic {topic_name} was successful")
-        elif new_partition_count < current_partitions_count:
-            logger.error("Cannot reduce partition count for a given topic")
-            exit(1)
-    except Exception as e:
-        logger.error("Failed due to " + e)
+    new_partition_count = int(partition_count)
+    if new_partition_count == current_partitions_count:
+        logger.info(f"Requested partition count and current partition count is the same - {new_partition_count}")
+    if new_partition_count > current_partitions_count:
+        logger.info(f"A requested increase of partitions for topic  {topic_name} is from "
+                    f"{str(current_partitions_count)} to {str(new_partition_count)}")
+        started = time.monotonic()
+        partition_response = rest_proxy_session().patch(f"{rest_topic_url}{topic_name}",
+                                                        data="{\"partitions_count\":" + str(new_partition_count) + "}")
+        request = f"PATCH {rest_topic_url}{topic_name}"
+        if partition_response.status_code != 200:
+            logger.error(
+                f"The partition increase failed for topic {topic_name} due to {str(partition_response.status_code)} -  {partition_response.text}")
+            return get_changelog().record(Outcome('topic', topic_name, 'update', FAILED, f"{partition_response.status_code} - {partition_response.text}"), request,
+                                          f"The partition increase failed for topic {topic_name} due to {str(partition_response.status_code)} - {partition_response.text}", started)
+        logger.info(f"The partition increase for topic {topic_name} was successful")
+        get_cluster_snapshot().record_partitions(topic_name, new_partition_count)
+        get_changelog().record(Outcome('topic', topic_name, 'update', SUCCEEDED), request,
+                               f"The partition increase for topic {topic_name} was successful", started)
+    elif new_partition_count < current_partitions_count:
+        logger.error("Cannot reduce partition count for a given topic")
+        return Outcome('topic', topic_name, 'update', FAILED, "cannot reduce partition count")
+    return Outcome('topic', topic_name, 'update', SUCCEEDED)
 
 
 def delete_topic(topic_name):
@@ -344,54 +395,58 @@ def delete_topic(topic_name):
     Parameters:
     - topic (dict): Dictionary representing the configuration of the Kafka topic, including the topic name.
 
-    Raises:
-    SystemExit: If the deletion fails, the program exits with status code 1.
+    Returns:
+    Outcome: The result of deleting the topic.
 
     Notes:
-    This method first checks if the topic exists by making a GET request to the Kafka REST API.
+    This method first checks if the topic exists in the cluster snapshot.
     If the topic exists, it proceeds to delete the topic using a DELETE request.
     """
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-
-    get_response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if get_response.status_code == 200:
-        logger.info(f"Response code is {str(get_response.status_code)}")
+    target = current_target()
+    rest_topic_url = build_topic_rest_url(target.rest_url, target.cluster_id)
+
+    if not get_cluster_snapshot().has_topic(topic_name):
+        logger.error(f"Topic {topic_name} will not be deleted because it doesnt exist")
+        return Outcome('topic', topic_name, 'delete', FAILED, "topic does not exist")
+
+    started = time.monotonic()
+    response = rest_proxy_session().delete(rest_topic_url + topic_name)
+    request = f"DELETE {rest_topic_url}{topic_name}"
+    if response.status_code == 204:
+        logger.info(f"The topic {topic_name} has been successfully deleted")
+        get_cluster_snapshot().forget_topic(topic_name)
+        return get_changelog().record(Outcome('topic', topic_name, 'delete', SUCCEEDED), request,
+                                      f"{topic_name} has been successfully deleted", started)
     else:
-        logger.error(f"Failed due to the following status code {str(get_response.status_code)} and reason {str(get_response.text)}" )
+        logger.error(f"The topic {topic_name} returned {str(response.status_code)} due to the following reason: {response.text}" )
+        return get_changelog().record(Outcome('topic', topic_name, 'delete', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"{topic_name} attempted to be deleted but returned {str(response.status_code)} due to the following reason: {response.text}", started)
 
-    response = requests.delete(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    with open('CHANGELOG.md', 'a') as f:
-        if response.status_code == 204:
-            logger.info(f"The topic {topic_name} has been successfully deleted")
-            f.writelines(f"{datetime.now()} - {topic_name} has been successfully deleted\n")
-        else:
-            logger.error(f"The topic {topic_name} returned {str(response.status_code)} due to the following reason: {response.text}" )
-            f.writelines(f"{datetime.now()} - {topic_name} attempted to be deleted but returned {str(response.status_code)} due to the following reason: {response.text}\n")
 
-
-def find_changed_acls(source_acls, feature_acls):
+def find_changed_acls(source_acls, feature_acls, applied_hashes=None, feature_hashes=None):
     """
-    Compare source topics with feature topics and identify changes, deletions, and new additions.
+    Compare source acls with feature acls and identify deletions and new additions.
 
     Parameters:
-    - source_topics (list of dicts): List of dictionaries representing source topics.
-    - feature_topics (list of dicts): List of dictionaries representing feature topics.
+    - source_acls (list of dicts or iterator): List of dictionaries representing source acls, or
+      (acl_id, definition) tuples from resource_stream.iter_resources for files too large to load.
+    - feature_acls (list of dicts or iterator): The feature acls, in the same format as source_acls.
+    - applied_hashes (dict): Optional {acl_id: hash} from the resource cache. ACLs that were already
+      applied by an earlier run are left out.
+    - feature_hashes (dict): Optional dictionary filled with {acl_id: hash} for every new acl.
 
     Returns:
-    list: A list of dictionaries, each containing information about changed topics. Each dictionary has the following format:
+    list: A list of dictionaries, each containing information about changed acls. Each dictionary has the following format:
         {'acl_id': str, 'type': str, 'changes': dict}
         - 'acl_id': The identifier of the acl.
         - 'type': Type of change ('update', 'removed', 'new').
         - 'changes': Dictionary representing the changes (present if 'type' is 'update').
     """
-    source_acls_dict = {}
-    feature_acls_dict = {}
-
-    for value in source_acls:
-        source_acls_dict.update(value)
+    if not (isinstance(source_acls, list) and isinstance(feature_acls, list)):
+        return find_changed_acl_streams(source_acls, feature_acls, applied_hashes, feature_hashes)
 
-    for value in feature_acls:
-        feature_acls_dict.update(value)
+    source_acls_dict = index_resources(source_acls)
+    feature_acls_dict = index_resources(feature_acls)
 
     changed_acls = []
     # Check for changes and deletions
@@ -405,11 +460,37 @@ def find_changed_acls(source_acls, feature_acls):
     # Check for new additions
     for acl_name in feature_acls_dict:
         if acl_name not in source_acls_dict.keys():
+            if is_acl_applied(acl_name, feature_acls_dict[acl_name], applied_hashes, feature_hashes):
+                continue
             changed_acls.append({acl_name: feature_acls_dict.get(acl_name), "type": "new"})
             logger.info(f"The following acl will be added : {acl_name}")
     return changed_acls
 
 
+def is_acl_applied(acl_name, feature_acl, applied_hashes, feature_hashes):
+    definition_hash = resource_hash(feature_acl)
+    if feature_hashes is not None:
+        feature_hashes[acl_name] = definition_hash
+    if applied_hashes and applied_hashes.get(acl_name) == definition_hash:
+        logger.info(f"Skipping the acl {acl_name} because it was already applied")
+        return True
+    return False
+
+
+def find_changed_acl_streams(source_acls, feature_acls, applied_hashes=None, feature_hashes=None):
+    changed_acls = []
+    for change_type, acl_name, source_acl, feature_acl in diff_resource_streams(resource_pairs(source_acls), resource_pairs(feature_acls)):
+        if change_type == REMOVED:
+            changed_acls.append({acl_name: source_acl, "type": "removed"})
+            logger.info(f"The following acl will be removed : {acl_name}")
+        elif change_type == NEW:
+            if is_acl_applied(acl_name, feature_acl, applied_hashes, feature_hashes):
+                continue
+            changed_acls.append({acl_name: feature_acl, "type": "new"})
+            logger.info(f"The following acl will be added : {acl_name}")
+    return changed_acls
+
+
 def build_acl_rest_url(base_url, cluster_id):
     """
     Build the REST API URL for Kafka topics based on the provided base URL and cluster ID.
@@ -491,31 +572,122 @@ def add_new_acl(acl):
     Parameters:
     - acl (dict): Dictionary representing the configuration of the new Kafka ACL.
 
+    Returns:
+    Outcome: The result of creating the ACL.
     """
-    rest_acl_url = build_acl_rest_url(REST_PROXY_URL, CLUSTER_ID)
-    user_principal = acl['principal'].split(':')[-1]
-    p1 = subprocess.Popen([KAFKA_CONFIGS, '--bootstrap-server', BOOTSTRAP_URL, '--describe', '--entity-type', 'users', '--command-config', CLIENT_PROPERTIES], stdout=PIPE)
-    p2 = subprocess.Popen(['grep', user_principal], stdin=p1.stdout, stdout=subprocess.PIPE)
-    p1.stdout.close()
-    user_output = p2.communicate()[0]
-    user_output = user_output.decode('utf-8')
-    if user_principal not in user_output:
-        # Generate pseudo random password for scram user
-        password = generate_random_password()
-        # Adding new scram user principal with password
-        subprocess.Popen([KAFKA_CONFIGS, '--bootstrap-server', BOOTSTRAP_URL, '--alter', '--add-config', f'SCRAM-SHA-256=[password=${password}],SCRAM-SHA-512=[password=${password}]', '--entity-type', 'users', '--entity-name', user_principal, '--command-config', CLIENT_PROPERTIES], stdout=PIPE, stderr=PIPE)
-        logger.info(f"The user principal is {user_principal} and SCRAM password is {password}")
-        # add_secret_to_aws(user_principal, password)
+    acl_id = f"{acl['principal']}-{acl['resource_name']}-{acl['operation']}"
+    if get_cluster_snapshot().has_acl(acl):
+        logger.info(f"The acl {acl_id} already exists")
+        return Outcome('acl', acl_id, 'create', SUCCEEDED, "acl already exists")
+    target = current_target()
+    rest_acl_url = build_acl_rest_url(target.rest_url, target.cluster_id)
     acl_json = json.dumps(acl)
 
-    response = requests.post(rest_acl_url, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS), data=acl_json, headers=HEADERS)
-    with open('CHANGELOG.md', 'a') as f:
-        if response.status_code == 201:
-            logger.info(f"The acl {acl_json} has been successfully created")
-            f.writelines(f"{datetime.now()} - {acl_json} has been successfully created\n")
+    started = time.monotonic()
+    response = rest_proxy_session().post(rest_acl_url, data=acl_json, headers=HEADERS)
+    request = f"POST {rest_acl_url}"
+    if response.status_code == 201:
+        logger.info(f"The acl {acl_json} has been successfully created")
+        get_cluster_snapshot().record_acl(acl)
+        return get_changelog().record(Outcome('acl', acl_id, 'create', SUCCEEDED), request,
+                                      f"{acl_json} has been successfully created", started)
+    else:
+        logger.error(f"The acl {acl_json} returned {str(response.status_code)} due to the following reason: {response.text}")
+        return get_changelog().record(Outcome('acl', acl_id, 'create', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"{acl_json} attempted to be created but was unsuccessful. REST API returned {str(response.status_code)} due to the following reason: {response.text}", started)
+
+
+def create_scram_user(user_principal):
+    """
+    Create a SCRAM user with a generated password.
+
+    Parameters:
+    - user_principal (str): The name of the user, without the User: prefix.
+
+    Returns:
+    Outcome: The result of creating the user.
+    """
+    # Generate pseudo random password for scram user
+    password = generate_random_password()
+    # Adding new scram user principal with password
+    result = alter_scram_user(user_principal, password)
+    if result.returncode != 0:
+        logger.error(f"The SCRAM user {user_principal} failed to be created due to - {result.stderr.decode('utf-8')}")
+        return Outcome('user', user_principal, 'create', FAILED, result.stderr.decode('utf-8'))
+    logger.info(f"The user principal is {user_principal} and SCRAM password is {password}")
+    # add_secret_to_aws(user_principal, password)
+    return Outcome('user', user_principal, 'create', SUCCEEDED)
+
+
+def create_scram_users_batch(operations):
+    """
+    Create many SCRAM users with one alterUserScramCredentials request through the Kafka Admin client.
+
+    kafka-configs alters the credentials of a single user per call, so without the Admin client the users are
+    created with one kafka-configs call each, run concurrently up to the workers of the cluster target.
+
+    Parameters:
+    - operations (list of Operation): User create operations built by scram_user_operations.
+
+    Returns:
+    list: One Outcome per operation, in the same order.
+    """
+    if not admin_available():
+        with ThreadPoolExecutor(max_workers=max(1, min(current_target().max_workers, len(operations)))) as executor:
+            # Each kafka-configs call runs in a copy of the caller's context, so it uses the caller's cluster target
+            return list(executor.map(lambda operation: copy_context().run(run_operation, operation), operations))
+
+    # Generate pseudo random passwords for the scram users
+    passwords = {operation.args[0]: generate_random_password() for operation in operations}
+    errors = alter_user_scram_credentials(passwords)
+    outcomes = []
+    for operation in operations:
+        user_principal = operation.args[0]
+        error = errors.get(user_principal, "no result returned for the user")
+        if error is None:
+            logger.info(f"The user principal is {user_principal} and SCRAM password is {passwords[user_principal]}")
+            # add_secret_to_aws(user_principal, passwords[user_principal])
+            outcomes.append(Outcome('user', user_principal, 'create', SUCCEEDED))
         else:
-            logger.error(f"The acl {acl_json} returned {str(response.status_code)} due to the following reason: {response.text}")
-            f.writelines(f"{datetime.now()} - {acl_json} attempted to be created but was unsuccessful. REST API returned {str(response.status_code)} due to the following reason: {response.text}\n")
+            logger.error(f"The SCRAM user {user_principal} failed to be created due to - {error}")
+            outcomes.append(Outcome('user', user_principal, 'create', FAILED, error))
+    return outcomes
+
+
+def scram_user_operations(acl_operations):
+    """
+    Build one create operation per user that new ACLs are granted to but that does not exist yet.
+
+    The existing SCRAM users are listed once with a single kafka-configs call, and each missing user is
+    created once no matter how many of the new ACLs reference it. The operations are batched, see
+    create_scram_users_batch. If the users can not be listed, every referenced user gets an operation that
+    reports the error, so the user fails and the ACLs granted to it are skipped like any other failed change.
+
+    Parameters:
+    - acl_operations (list of Operation): The ACL create operations of the change set.
+
+    Returns:
+    list: A list of Operation objects creating the missing users.
+    """
+    principals = {operation.args[0]['principal'] for operation in acl_operations}
+    user_principals = sorted({principal.split(':')[-1] for principal in principals if principal.startswith('User:')})
+    if not user_principals:
+        return []
+    try:
+        existing_users = describe_scram_users()
+    except Exception as e:
+        logger.error(f"The SCRAM users could not be listed due to - {e}")
+        return [Operation('user', user_principal, 'create', user_lookup_failed, (user_principal, str(e)))
+                for user_principal in user_principals]
+    return [Operation('user', user_principal, 'create', create_scram_user, (user_principal,), batch=create_scram_users_batch)
+            for user_principal in user_principals if user_principal not in existing_users]
+
+
+def user_lookup_failed(user_principal, error):
+    """
+    Report a user that can not be created because the existing SCRAM users could not be listed.
+    """
+    return Outcome('user', user_principal, 'create', FAILED, f"the SCRAM users could not be listed - {error}")
 
 
 def delete_acl(acl):
@@ -525,33 +697,178 @@ def delete_acl(acl):
     Parameters:
     - topic (dict): Dictionary representing the configuration of the Kafka acl, including the topic name.
 
-    Raises:
-    SystemExit: If the deletion fails, the program exits with status code 1.
+    Returns:
+    Outcome: The result of deleting the ACL.
+    """
+    acl_id = f"{acl['principal']}-{acl['resource_name']}-{acl['operation']}"
+    if not get_cluster_snapshot().has_acl(acl):
+        logger.info(f"The acl {acl_id} does not exist on the cluster")
+        return Outcome('acl', acl_id, 'delete', SUCCEEDED, "acl does not exist")
+    target = current_target()
+    rest_acl_url = build_acl_rest_url(target.rest_url, target.cluster_id)
+    started = time.monotonic()
+    response = rest_proxy_session().delete(rest_acl_url, params=acl)
+    request = f"DELETE {rest_acl_url}"
+    if response.status_code == 200:
+        logger.info(f"The acl {acl} has been successfully deleted")
+        get_cluster_snapshot().forget_acl(acl)
+        return get_changelog().record(Outcome('acl', acl_id, 'delete', SUCCEEDED), request,
+                                      f"{acl} has been successfully deleted", started)
+    else:
+        logger.error(f"The acl {acl} returned {str(response.status_code)} due to the following reason: {response.text}")
+        return get_changelog().record(Outcome('acl', acl_id, 'delete', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"{acl} attempted to be deleted but was unsuccessful. REST API returned {str(response.status_code)} due to the following reason: {response.text}", started)
 
-    Notes:
-    This method first checks if the topic exists by making a GET request to the Kafka REST API.
-    If the topic exists, it proceeds to delete the topic using a DELETE request.
+
+def acl_group_key(acl):
+    """
+    Return the principal and resource pattern of an ACL, which ACL batches are grouped by.
     """
-    rest_acl_url = build_acl_rest_url(REST_PROXY_URL, CLUSTER_ID)
-    response = requests.delete(rest_acl_url, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS), params=acl)
-    with open('CHANGELOG.md', 'a') as f:
-        if response.status_code == 200:
-            logger.info(f"The acl {acl} has been successfully deleted")
-            f.writelines(f"{datetime.now()} - {acl} has been successfully deleted\n")
+    return acl['principal'], str(acl['resource_type']).upper(), acl['resource_name'], str(acl['pattern_type']).upper()
+
+
+def group_acl_operations(operations, action):
+    """
+    Split ACL operations into the ones already applied on the cluster and the pending ones grouped per principal
+    and resource pattern.
+
+    Parameters:
+    - operations (list of Operation): The ACL operations of a batch.
+    - action (str): 'create' or 'delete'.
+
+    Returns:
+    tuple: (outcomes, groups) where outcomes has an Outcome for the operations with nothing to do and None for the
+    others, and groups is {(principal, resource_type, resource_name, pattern_type): list of operation indexes}.
+    """
+    outcomes = [None] * len(operations)
+    groups = {}
+    for index, operation in enumerate(operations):
+        acl = operation.args[0]
+        exists = get_cluster_snapshot().has_acl(acl)
+        if action == 'create' and exists:
+            logger.info(f"The acl {operation.resource_id} already exists")
+            outcomes[index] = Outcome('acl', operation.resource_id, action, SUCCEEDED, "acl already exists")
+        elif action == 'delete' and not exists:
+            logger.info(f"The acl {operation.resource_id} does not exist on the cluster")
+            outcomes[index] = Outcome('acl', operation.resource_id, action, SUCCEEDED, "acl does not exist")
         else:
-            logger.error(f"The acl {acl} returned {str(response.status_code)} due to the following reason: {response.text}")
-            f.writelines(f"{datetime.now()} - {acl} attempted to be deleted but was unsuccessful. REST API returned {str(response.status_code)} due to the following reason: {response.text}\n")
+            groups.setdefault(acl_group_key(acl), []).append(index)
+    return outcomes, groups
+
+
+def record_acl_results(operations, indexes, errors, action, request, started, outcomes):
+    """
+    Record the per-ACL results of a batch on the snapshot and the changelog, and store their outcomes at their indexes.
+    """
+    for index, error in zip(indexes, errors):
+        operation = operations[index]
+        acl = operation.args[0]
+        acl_json = json.dumps(acl)
+        if error is None:
+            logger.info(f"The acl {acl_json} has been successfully {action}d")
+            if action == 'create':
+                get_cluster_snapshot().record_acl(acl)
+            else:
+                get_cluster_snapshot().forget_acl(acl)
+            outcomes[index] = get_changelog().record(Outcome('acl', operation.resource_id, action, SUCCEEDED), request,
+                                                     f"{acl_json} has been successfully {action}d", started)
+        else:
+            logger.error(f"The acl {acl_json} failed to be {action}d due to the following reason: {error}")
+            outcomes[index] = get_changelog().record(Outcome('acl', operation.resource_id, action, FAILED, error), request,
+                                                     f"{acl_json} attempted to be {action}d but was unsuccessful due to the following reason: {error}", started)
+
+
+def create_acls_batch(operations):
+    """
+    Create many ACLs at once, grouped per principal and resource pattern.
+
+    With the Kafka Admin client every pending ACL of the batch is sent in one createAcls request and gets its own
+    result. Otherwise each group is sent to the REST Proxy acls:batch endpoint, which succeeds or fails as a whole,
+    and falls back to one POST per ACL if the REST Proxy does not support it.
+
+    Parameters:
+    - operations (list of Operation): ACL create operations built by add_or_remove_acls.
+
+    Returns:
+    list: One Outcome per operation, mapped back to the acl id of the operation.
+    """
+    outcomes, groups = group_acl_operations(operations, 'create')
+    if not groups:
+        return outcomes
+
+    if admin_available():
+        indexes = [index for group_indexes in groups.values() for index in group_indexes]
+        started = time.monotonic()
+        errors = create_acls([operations[index].args[0] for index in indexes])
+        record_acl_results(operations, indexes, errors, 'create', f"createAcls {len(indexes)} acl(s)", started, outcomes)
+        return outcomes
+
+    target = current_target()
+
+    rest_acl_batch_url = build_acl_rest_url(target.rest_url, target.cluster_id).rstrip('/') + ':batch'
+    for (principal, resource_type, resource_name, pattern_type), indexes in groups.items():
+        acls_json = json.dumps({'data': [operations[index].args[0] for index in indexes]})
+        started = time.monotonic()
+        response = rest_proxy_session().post(rest_acl_batch_url, data=acls_json, headers=HEADERS)
+        if response.status_code in (404, 405):
+            logger.warning(f"The REST Proxy does not support {rest_acl_batch_url}, creating the acls one by one")
+            for index in indexes:
+                outcomes[index] = run_operation(operations[index])
+            continue
+        logger.info(f"Created {len(indexes)} acl(s) of {principal} on {pattern_type} {resource_type} {resource_name} "
+                    f"with one request - {response.status_code}")
+        error = None if response.status_code in (200, 201, 204) else f"{response.status_code} - {response.text}"
+        record_acl_results(operations, indexes, [error] * len(indexes), 'create', f"POST {rest_acl_batch_url}", started, outcomes)
+    return outcomes
+
+
+def delete_acls_batch(operations):
+    """
+    Delete many ACLs with one deleteAcls request through the Kafka Admin client, with one exact filter per ACL.
+
+    Falls back to one REST Proxy DELETE per ACL if the Admin client is not available.
+
+    Parameters:
+    - operations (list of Operation): ACL delete operations built by add_or_remove_acls.
+
+    Returns:
+    list: One Outcome per operation, mapped back to the acl id of the operation.
+    """
+    if not admin_available():
+        return [run_operation(operation) for operation in operations]
+    outcomes, groups = group_acl_operations(operations, 'delete')
+    indexes = [index for group_indexes in groups.values() for index in group_indexes]
+    if indexes:
+        started = time.monotonic()
+        errors = delete_acls([operations[index].args[0] for index in indexes])
+        record_acl_results(operations, indexes, errors, 'delete', f"deleteAcls {len(indexes)} acl(s)", started, outcomes)
+    return outcomes
 
 
 def add_or_remove_acls(changed_acls):
-    for i, acls in enumerate(changed_acls):
+    """
+    Turn the output of find_changed_acls into operations for the apply engine.
+
+    Parameters:
+    - changed_acls (list of dicts): The changed acls returned by find_changed_acls.
+
+    Returns:
+    tuple: (add_operations, delete_operations) - lists of Operation objects.
+    """
+    add_operations = []
+    delete_operations = []
+    for acls in changed_acls:
+        acl_id = list(acls.keys())[0]
         acl_configs = list(acls.values())
         if acls['type'] == 'new':
-            add_new_acl(acl_configs[0])
+            add_operations.append(Operation('acl', acl_id, 'create', add_new_acl, (acl_configs[0],), batch=create_acls_batch))
         elif acls['type'] == 'removed':
-            delete_acl(acl_configs[0])
+            # The REST Proxy deletes one ACL filter per request, so deletions are only batched through the Admin
+            # client, see admin_batching
+            delete_operations.append(Operation('acl', acl_id, 'delete', delete_acl, (acl_configs[0],), batch=delete_acls_batch))
         else:
             continue
+    return add_operations, delete_operations
 
 
 def build_connect_rest_url(base_url, connector_name):
@@ -568,168 +885,812 @@ def build_connect_rest_url(base_url, connector_name):
 
 
 def process_connector_changes(connector_file):
-    # Add a new connector
-    connector_name = connector_file.split("/connectors/")[1].replace(".json","")
-    connect_rest_url = build_connect_rest_url(CONNECT_REST_URL, connector_name)
-    json_file = open(connector_file)
-    json_string_template = string.Template(json_file.read())
-    json_string = json_string_template.substitute(**os.environ)
-    connector_configs = json.loads(json_string)
+    """
+    Create or update a connector from its json file.
 
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
+    The rendered config is compared with the live config from the connector snapshot first, and the PUT is only
+    sent if they differ, since every PUT makes Connect rebalance and restart the connector's tasks.
 
-    try:
-        topics = connector_configs['topics']
-    except KeyError:
-        logger.info("The topic field name for this connector is not topics or topic.whitelist")
-    try:
-        topics = connector_configs['topic.whitelist']
-    except KeyError:
-        logger.info("The topic field name for this connector is not topics or topic.whitelist")
+    Parameters:
+    - connector_file (str): The path of the connector json file. The file name is the connector name.
 
+    Returns:
+    Outcome: The result of deploying the connector.
+    """
+    # Add a new connector
+    connector_name = connector_file.split("/connectors/")[1].replace(".json","")
+    connect_rest_url = build_connect_rest_url(current_target().connect_rest_url, connector_name)
+    json_string = render_connector_config(connector_file)
     try:
-        topics = connector_configs['kafka.topic']
-    except KeyError:
-        logger.info("The topic field name for this connector is not topics or kafka.topic")
-
-    if ',' in topics:
-        topic_list = topics.split(',')
-        for topic in topic_list:
-            verify_topic_in_connector(connector_name, rest_topic_url, topic)
-    else:
-        verify_topic_in_connector(connector_name, rest_topic_url, topics)
-    try:
-        connect_response = requests.put(f"{connect_rest_url}/config", data=json_string, auth=(CONNECT_BASIC_AUTH_USER, CONNECT_BASIC_AUTH_PASS), headers=HEADERS)
+        connector_configs = json.loads(json_string)
     except json.decoder.JSONDecodeError as error:
         # if the connector Json is invalid, log the error
         logger.error(f"Invalid connector JSON due to - {error}")
-    with open('CHANGELOG.md', 'a') as f:
-        if connect_response.status_code == 201 or connect_response.status_code == 200:
-            logger.info(f"The connector {connector_name} has been successfully deployed")
-            f.writelines(f"{datetime.now()} - The connector {connector_name} has been successfully deployed\n")
-        else:
-            logger.error(f"The connector {connector_name} returned {str(connect_response.status_code)} due to the following reason: {connect_response.text}")
-            f.writelines(f"{datetime.now()} - The connector {connector_name} returned {str(connect_response.status_code)} due to the following reason: {connect_response.text}\n")
+        return Outcome('connector', connector_name, 'deploy', FAILED, f"invalid connector JSON - {error}")
+
+    live_configs = get_connect_snapshot().get_config(connector_name)
+    if live_configs is not None and not connector_differences(connector_configs, live_configs):
+        logger.info(f"The connector {connector_name} already runs with the requested config")
+        return Outcome('connector', connector_name, 'deploy', SUCCEEDED, "config already up to date")
+
+    topics = connector_topics(connector_configs)
+    if not topics:
+        logger.info("The topic field name for this connector is not topics, topic.whitelist or kafka.topic")
+
+    for topic in topics:
+        if not verify_topic_in_connector(connector_name, topic):
+            return Outcome('connector', connector_name, 'deploy', FAILED, f"topic {topic} does not exist")
+
+    started = time.monotonic()
+    connect_response = connect_session().put(f"{connect_rest_url}/config", data=json_string, headers=HEADERS)
+    request = f"PUT {connect_rest_url}/config"
+    if connect_response.status_code == 201 or connect_response.status_code == 200:
+        logger.info(f"The connector {connector_name} has been successfully deployed")
+        get_connect_snapshot().record_config(connector_name, connector_configs)
+        return get_changelog().record(Outcome('connector', connector_name, 'deploy', SUCCEEDED), request,
+                                      f"The connector {connector_name} has been successfully deployed", started)
+    else:
+        logger.error(f"The connector {connector_name} returned {str(connect_response.status_code)} due to the following reason: {connect_response.text}")
+        return get_changelog().record(Outcome('connector', connector_name, 'deploy', FAILED, f"{connect_response.status_code} - {connect_response.text}"), request,
+                                      f"The connector {connector_name} returned {str(connect_response.status_code)} due to the following reason: {connect_response.text}", started)
 
 
-def verify_topic_in_connector(connector_name, rest_topic_url, topic):
-        topic_response = requests.get(rest_topic_url + topic, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-        if topic_response.status_code == 200:
-            logger.info(f"Topic {topic} for connector {connector_name} currently exists")
-        else:
-            logger.error(
-                f"Topic {topic} for connector {connector_name} currently does not exist - {str(topic_response.status_code)}")
-            exit(1)
+def connector_topics(connector_configs):
+    """
+    Return the topics a connector config reads or writes, from its topics, topic.whitelist or kafka.topic field.
+    """
+    topics = ''
+    for topic_field in ('topics', 'topic.whitelist', 'kafka.topic'):
+        if topic_field in connector_configs:
+            topics = connector_configs[topic_field]
+    return [topic for topic in (topic.strip() for topic in topics.split(',')) if topic]
+
+
+def connector_file_topics(connector_file):
+    """
+    Return the topics used by a connector file, or None if the file cannot be read, e.g. because it was removed.
+    """
+    try:
+        return connector_topics(json.loads(render_connector_config(connector_file)))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def verify_topic_in_connector(connector_name, topic):
+    """
+    Check in the cluster snapshot that a topic used by a connector exists.
+
+    Returns:
+    bool: True if the topic exists.
+    """
+    if get_cluster_snapshot().has_topic(topic):
+        logger.info(f"Topic {topic} for connector {connector_name} currently exists")
+        return True
+    logger.error(f"Topic {topic} for connector {connector_name} currently does not exist")
+    return False
 
 
 def delete_connector(connector_file):
+    """
+    Delete the connector named after the given connector json file.
+
+    Parameters:
+    - connector_file (str): The path of the connector json file. The file name is the connector name.
+
+    Returns:
+    Outcome: The result of deleting the connector.
+    """
     # Remove a connector
     connector_name = connector_file.split("/connectors/")[1].replace(".json","")
-    connect_rest_url = build_connect_rest_url(CONNECT_REST_URL, connector_name)
+    connect_rest_url = build_connect_rest_url(current_target().connect_rest_url, connector_name)
+
+    started = time.monotonic()
+    response = connect_session().delete(connect_rest_url, headers=HEADERS)
+    request = f"DELETE {connect_rest_url}"
+    if response.status_code == 204:
+        logger.info(f"The connector {connector_name} has been successfully deleted")
+        get_connect_snapshot().forget_connector(connector_name)
+        return get_changelog().record(Outcome('connector', connector_name, 'delete', SUCCEEDED), request,
+                                      f"The connector {connector_name} has been successfully deleted", started)
+    else:
+        logger.error(f"The connector {connector_name} returned {str(response.status_code)} due to the following reason: {response.text}")
+        return get_changelog().record(Outcome('connector', connector_name, 'delete', FAILED, f"{response.status_code} - {response.text}"), request,
+                                      f"The connector {connector_name} returned {str(response.status_code)} due to the following reason: {response.text}", started)
+
+
+def connector_operation(filename, action, env=None, cache=None):
+    """
+    Build the operation that deploys or deletes a connector.
+
+    Returns:
+    Operation: The operation, or None if the rendered connector config was already deployed by an earlier run.
+    """
+    connector_name = filename.split("/connectors/")[1].replace(".json", "")
+    application = application_of(filename)
+    if action == 'delete':
+        return Operation('connector', connector_name, action, delete_connector, (filename,), (application, env, None))
+
+    definition_hash = connector_hash(filename)
+    if cache and definition_hash and cache.applied_hashes(application, env, 'connector').get(connector_name) == definition_hash:
+        logger.info(f"Skipping the connector {connector_name} because it was already deployed")
+        return None
+    return Operation('connector', connector_name, action, process_connector_changes, (filename,), (application, env, definition_hash))
+
+
+def record_outcomes(cache, phases, outcomes, scope=None):
+    """
+    Record the result of every operation in the resource cache.
+
+    Succeeded deletions are removed from the cache. Other operations store their definition hash and result,
+    so only resources that were applied successfully are skipped by the next run.
+
+    Parameters:
+    - cache (ResourceCache): The cache to update.
+    - phases (list of tuples): The phases passed to run_graph or run_phases.
+    - outcomes (list of Outcome): The outcomes returned by run_graph or run_phases, in the same order as the operations.
+    - scope (str): Optional name the entries are recorded under instead of the environment, e.g. a cluster target.
+    """
+    operations = [operation for _, phase_operations in phases for operation in phase_operations]
+    for operation, outcome in zip(operations, outcomes):
+        if not operation.cache_entry:
+            continue
+        application, env, definition_hash = operation.cache_entry
+        env = scope or env
+        if operation.action == 'delete':
+            if outcome.status == SUCCEEDED:
+                cache.forget(application, env, operation.resource_type, operation.resource_id)
+        elif definition_hash:
+            cache.record(application, env, operation.resource_type, operation.resource_id, definition_hash, outcome.status)
+
+
+def load_resources_from_git(blob_reader, revision, filename):
+    """
+    Read a json resource file as it was at the given revision.
 
+    Parameters:
+    - blob_reader (GitBlobReader): The reader used to read the file from git.
+    - revision (str): The git revision, e.g. HEAD or HEAD~1.
+    - filename (str): The path of the resource file in the repository.
+
+    Returns:
+    list: The resources in the file, or an empty list if the file did not exist at that revision.
+          Files larger than STREAMING_THRESHOLD_BYTES are returned as a lazy iterator of (resource_id, definition) tuples.
+    """
+    stream = blob_reader.open(revision, filename)
+    if stream is None:
+        # if the file was added or removed in this commit there is nothing to compare against
+        return []
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(0)
+    if size > STREAMING_THRESHOLD_BYTES:
+        # Large files are spooled to disk by the reader and diffed as a stream, never loaded in full
+        return iter_resource_stream(stream)
+    with stream:
+        content = stream.read()
+    if not content:
+        return []
     try:
-        response = requests.delete(connect_rest_url, auth=(CONNECT_BASIC_AUTH_USER, CONNECT_BASIC_AUTH_PASS), headers=HEADERS)
+        return json.loads(content)
     except json.decoder.JSONDecodeError as error:
-        # if the connector Json is invalid, log the error
-        logger.error(f"Invalid connector JSON due to - {error}")
+        logger.error(f"{filename} at {revision} is not valid json - {error}")
+        return []
+
+
+def attach_cache_entries(operations, application, env, feature_hashes):
+    for operation in operations:
+        definition_hash = None if operation.action == 'delete' else feature_hashes.get(operation.resource_id)
+        operation.cache_entry = (application, env, definition_hash)
+
+
+def build_change_set(changes, env, blob_reader, previous_revision='HEAD~1', latest_revision='HEAD', cache=None, users=True):
+    """
+    Diff every changed file and collect the resulting operations, grouped by the phase they run in.
+
+    Resources whose definition hash matches the one last applied successfully, according to the resource
+    cache, are left out of the change set.
+
+    Parameters:
+    - changes (list of FileChange): The changed files, from file_changes.changes_from_git_diff.
+    - env (str): The environment being deployed.
+    - blob_reader (GitBlobReader): The reader used to read both revisions of the changed files. Any object with
+      the same open(revision, path) method can be used, e.g. blob_fetcher.GitHubBlobFetcher.
+    - previous_revision (str): The revision the changes are compared against.
+    - latest_revision (str): The revision being deployed.
+    - cache (ResourceCache): Optional cache of the resources applied by earlier runs.
+    - users (bool): Look up the SCRAM users of the new ACLs on the current cluster. When False the user phase
+      is left empty, see add_user_phase.
+
+    Returns:
+    list: (phase_name, list of Operation) tuples in the order the phases must run.
+    """
+    topic_upserts, topic_deletes = [], []
+    acl_adds, acl_deletes = [], []
+    connector_deploys, connector_deletes = [], []
+
+    for change in changes:
+        filename = change.path
+        if filename.endswith(f"topics_{env}.json"):
+            application = application_of(filename)
+            applied_hashes = cache.applied_hashes(application, env, 'topic') if cache else None
+            feature_hashes = {}
+            source_topics = load_resources_from_git(blob_reader, previous_revision, change.previous_path or filename)
+            feature_topics = load_resources_from_git(blob_reader, latest_revision, filename)
+            with get_metrics().timed('stage', 'diff topics'):
+                changed_topics = find_changed_topics(source_topics, feature_topics, applied_hashes, feature_hashes)
+            upserts, deletes = process_changed_topics(changed_topics)
+            attach_cache_entries(upserts + deletes, application, env, feature_hashes)
+            topic_upserts.extend(upserts)
+            topic_deletes.extend(deletes)
+
+        if filename.endswith(f"acls_{env}.json"):
+            application = application_of(filename)
+            applied_hashes = cache.applied_hashes(application, env, 'acl') if cache else None
+            feature_hashes = {}
+            source_acls = load_resources_from_git(blob_reader, previous_revision, change.previous_path or filename)
+            feature_acls = load_resources_from_git(blob_reader, latest_revision, filename)
+            with get_metrics().timed('stage', 'diff acls'):
+                changed_acls = find_changed_acls(source_acls, feature_acls, applied_hashes, feature_hashes)
+            adds, deletes = add_or_remove_acls(changed_acls)
+            attach_cache_entries(adds + deletes, application, env, feature_hashes)
+            acl_adds.extend(adds)
+            acl_deletes.extend(deletes)
+
+        if ("/connectors/" in filename) and filename.endswith(f"-{env}.json"):
+            if change.status == RENAMED:
+                connector_deletes.append(connector_operation(change.previous_path, 'delete', env, cache))
+            if change.status == FILE_REMOVED:
+                connector_deletes.append(connector_operation(filename, 'delete', env, cache))
+            else:
+                connector_deploys.append(connector_operation(filename, 'deploy', env, cache))
+
+    connector_deploys = [operation for operation in connector_deploys if operation is not None]
+
+    # Topics are created before the ACLs and connectors that reference them, and deleted after them
+    return [
+        ('topic', topic_upserts),
+        ('user', scram_user_operations(acl_adds) if users else []),
+        ('acl', acl_adds),
+        ('connector', connector_deploys),
+        ('connector removal', connector_deletes),
+        ('acl removal', acl_deletes),
+        ('topic removal', topic_deletes),
+    ]
+
+
+def acl_covers_topic(acl, topic_name):
+    """
+    Return True if an ACL binding applies to the given topic.
+    """
+    if str(acl.get('resource_type')).upper() != 'TOPIC':
+        return False
+    if acl.get('resource_name') == '*' or acl.get('resource_name') == topic_name:
+        return True
+    return str(acl.get('pattern_type')).upper() == 'PREFIXED' and topic_name.startswith(acl.get('resource_name', ''))
+
+
+class AclIndex:
+    """
+    Index of ACL operations by the topics they apply to, so the topic of each ACL is found without a full scan.
+    """
 
-    with open('CHANGELOG.md', 'a') as f:
-        if response.status_code == 204:
-            logger.info(f"The connector {connector_name} has been successfully deleted")
-            f.writelines(f"{datetime.now()} - The connector {connector_name} has been successfully deleted\n")
+    def __init__(self):
+        self.acls = {}
+        self.literal = {}
+        self.patterns = []
+
+    @staticmethod
+    def is_pattern(acl):
+        return str(acl.get('pattern_type')).upper() != 'LITERAL' or acl.get('resource_name') == '*'
+
+    def add(self, index, acl):
+        self.acls[index] = acl
+        if str(acl.get('resource_type')).upper() != 'TOPIC':
+            return
+        if self.is_pattern(acl):
+            self.patterns.append(index)
         else:
-            logger.error(f"The connector {connector_name} returned {str(response.status_code)} due to the following reason: {response.text}")
-            f.writelines(f"{datetime.now()} - The connector {connector_name} returned {str(response.status_code)} due to the following reason: {response.text}\n")
+            self.literal.setdefault(acl['resource_name'], []).append(index)
 
+    def on_topic(self, topic_name):
+        """
+        Return the indexes of the ACL operations that apply to a topic.
+        """
+        return self.literal.get(topic_name, []) + [index for index in self.patterns
+                                                   if acl_covers_topic(self.acls[index], topic_name)]
 
-def deploy_changes(current_acls, current_topics, files_list, previous_acls, previous_topics, env):
-    for file in files_list:
-        if f"topics_{env}.json" in file:
-            filename = file.split(" ")[1]
-            current_topics_command = f"git show HEAD:{filename} > {current_topics}"
-            previous_topics_command = f"git show HEAD~1:{filename} > {previous_topics}"
 
-            subprocess.run(current_topics_command, stdout=PIPE, stderr=PIPE, shell=True)
-            subprocess.run(previous_topics_command, stdout=PIPE, stderr=PIPE, shell=True)
-            try:
-                with open(previous_topics, 'r') as previous_topics_file:
-                    source_topics = json.load(previous_topics_file)
-            except json.decoder.JSONDecodeError as error:
-                # if this is the first topic(s) for an application, we create an empty list for the previous topics
-                logger.error(error)
-                source_topics = []
-            try:
-                with open(current_topics, 'r') as current_topics_file:
-                    feature_topics = json.load(current_topics_file)
-            except json.decoder.JSONDecodeError as error:
-                # if one deletes all the topic(s) for an application, we create an empty list for the current topics
-                logger.error(error)
-                feature_topics = []
-            changed_topics = find_changed_topics(source_topics, feature_topics)
-            process_changed_topics(changed_topics)
-
-        if f"acls_{env}.json" in file:
-            filename = file.split(" ")[1]
-            current_acls_command = f"git show HEAD:{filename} > {current_acls}"
-            previous_acls_command = f"git show HEAD~1:{filename} > {previous_acls}"
-            subprocess.run(current_acls_command, stdout=PIPE, stderr=PIPE, shell=True)
-            subprocess.run(previous_acls_command, stdout=PIPE, stderr=PIPE, shell=True)
-            try:
-                with open(previous_acls, 'r') as previous_acls_file:
-                    source_acls = json.load(previous_acls_file)
-            except json.decoder.JSONDecodeError as error:
-                # if this is the first acl(s) for an application, we create an empty list for the previous acls
-                logger.error(error)
-                source_acls = []
+def operation_dependencies(phases):
+    """
+    Build the dependency graph of a change set for apply_engine.run_graph.
+
+    A topic is created or updated before the ACLs on it, and those before the connectors that use the topic.
+    A user is created before the ACLs granted to it. Removals run the other way round: a connector is deleted
+    before the ACLs on its topics, and those before the topic itself. A connector whose topics cannot be read,
+    e.g. because its file was removed, is treated as using every topic of the change set.
+
+    Every deletion of a topic or an ACL also waits for all connector deploys, since an updated connector may have
+    used the topic in the previous revision and only stops using it once it is deployed. The connector file only
+    holds the topics of the latest revision, so the deploys the deletion really waits for are not known.
+
+    Parameters:
+    - phases (list of tuples): (phase_name, list of Operation) as returned by build_change_set.
+
+    Returns:
+    dict: {index: set of indexes} of the prerequisites of each operation, in phase order.
+    """
+    operations = [operation for _, phase_operations in phases for operation in phase_operations]
+    topic_upserts, topic_deletes, user_creates = {}, {}, {}
+    acl_creates, acl_deletes = AclIndex(), AclIndex()
+    connector_deploys, connector_deletes = [], []
+    for index, operation in enumerate(operations):
+        if operation.resource_type == 'topic':
+            (topic_deletes if operation.action == 'delete' else topic_upserts)[operation.resource_id] = index
+        elif operation.resource_type == 'user':
+            user_creates[f'User:{operation.resource_id}'] = index
+        elif operation.resource_type == 'acl':
+            (acl_deletes if operation.action == 'delete' else acl_creates).add(index, operation.args[0])
+        elif operation.resource_type == 'connector':
+            topics = connector_file_topics(operation.args[0])
+            (connector_deletes if operation.action == 'delete' else connector_deploys).append((index, topics))
+
+    prerequisites = {}
+    for index, acl in acl_creates.acls.items():
+        topic_names = topic_upserts if AclIndex.is_pattern(acl) else [acl.get('resource_name')]
+        prerequisites[index] = {topic_upserts[topic_name] for topic_name in topic_names
+                                if topic_name in topic_upserts and acl_covers_topic(acl, topic_name)}
+        if acl.get('principal') in user_creates:
+            prerequisites[index].add(user_creates[acl['principal']])
+    for index, topics in connector_deploys:
+        prerequisites[index] = set()
+        for topic_name in (topic_upserts if topics is None else topics):
+            if topic_name in topic_upserts:
+                prerequisites[index].add(topic_upserts[topic_name])
+            prerequisites[index].update(acl_creates.on_topic(topic_name))
+
+    for index, topics in connector_deletes:
+        for topic_name in (topic_deletes if topics is None else topics):
+            for acl_index in acl_deletes.on_topic(topic_name):
+                prerequisites.setdefault(acl_index, set()).add(index)
+            if topic_name in topic_deletes:
+                prerequisites.setdefault(topic_deletes[topic_name], set()).add(index)
+    for topic_name, index in topic_deletes.items():
+        prerequisites.setdefault(index, set()).update(acl_deletes.on_topic(topic_name))
+    deploy_indexes = {index for index, _ in connector_deploys}
+    for index in list(topic_deletes.values()) + list(acl_deletes.acls):
+        prerequisites.setdefault(index, set()).update(deploy_indexes)
+    return {index: indexes for index, indexes in prerequisites.items() if indexes}
+
+
+def policy_documents(phases):
+    """
+    Describe every resource a change set creates or updates as a document for the policy.
+
+    Topic updates are described by the fields they change only. Connector files that cannot be rendered are
+    reported as violations directly.
+
+    Returns:
+    tuple: (documents, violations) where documents are (kinds, resource_type, resource_id, document) tuples
+    for Policy.check.
+    """
+    documents, violations = [], []
+    for _, operations in phases:
+        for operation in operations:
+            if operation.action == 'delete':
+                continue
+            if operation.resource_type == 'topic' and operation.action == 'create':
+                topic = operation.args[0]
+                configs = {config.get('name'): config.get('value') for config in topic.get('configs', [])}
+                documents.append((('topic', 'new_topic'), 'topic', operation.resource_id,
+                                  topic_document(topic.get('topic_name'), topic.get('partitions_count'),
+                                                 topic.get('replication_factor'), configs)))
+            elif operation.resource_type == 'topic':
+                topic_name, topic_config = operation.args
+                partition_changes = [change.new_value for change in topic_config
+                                     if change.kind in (PARTITION_INCREASE, PARTITION_DECREASE)]
+                configs = {change.name: change.new_value for change in topic_config if change.kind == CONFIG_SET}
+                documents.append((('topic',), 'topic', topic_name,
+                                  topic_document(topic_name, partition_changes[0] if partition_changes else None,
+                                                 configs=configs)))
+            elif operation.resource_type == 'acl':
+                documents.append((('acl',), 'acl', operation.resource_id, operation.args[0]))
+            elif operation.resource_type == 'connector':
+                try:
+                    connector_configs = json.loads(render_connector_config(operation.args[0]))
+                except KeyError as e:
+                    violations.append(Violation('connector', operation.resource_id, '', f"the environment variable {e} is not set"))
+                    continue
+                except (OSError, ValueError) as e:
+                    violations.append(Violation('connector', operation.resource_id, '', f"the connector file can not be read - {e}"))
+                    continue
+                documents.append((('connector',), 'connector', operation.resource_id, connector_configs))
+    return documents, violations
+
+
+def check_policy(phases, env):
+    """
+    Check every resource a change set creates or updates against the policy of the environment, in one pass
+    and before anything is applied. Every violation is logged, so they can all be fixed at once.
+
+    Returns:
+    list: Violation objects. The list is empty if the change set may be applied.
+    """
+    with get_metrics().timed('stage', 'policy'):
+        documents, violations = policy_documents(phases)
+        violations.extend(get_policy(env).check(documents))
+    for violation in violations:
+        logger.error(f"Policy violation in {env} - {violation}")
+    if violations:
+        logger.error(f"The change set breaks {len(violations)} policy rule(s) of {env}, nothing will be applied")
+    return violations
+
+
+def rejected_outcomes(phases, violations):
+    """
+    Build the outcomes of a change set rejected by the policy: the resources that break it fail and every
+    other change is skipped.
+
+    Returns:
+    list: One Outcome per operation, in phase order.
+    """
+    rejected = {}
+    for violation in violations:
+        rejected.setdefault((violation.resource_type, violation.resource_id), violation)
+    outcomes = []
+    for _, operations in phases:
+        for operation in operations:
+            violation = rejected.get((operation.resource_type, operation.resource_id))
+            if violation:
+                outcomes.append(Outcome(operation.resource_type, operation.resource_id, operation.action, FAILED,
+                                        f"policy violation - {violation}"))
+            else:
+                outcomes.append(operation.skip("the change set breaks the policy"))
+    return outcomes
+
+
+def plan_fingerprint(phases):
+    """
+    Fingerprint the current cluster state of the resources a change set touches.
+    """
+    topic_names, acls = plan_resources(phases)
+    return get_cluster_snapshot().fingerprint(topic_names, acls)
+
+
+def is_resource_file(filename, env):
+    """
+    Return True if a changed file is a topics, acls or connector file of the environment.
+    """
+    return (filename.endswith((f"topics_{env}.json", f"acls_{env}.json"))
+            or ("/connectors/" in filename and filename.endswith(f"-{env}.json")))
+
+
+def change_set_key(changes, env, blob_reader, previous_revision, latest_revision):
+    """
+    Identify the change set of a commit by the contents of the resource files it changes, not by commit SHAs.
+
+    A pull request and the merge or squash commit that lands it change the same files from and to the same
+    blobs, so both get the same key even though their SHAs differ. If one of these files changed on the base
+    branch in between, the key differs and the plan of the pull request is not used.
+
+    Parameters:
+    - changes (list of FileChange): The changed files.
+    - env (str): The environment being deployed.
+    - blob_reader (GitBlobReader): Any reader with a blob_sha(revision, path) method.
+    - previous_revision (str): The revision the changes are compared against.
+    - latest_revision (str): The revision being deployed.
+
+    Returns:
+    str: The sha256 of the environment and the blob SHAs of every changed resource file on both sides.
+    """
+    entries = sorted([change.path, change.previous_path or change.path,
+                      blob_reader.blob_sha(previous_revision, change.previous_path or change.path),
+                      blob_reader.blob_sha(latest_revision, change.path)]
+                     for change in changes if is_resource_file(change.path, env))
+    return resource_hash([env, entries])
+
+
+def plan_changes(changes, env, blob_reader, previous_revision, latest_revision, path=None):
+    """
+    Build the change set of a commit without applying it and write it to a plan file.
+
+    Parameters:
+    - changes (list of FileChange): The changed files.
+    - env (str): The environment being deployed.
+    - blob_reader (GitBlobReader): The reader used to read both revisions of the changed files.
+    - previous_revision (str): The commit SHA the changes are compared against.
+    - latest_revision (str): The commit SHA being deployed.
+    - path (str): The plan file. Defaults to plan.plan_path of the change set key.
+
+    Returns:
+    list: The planned (phase_name, list of Operation) tuples, or None if the change set breaks the policy. The
+    user phase is left empty, SCRAM users are looked up when the plan is applied.
+    """
+    with ResourceCache() as cache:
+        phases = build_change_set(changes, env, blob_reader, previous_revision, latest_revision, cache, users=False)
+    if check_policy(phases, env):
+        return None
+    change_key = change_set_key(changes, env, blob_reader, previous_revision, latest_revision)
+    write_plan(phases, path or plan_path(change_key), change_key, env, plan_fingerprint(phases), latest_revision,
+               previous_revision)
+    return phases
+
+
+def load_matching_plan(changes, env, blob_reader, previous_revision, latest_revision, path=None):
+    """
+    Load the plan written for the same file changes if it still applies.
+
+    The plan is looked up by the change set key, so a plan written by the dry run of a pull request is found
+    after the pull request is merged or squashed. It is only used if it was built for the same environment and
+    file contents, and the resources it touches are still in the state they were in when it was built.
+
+    Returns:
+    list: The planned (phase_name, list of Operation) tuples, or None if the change set must be rebuilt.
+    """
+    change_key = change_set_key(changes, env, blob_reader, previous_revision, latest_revision)
+    path = path or plan_path(change_key)
+    plan, phases = read_plan(path, PLAN_FUNCTIONS)
+    if plan is None:
+        logger.info(f"There is no plan for these changes at {path}, building the change set")
+        return None
+    if (plan['env'], plan['change_key']) != (env, change_key):
+        logger.info(f"The plan {path} was built for other changes or another environment, rebuilding the change set")
+        return None
+    try:
+        fingerprint = plan_fingerprint(phases)
+    except Exception as e:
+        # Every operation reads the same snapshot, so the rebuilt change set reports the error per operation
+        logger.error(f"The cluster could not be listed to check the plan {path} due to - {e}, rebuilding the change set")
+        return None
+    if plan['fingerprint'] != fingerprint:
+        logger.info(f"The cluster changed since the plan {path} was built, rebuilding the change set")
+        return None
+    logger.info(f"Applying the plan {path} without diffing again")
+    return phases
+
+
+def wait_for_deployed_connectors(outcomes, max_workers=MAX_WORKERS, stage='wait for connectors'):
+    """
+    Wait for the connectors deployed by a run to reach RUNNING, unless CONNECTOR_WAIT_TIMEOUT is 0.
+
+    Returns:
+    list: One 'wait' Outcome per deployed connector, see connector_status.wait_for_connectors.
+    """
+    connector_names = deployed_connectors(outcomes)
+    if not connector_names or CONNECTOR_WAIT_TIMEOUT <= 0:
+        return []
+    with get_metrics().timed('stage', stage):
+        return wait_for_connectors(connector_names, max_workers=max_workers)
+
+
+def deploy_changes(changes, env, previous_revision='HEAD~1', latest_revision='HEAD', use_plan=True):
+    """
+    Build the full change set for the changed files, or load its plan, check it against the policy and apply it
+    with the apply engine, then wait for the deployed connectors to run.
+
+    Parameters:
+    - changes (list of FileChange): The changed files.
+    - env (str): The environment being deployed.
+    - previous_revision (str): The revision the changes are compared against.
+    - latest_revision (str): The revision being deployed.
+    - use_plan (bool): Apply the plan written for the same file changes when it still matches the cluster.
+
+    Returns:
+    list: A list of Outcome objects, one per applied change, followed by one per deployed connector. If the change
+    set breaks the policy nothing is applied, see rejected_outcomes.
+    """
+    with ResourceCache() as cache:
+        with GitBlobReader() as blob_reader:
+            phases = load_matching_plan(changes, env, blob_reader, previous_revision, latest_revision) if use_plan else None
+            if phases is None:
+                with get_metrics().timed('stage', 'build change set'):
+                    phases = build_change_set(changes, env, blob_reader, previous_revision, latest_revision, cache,
+                                              users=False)
+        violations = check_policy(phases, env)
+        if violations:
+            return rejected_outcomes(phases, violations)
+        # SCRAM users are only looked up once the change set has passed the policy. Plans never hold them.
+        phases = admin_batching(add_user_phase(phases))
+        with get_metrics().timed('stage', 'apply'):
+            outcomes = run_graph(phases, operation_dependencies(phases), MAX_WORKERS)
+            outcomes += refresh_after_apply()
+        record_outcomes(cache, phases, outcomes)
+    return outcomes + wait_for_deployed_connectors(outcomes)
+
+
+def skip_applied(phases, cache, scope):
+    """
+    Leave out the operations whose definition hash was already applied successfully under the given cache scope.
+
+    Returns:
+    list: The phases without the already applied operations.
+    """
+    applied = {}
+    remaining = []
+    for phase_name, operations in phases:
+        kept = []
+        for operation in operations:
+            if operation.cache_entry and operation.action != 'delete':
+                application, _, definition_hash = operation.cache_entry
+                key = (application, operation.resource_type)
+                if key not in applied:
+                    applied[key] = cache.applied_hashes(application, scope, operation.resource_type)
+                if definition_hash and applied[key].get(operation.resource_id) == definition_hash:
+                    logger.info(f"Skipping the {operation.resource_type} {operation.resource_id} because it was already applied")
+                    continue
+            kept.append(operation)
+        remaining.append((phase_name, kept))
+    return remaining
+
+
+def admin_batching(phases):
+    """
+    Drop the Admin client batches of a change set if the current cluster target has no Admin client, so its topic
+    config updates and ACL deletions run one by one on the REST Proxy, concurrently, instead of serially inside
+    a batch.
+
+    The change set itself is left untouched, since under fan-out it is shared by targets with and without an
+    Admin client.
+
+    Returns:
+    list: The phases with the operations to run for the current target.
+    """
+    if admin_available():
+        return phases
+    return [(phase_name, [replace(operation, batch=None) if operation.batch in ADMIN_BATCHES else operation
+                          for operation in operations])
+            for phase_name, operations in phases]
+
+
+def add_user_phase(phases):
+    """
+    Fill the user phase of a change set built with users=False for the current cluster target.
+    """
+    acl_adds = [operation for phase_name, operations in phases if phase_name == 'acl' for operation in operations]
+    return [(phase_name, scram_user_operations(acl_adds) if phase_name == 'user' else operations)
+            for phase_name, operations in phases]
+
+
+def refresh_after_apply():
+    """
+    Re-read the snapshots of the current cluster target once a change set was applied.
+
+    Returns:
+    list: A failed 'refresh' Outcome for the target if the snapshots could not be read, otherwise an empty list,
+    so the outcomes of the applied changes are kept either way.
+    """
+    try:
+        refresh_cluster_snapshot()
+    except Exception as e:
+        logger.error(f"The snapshot of the cluster {current_target().name} could not be refreshed due to - {e}")
+        return [Outcome('cluster', current_target().name, 'refresh', FAILED, str(e))]
+    return []
+
+
+def deploy_to_target(target, phases):
+    """
+    Apply a change set to one cluster target with the target's own sessions, snapshot and concurrency limit.
+
+    Operations already applied to the target, according to the resource cache entries recorded under the
+    target name, are skipped.
+
+    Returns:
+    list: A list of Outcome objects, one per applied change, followed by one per deployed connector.
+    """
+    with use_target(target), ResourceCache() as cache:
+        logger.info(f"Deploying to the cluster {target.name} ({target.env}) with {target.max_workers} worker(s)")
+        phases = admin_batching(add_user_phase(skip_applied(phases, cache, target.name)))
+        with get_metrics().timed('stage', f'apply {target.name}'):
+            outcomes = run_graph(phases, operation_dependencies(phases), target.max_workers)
+            outcomes += refresh_after_apply()
+        record_outcomes(cache, phases, outcomes, scope=target.name)
+        return outcomes + wait_for_deployed_connectors(outcomes, target.max_workers,
+                                                       f'wait for connectors {target.name}')
+
+
+def deploy_to_targets(changes, targets, previous_revision='HEAD~1', latest_revision='HEAD'):
+    """
+    Diff the changed files once per environment and apply the change set to every target concurrently.
+
+    Each target runs in its own thread with its own HTTP connection pool, cluster snapshot and worker pool,
+    so a slow or failing cluster does not hold back the others.
+
+    Parameters:
+    - changes (list of FileChange): The changed files.
+    - targets (list of ClusterTarget): The clusters to deploy to.
+    - previous_revision (str): The revision the changes are compared against.
+    - latest_revision (str): The revision being deployed.
+
+    Returns:
+    dict: {target_name: list of Outcome} in the order of targets.
+    """
+    change_sets = {}
+    with GitBlobReader() as blob_reader, get_metrics().timed('stage', 'build change set'):
+        for env in sorted({target.env for target in targets}):
+            change_sets[env] = build_change_set(changes, env, blob_reader, previous_revision, latest_revision, users=False)
+
+    # Nothing is applied anywhere unless the change set of every environment passes its policy
+    violations = {env: check_policy(phases, env) for env, phases in change_sets.items()}
+    if any(violations.values()):
+        return {target.name: rejected_outcomes(change_sets[target.env], violations[target.env]) for target in targets}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(targets) or 1) as executor:
+        futures = {target.name: executor.submit(deploy_to_target, target, change_sets[target.env]) for target in targets}
+        for target in targets:
             try:
-                with open(current_acls, 'r') as current_acls_file:
-                    feature_acls = json.load(current_acls_file)
-            except json.decoder.JSONDecodeError as error:
-                # if one deletes all the acl(s) for an application, we create an empty list for the current acls
-                logger.error(error)
-                feature_acls = []
-            changed_acls = find_changed_acls(source_acls, feature_acls)
-            add_or_remove_acls(changed_acls)
-
-        if ("connectors" in file) and (f"-{env}" in file) and ('D ' in file):
-            filename = file.split(" ")[1]
-            delete_connector(filename)
-        elif (("connectors" in file) and (f"-{env}" in file) and ('M ' in file)) or (("connectors" in file) and (f"-{env}" in file) and ('A ' in file)):
-            filename = file.split(" ")[1]
-            process_connector_changes(filename)
-        elif ("connectors" in file) and (f"-{env}" in file) and ('R' in file):
-            filename = file.split("\t")[0]
-            delete_connector(filename)
-            filename = file.split("\t")[1]
-            process_connector_changes(filename)
-
-
-def main():
+                results[target.name] = futures[target.name].result()
+            except Exception as e:
+                logger.error(f"The deployment to the cluster {target.name} failed due to - {e}")
+                results[target.name] = [Outcome('cluster', target.name, 'deploy', FAILED, str(e))]
+    return results
+
+
+# The batch functions that only batch through the Kafka Admin client
+ADMIN_BATCHES = (alter_topic_configs_batch, delete_acls_batch)
+
+# The functions a plan file may call
+PLAN_FUNCTIONS = {func.__name__: func for func in (add_new_topic, update_existing_topic, delete_topic, create_scram_user,
+                                                    add_new_acl, delete_acl, process_connector_changes, delete_connector,
+                                                    alter_topic_configs_batch, create_acls_batch, delete_acls_batch,
+                                                    create_scram_users_batch)}
+
+
+@click.command()
+@click.option('--plan', 'plan_only', is_flag=True, help='Only build the change set and write it to a plan file.')
+@click.option('--ignore-plan', is_flag=True, help='Rebuild the change set even if a matching plan exists.')
+@click.option('--fan-out', is_flag=True, help='Deploy to every cluster of the inventory instead of the one set by REST_URL.')
+@click.option('--inventory', default=CLUSTER_INVENTORY, show_default=True, help='The cluster inventory used by --fan-out.')
+@click.option('--cluster', 'cluster_names', multiple=True, help='Only deploy to this inventory cluster. Can be repeated.')
+@click.option('--env', 'envs', multiple=True, help='Only deploy to the inventory clusters of this environment. Can be repeated.')
+def main(plan_only, ignore_plan, fan_out, inventory, cluster_names, envs):
     latest_sha = subprocess.run(['git', 'rev-parse', 'HEAD', ], stdout=PIPE, stderr=PIPE).stdout
     previous_sha = subprocess.run(['git', 'rev-parse', 'HEAD~1',], stdout=PIPE, stderr=PIPE).stdout
 
     latest_commit = latest_sha.decode('utf-8').rstrip('\n')
     previous_commit = previous_sha.decode('utf-8').rstrip('\n')
 
-    files = subprocess.run(['git', 'diff', '--name-status', previous_commit, latest_commit], stdout=PIPE, stderr=PIPE).stdout
-    files_string = files.decode('utf-8')
-    files_list = []
-    pattern = re.compile(r'([AMD])\s+(.+)|(R\d{3})\s*(.*)')
-    for match in pattern.finditer(files_string):
-        if match.group(1):  # Check if the first pattern matched
-            files_list.append(match.group(1) + ' ' + match.group(2))
-        else:  # The second pattern matched
-            files_list.append(match.group(3) + ' ' + match.group(4))
+    changes = changes_from_git_diff(previous_commit, latest_commit, merge_base=False)
 
-    # files_list = [(match.group(1) or '') + ' ' + (match.group(2) or '') for match in pattern.finditer(files_string)]
-    current_topics = 'application1/topics/current-topics.json'
-    previous_topics = 'application1/topics/previous-topics.json'
+    if fan_out:
+        targets = select_targets(load_inventory(inventory), cluster_names, envs)
+        if not targets:
+            logger.error(f"No cluster of {inventory} matches the selection")
+            exit(1)
+        changelog = start_changelog(latest_commit)
+        try:
+            results = deploy_to_targets(changes, targets, previous_commit, latest_commit)
+        finally:
+            close_sessions()
+            changelog.flush()
+            get_metrics().finish()
+        succeeded = True
+        for target_name, outcomes in results.items():
+            logger.info(f"Results for the cluster {target_name}:")
+            succeeded = summarize_outcomes(outcomes) and succeeded
+        if not succeeded:
+            exit(1)
+        return
 
-    current_acls = 'application1/acls/current-acls.json'
-    previous_acls = 'application1/acls/previous-acls.json'
+    if plan_only:
+        try:
+            with GitBlobReader() as blob_reader, get_metrics().timed('stage', 'plan'):
+                phases = plan_changes(changes, ENV, blob_reader, previous_commit, latest_commit)
+        finally:
+            close_sessions()
+            get_metrics().finish()
+        if phases is None:
+            exit(1)
+        return
 
-    deploy_changes(current_acls, current_topics, files_list, previous_acls, previous_topics, ENV)
+    changelog = start_changelog(latest_commit)
+    try:
+        outcomes = deploy_changes(changes, ENV, previous_commit, latest_commit, use_plan=not ignore_plan)
+    finally:
+        close_sessions()
+        changelog.flush()
+        get_metrics().finish()
+    if not summarize_outcomes(outcomes):
+        exit(1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
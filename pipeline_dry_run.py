@@ -1,17 +1,18 @@
-import subprocess
-
 from github import Github
-from deepdiff import DeepDiff
-from subprocess import PIPE
+from differ import CONFIG_DELETE, CONFIG_SET, PARTITION_DECREASE, PARTITION_INCREASE, REPLICATION_CHANGE
+from cluster_state import get_cluster_snapshot
+from application_owners import sync_application_owners
+from blob_fetcher import GitHubBlobFetcher, LocalBlobFetcher
+from file_changes import REMOVED as FILE_REMOVED, changes_from_git_diff, changes_from_pull_request
+from pipeline import build_change_set, change_set_key, check_policy, connector_topics, plan_fingerprint, render_connector_config
+from plan import plan_path, write_plan
+from metrics import get_metrics
+from apply_engine import FAILED, SUCCEEDED, Outcome
 
 import click
 import json
 import logging
 import os
-import pandas as pd
-import requests
-import re
-import string
 
 
 # Constant variables
@@ -21,578 +22,174 @@ REST_PROXY_URL = os.getenv('REST_URL')
 CLUSTER_ID = os.getenv('KAFKA_CLUSTER_ID')
 CONNECT_REST_URL = os.getenv('CONNECT_REST_URL')
 REPO = os.getenv('REPO')
-REST_BASIC_AUTH_USER = os.getenv('REST_BASIC_AUTH_USER')
-REST_BASIC_AUTH_PASS = os.getenv('REST_BASIC_AUTH_PASS')
 ENV = os.getenv('env')
-CIGNA_SERVICE_NOW_REST_URL = os.getenv('CIGNA_SERVICE_NOW_REST_URL')
-SERVICE_NOW_USERNAME = os.getenv('SERVICE_NOW_USERNAME')
-SERVICE_NOW_PASSWORD = os.getenv('SERVICE_NOW_PASSWORD')
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def get_files(pr_id):
-    g = Github(GITHUB_TOKEN)
-    repo = g.get_repo(REPO)
-
-    pull_request = repo.get_pull(int(pr_id))
-    commits = pull_request.get_commits()
-
-    head_branch = pull_request.head.ref
-    base_branch = pull_request.base.ref
-    files_list = []
-    for commit in commits:
-        files = commit.files
-        for file in files:
-            files_list.append(f"{file.filename}-{file.status}")
-            files_set = set(files_list)
-
-    return repo, files_set, head_branch, base_branch
-
-
-def get_content_from_branches(repo, filename, head_branch, base_branch):
-    """
-    Retrieve topic configurations from 'main' and 'test' branches of the Kafka Manager repository.
-
-    This function connects to the Kafka Manager repository, retrieves the latest commit,
-    and extracts the topic configurations from the 'main' and 'test' branches.
-
-    Returns:
-    tuple: A tuple containing two dictionaries representing topic configurations.
-        - The first element: Dictionary representing topic configurations from the 'main' branch.
-        - The second element: Dictionary representing topic configurations from the 'test' branch.
-    Raises:
-    Exception: If there is an error in connecting to the repository or retrieving the topic configurations.
-    """
-    try:
-
-        head_file_content = repo.get_contents(filename, ref=head_branch)
-        base_file_content = repo.get_contents(filename, ref=base_branch)
-        head_file_content_json = json.loads(base_file_content.decoded_content)
-        base_file_content_json = json.loads(head_file_content.decoded_content)
-    except Exception as e:
-        logger.error(f"File {filename} is being added for the first time.")
-        current_resources = 'current-resources.json'
-        previous_resources = 'previous-resources.json'
-        current_resources_command = f"git show HEAD:{filename} > {current_resources}"
-        previous_resources_command = f"git show HEAD~1:{filename} > {previous_resources}"
-
-        subprocess.run(current_resources_command, stdout=PIPE, stderr=PIPE, shell=True)
-        subprocess.run(previous_resources_command, stdout=PIPE, stderr=PIPE, shell=True)
-
-        head_file_content_json = json.loads('{}')
-        base_file_content_json = json.loads(head_file_content.decoded_content)
-
-    return head_file_content_json, base_file_content_json
-
-
-def find_changed_topics(source_topics, new_topics):
-    source_topics_dict = {}
-    feature_topics_dict = {}
-
-    for value in source_topics:
-        source_topics_dict.update(value)
-
-    for value in new_topics:
-        feature_topics_dict.update(value)
-
-    changed_topic_names = []
-    # Check for changes and deletions
-    for topic_name, source_topic in source_topics_dict.items():
-        updated_topic = feature_topics_dict.get(topic_name)
-
-        if updated_topic:
-            diff = DeepDiff(source_topic, updated_topic, ignore_order=True)
-            if diff:
-                # Check if this is a partition change
-                try:
-                    change_dict = find_changed_partitions(diff, feature_topics_dict, topic_name)
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-                except KeyError as ke:
-                    logger.info(f"Partitions do not need to be updated - {ke}")
-                    change_dict = find_changed_configs(diff, feature_topics_dict, topic_name)
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-                # Make sure the dict is not empty before adding it to the changed topic names list
-                if not change_dict:
-                    changed_topic_names.append({"type": "update", "changes": change_dict})
-
-        else:
-            # Topic was removed
-            changed_topic_names.append({topic_name: source_topics_dict.get(topic_name), "type": "removed"})
-
-    # Check for new additions
-    for topic_name in feature_topics_dict:
-        if topic_name not in source_topics_dict.keys():
-            changed_topic_names.append({topic_name: feature_topics_dict.get(topic_name), "type": "new"})
-
-    return changed_topic_names
-
-
-def find_changed_partitions(diff, feature_topics_dict, topic_name):
-    if diff['values_changed']["root[\'partitions_count\']"]:
-        for change_type, details in diff.items():
-            change_dict = {
-                "topic_name": topic_name,
-                "changes": []
-            }
-            for change in details:
-                if change == "root[\'partitions_count\']":
-                    configs_changes = re.findall(r"\['(.*?)'\]", change)
-                    change_dict["changes"].append({
-                        configs_changes[0]: details[change]['new_value']
-                    })
-                else:
-                    configs_changes = re.findall(r"configs'\]\[(.*)\]\[", change)
-                    if configs_changes:
-                        for index in configs_changes:
-                            prop_name = feature_topics_dict[topic_name]['configs'][int(index)]
-                            change_dict["changes"].append({
-                                "name": prop_name["name"],
-                                "value": details[change]['new_value']
-                            })
-    return change_dict
-
-
-def find_changed_configs(diff, feature_topics_dict, topic_name):
-    try:
-        if diff['values_changed']:
-            for change_type, details in diff.items():
-                change_dict = {
-                    "topic_name": topic_name,
-                    "changes": []
-                }
-
-                for change in details:
-                    configs_changes = re.findall(r"configs'\]\[(.*)\]\[", change)
-                    if configs_changes:
-                        for index in configs_changes:
-                            prop_name = feature_topics_dict[topic_name]['configs'][int(index)]
-                            change_dict["changes"].append({
-                                "name": prop_name["name"],
-                                "value": details[change]['new_value']
-                            })
-    except KeyError as ke:
-        logger.error(f"Configs could not be updated due to - {ke}")
-    return change_dict
-
-
-def process_changed_topics(changed_topic_names):
-    for i, topic in enumerate(changed_topic_names):
-        topic_name = list(topic.keys())[0]
-        topic_configs = list(topic.values())[0]
-        if topic['type'] == 'new':
-            add_new_topic(topic_configs)
-        elif topic['type'] == 'update':
-            update_existing_topic(topic['changes']['topic_name'], topic['changes']['changes'])
-        else:
-            delete_topic(topic_name)
-
-
-def build_topic_rest_url(base_url, cluster_id):
+def get_files(pr_id, local_diff=False):
     """
-    Build the REST API URL for Kafka topics based on the provided base URL and cluster ID.
+    List the files changed by a pull request.
 
     Parameters:
-    - base_url (str): The base URL of the Kafka REST API.
-    - cluster_id (str): The ID of the Kafka cluster.
+    - pr_id (str): The pull request number.
+    - local_diff (bool): Diff the base and head commits with the local git checkout instead of asking GitHub.
 
     Returns:
-    str: The constructed REST API URL for Kafka topics.
-    """
-    return f'{base_url}/v3/clusters/{cluster_id}/topics/'
-
-
-def add_new_topic(topic):
-    """
-    Add a new Kafka topic using the provided topic configuration.
-
-    Parameters:
-    - topic (dict): Dictionary representing the configuration of the new Kafka topic.
-
+    tuple: (repo, changes, pull_request) where changes is a list of file_changes.FileChange records.
     """
-    topic_name = topic["topic_name"]
-
-    retention_ms = topic['configs'][2]['value']
-    max_message_bytes = topic['configs'][3]['value']
-
-    if retention_ms > 604800000 or retention_ms == -1 or  max_message_bytes > 5242940:
-        logger.error(f"The retention.ms for {topic_name} is larger than 7 days OR the max message bytes is greater than 5 Mebibytes.")
-        exit(1)
-
-    pattern = r'^[a-zA-Z0-9]+(?:[_.-][a-zA-Z0-9]+)*$'
-
-    # Make sure topic name is valid
-    if re.match(pattern, topic_name):
-        logger.info("The topic is alphanumeric and follows the specified delimiter rules.")
-    else:
-        logger.error("The topic name contains invalid characters or does not follow the specified delimiter rules.")
-        exit(1)
-
-    if int(topic["partitions_count"]) > 32:
-        logger.error(f"Partition count can not be higher than 32")
-        exit(1)
+    g = Github(GITHUB_TOKEN)
+    repo = g.get_repo(REPO)
 
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
+    pull_request = repo.get_pull(int(pr_id))
 
-    get_response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if get_response.status_code != 200:
-        logger.info(f"Topic does not already exist. Please proceed with creating the topic")
+    if local_diff:
+        changes = changes_from_git_diff(pull_request.base.sha, pull_request.head.sha)
     else:
-        logger.error(f"Topic already exist. Will not create a the topic {topic_name}")
-        exit(1)
+        changes = changes_from_pull_request(pull_request)
 
-    logger.info(f"The topic {topic['topic_name']} will be created once the PR is merged")
+    return repo, changes, pull_request
 
 
-def update_existing_topic(topic_name, topic_config):
+def check_topic(operation, planned_topics):
     """
-    Update an existing Kafka topic based on the provided topic configuration.
-
-    Parameters:
-    - topic_name (str): The name of the Kafka topic to be updated.
-    - topic_config (dict): Dictionary containing the configuration changes for the Kafka topic.
+    Check a topic operation of the change set against the cluster snapshot, as the pipeline will apply it.
 
-    Raises:
-    SystemExit: If any of the update steps fail, the program exits with status code 1.
+    Returns:
+    Outcome: A failed outcome if the pipeline would fail to apply the operation.
+    """
+    topic_name = operation.resource_id
+    current_topic_definition = get_cluster_snapshot().get_topic(topic_name)
+    if operation.action == 'create' and current_topic_definition is not None:
+        return operation_outcome(operation, FAILED, "topic already exists")
+    if operation.action in ('update', 'delete') and current_topic_definition is None:
+        return operation_outcome(operation, FAILED, "topic does not exist")
+    if operation.action == 'create':
+        planned_topics.add(topic_name)
+        return operation_outcome(operation, SUCCEEDED, f"{operation.args[0].get('partitions_count')} partition(s)")
+    if operation.action == 'delete':
+        planned_topics.discard(topic_name)
+        return operation_outcome(operation, SUCCEEDED)
+
+    details = []
+    for change in operation.args[1]:
+        if change.kind in (PARTITION_INCREASE, PARTITION_DECREASE):
+            if int(change.new_value) < current_topic_definition['partitions_count']:
+                return operation_outcome(operation, FAILED, "cannot reduce partition count")
+            details.append(f"partitions {current_topic_definition['partitions_count']} -> {change.new_value}")
+        elif change.kind == REPLICATION_CHANGE:
+            details.append(f"replication factor {change.old_value} -> {change.new_value} is ignored by the REST Proxy")
+        elif change.kind in (CONFIG_SET, CONFIG_DELETE):
+            details.append(json.dumps(change.to_config()))
+    return operation_outcome(operation, SUCCEEDED, ', '.join(details))
+
+
+def check_connector(operation, planned_topics):
+    """
+    Check that every topic a connector uses exists on the cluster or is created earlier in the change set.
 
-    Notes:
-    This function first retrieves the current definition of the topic by making a GET request to the Kafka REST API.
-    It then updates the replication factor and partition count using helper functions.
-    Finally, it alters the topic configurations using a POST request to the Kafka REST API.
+    Returns:
+    Outcome: A failed outcome if the connector file can not be rendered or uses a missing topic.
     """
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-    response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if response.status_code != 200:
-        logger.error(f"The topic {topic_name} failed to be updated due to {response.status_code} - {response.text}")
-        exit(1)
-
-    current_topic_definition = response.json()
-    # Check if the requested update is a config change
+    if operation.action == 'delete':
+        return operation_outcome(operation, SUCCEEDED)
     try:
-        if'name' in topic_config[0].keys():
-            update_topic_configs(topic_config, topic_name)
-        elif ('partitions_count' in topic_config[0].keys()) and ('name' in topic_config[1].keys()):
-            update_partition_count(current_topic_definition, topic_config[0]['partitions_count'], topic_name)
-            topic_config.pop(0)
-            update_topic_configs(topic_config, topic_name)
-    except IndexError:
-        logger.info(f"Partition count for {topic_name} needs to be updated")
-    if 'partitions_count' in topic_config[0].keys() and len(topic_config[0].keys()) == 1:
-        update_partition_count(current_topic_definition, topic_config[0]['partitions_count'], topic_name)
-
-
-def update_topic_configs(topic_config, topic_name):
-    # Check if retention.ms is greater than 7 days and if max.message.bytes is more than 5 Mebibytes
-    for config in topic_config:
-        if (config['name'] == 'retention.ms' and config['value'] > 604800000) or (config['name'] == 'retention.ms' and config['value'] == -1):
-            logger.error(f"The retention.ms for {topic_name} is larger than 7 days")
-            exit(1)
-        if config['name'] == 'max.message.bytes' and config['value'] > 5242940:
-            logger.error(f"The max.message.bytes for {topic_name} is greater than 5 Mebibytes.")
-            exit(1)
-
-    updated_Configs = "{\"data\":" + json.dumps(topic_config) + "}"
-    logger.info("altering configs to " + updated_Configs)
-
-
-def update_partition_count(current_topic_definition, partition_count, topic_name):
-    """
-    Update the partition count for a Kafka topic based on the provided configuration.
+        topics = connector_topics(json.loads(render_connector_config(operation.args[0])))
+    except KeyError as e:
+        return operation_outcome(operation, FAILED, f"the environment variable {e} is not set")
+    except (OSError, ValueError) as e:
+        return operation_outcome(operation, FAILED, f"the connector file can not be read - {e}")
+    for topic in topics:
+        if topic not in planned_topics:
+            return operation_outcome(operation, FAILED, f"topic {topic} does not exist")
+    return operation_outcome(operation, SUCCEEDED, f"topics {', '.join(topics)}" if topics else '')
 
-    Parameters:
-    - current_topic_definition (dict): Dictionary representing the current configuration of the Kafka topic.
-    - partition_count (str): Partition count.
-    - topic_name (str): The name of the Kafka topic.
 
-    Raises:
-    SystemExit: If the partition count update fails, the program exits with status code 1.
+def operation_outcome(operation, status, detail=''):
     """
-    current_partitions_count = current_topic_definition['partitions_count']
-
-    # Check if the requested update is the partition count
-    try:
-        new_partition_count = int(partition_count)
-        if new_partition_count == current_partitions_count:
-            logger.info(f"Requested partition count and current partition count is the same - {new_partition_count}")
-        if new_partition_count > 32:
-            logger.error(f"Partition count can not be higher than 32")
-            exit(1)
-        if new_partition_count > current_partitions_count:
-            logger.info(f"A requested increase of partitions for topic  {topic_name} is from "
-                        f"{str(current_partitions_count)} to {str(new_partition_count)}")
-        elif new_partition_count < current_partitions_count:
-            logger.error("Cannot reduce partition count for a given topic")
-            exit(1)
-    except Exception as e:
-        logger.error("Failed due to " + e)
-
-
-def delete_topic(topic_name):
-    """
-    Delete a Kafka topic based on the provided topic configuration.
-
-    Parameters:
-    - topic (dict): Dictionary representing the configuration of the Kafka topic, including the topic name.
-
-    Raises:
-    SystemExit: If the deletion fails, the program exits with status code 1.
-
-    Notes:
-    This method first checks if the topic exists by making a GET request to the Kafka REST API.
-    If the topic exists, it proceeds to delete the topic using a DELETE request.
+    Log what the pipeline will do for an operation once the PR is merged, and return it as an Outcome.
     """
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-
-    get_response = requests.get(rest_topic_url + topic_name, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if get_response.status_code == 200:
-        logger.info(f"The topic {topic_name} will be deleted once the PR is merged.")
+    message = f"The {operation.resource_type} {operation.resource_id} will be {PAST_TENSES[operation.action]} once the PR is merged"
+    if status == FAILED:
+        logger.error(f"The {operation.resource_type} {operation.resource_id} can not be {PAST_TENSES[operation.action]} - {detail}")
     else:
-        logger.error(f"Topic {topic_name} will not be deleted because it doesnt exist. Status code {str(get_response.status_code)} and reason {str(get_response.reason)}" )
-
-
-def find_changed_acls(source_acls, feature_acls):
-    """
-    Compare source topics with feature topics and identify changes, deletions, and new additions.
-
-    Parameters:
-    - source_topics (list of dicts): List of dictionaries representing source topics.
-    - feature_topics (list of dicts): List of dictionaries representing feature topics.
-
-    Returns:
-    list: A list of dictionaries, each containing information about changed topics. Each dictionary has the following format:
-        {'acl_id': str, 'type': str, 'changes': dict}
-        - 'acl_id': The identifier of the acl.
-        - 'type': Type of change ('update', 'removed', 'new').
-        - 'changes': Dictionary representing the changes (present if 'type' is 'update').
-    """
-    source_acls_dict = {}
-    feature_acls_dict = {}
-
-    for value in source_acls:
-        source_acls_dict.update(value)
-
-    for value in feature_acls:
-        feature_acls_dict.update(value)
+        logger.info(f"{message} - {detail}" if detail else message)
+    return Outcome(operation.resource_type, operation.resource_id, operation.action, status, detail)
 
-    changed_acls = []
-    # Check for changes and deletions
-    for acl_name, source_acl in source_acls_dict.items():
-        feature_acl = feature_acls_dict.get(acl_name)
-        if not feature_acl:
-            # ACL was removed
-            changed_acls.append({acl_name: source_acls_dict.get(acl_name), "type": "removed"})
-            logger.info(f"The following acl will be removed : {acl_name}")
 
-    # Check for new additions
-    for acl_name in feature_acls_dict:
-        if acl_name not in source_acls_dict.keys():
-            changed_acls.append({acl_name: feature_acls_dict.get(acl_name), "type": "new"})
-            logger.info(f"The following acl will be added : {acl_name}")
-    return changed_acls
+# How the plan describes each action of the pipeline's change set
+PAST_TENSES = {'create': 'created', 'update': 'updated', 'delete': 'deleted', 'deploy': 'deployed'}
 
 
-def build_acl_rest_url(base_url, cluster_id):
+def check_change_set(phases, env):
     """
-    Build the REST API URL for Kafka topics based on the provided base URL and cluster ID.
+    Validate and describe every operation of a change set built by pipeline.build_change_set.
 
-    Parameters:
-    - base_url (str): The base URL of the Kafka REST API.
-    - cluster_id (str): The ID of the Kafka cluster.
+    The change set is first checked against the policy of the environment, reporting every violation at once.
+    Topics, and the connectors that use them, are then checked against the cluster snapshot in the order the
+    pipeline applies them, so a connector may use a topic that the same change set creates.
 
     Returns:
-    str: The constructed REST API URL for Kafka topics.
-    """
-    return f'{base_url}/v3/clusters/{cluster_id}/acls/'
-
-
-def add_new_acl(acl):
-    """
-    Add a new Kafka acl using the provided ACL configuration.
-
-    Parameters:
-    - acl (dict): Dictionary representing the configuration of the new Kafka ACL.
-
-    """
-    logger.info(f"The acl {acl} will be created once the PR is merged")
-
-
-def build_service_now_rest_url():
-    return f'{CIGNA_SERVICE_NOW_REST_URL}'
-
-
-def get_application_owner(filename):
-    df = pd.read_csv(filename)
-    for index, row in df.iterrows():
-        if row['ba.id'] != 'nan':
-            ba_id = row['ba.id']
-            break
-
-    ## service now logic
-    first_response = requests.get(CIGNA_SERVICE_NOW_REST_URL + str(ba_id), auth=(SERVICE_NOW_USERNAME, SERVICE_NOW_PASSWORD))
-
-    if first_response.text != "{\"result\":[]}":
-        logger.info(f"The ba.id is {ba_id} ")
-
-        first_result = json.loads(first_response.text)
-        service_now_request = first_result["result"][0]["it_application_owner"]["link"]
-
-        second_response = requests.get(service_now_request, auth=(SERVICE_NOW_USERNAME, SERVICE_NOW_PASSWORD))
-        second_result = json.loads(second_response.text)
-        application_owners = second_result["result"]['u_addl_email_addresses']
-        logger.info(f"Application owner contact info is - {application_owners}")
-
-        gh = Github(GITHUB_TOKEN)
-        repo = gh.get_repo("NiyiOdumosu/kafka-application-owner")
-        all_files = []
-        contents = repo.get_contents("")
-        while contents:
-            file_content = contents.pop(0)
-            if file_content.type == "dir":
-                contents.extend(repo.get_contents(file_content.path))
-            else:
-                file = file_content
-                all_files.append(str(file).replace('ContentFile(path="','').replace('")',''))
-
-        with open('application_owners.csv', 'a') as file:
-            file.writelines(f"{ba_id}, \"{application_owners}\"\n")
-
-        with open('application_owners.csv', 'r') as f:
-            content = f.read()
-
-        git_file = 'application_owners.csv'
-        if git_file in all_files:
-            contents = repo.get_contents(git_file)
-            repo.update_file(contents.path, "Added new application owner", content, contents.sha,  branch="main")
-            logger.info(f'Updated application owner to {git_file}')
-        else:
-            repo.create_file(git_file, "committing files", content,  branch="main")
-            logger.info(f'Created {git_file}')
-
-    else:
-        logger.error(f"The ba.id added does not exist in ServiceNow")
-
-
-def delete_acl(acl):
-    """
-    Delete a Kafka acl based on the provided topic configuration.
-
-    Parameters:
-    - topic (dict): Dictionary representing the configuration of the Kafka acl, including the topic name.
+    list: One Outcome per operation of the change set.
 
     Raises:
-    SystemExit: If the deletion fails, the program exits with status code 1.
-
-    Notes:
-    This method first checks if the topic exists by making a GET request to the Kafka REST API.
-    If the topic exists, it proceeds to delete the topic using a DELETE request.
-    """
-    rest_acl_url = build_acl_rest_url(REST_PROXY_URL, CLUSTER_ID)
-
-    get_response = requests.get(rest_acl_url, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if get_response.status_code == 200:
-        logger.info(f"Response code is {str(get_response.status_code)}")
-        logger.info(f"The acl {acl} will be removed once the PR is merged.")
-    else:
-        logger.error(f"Failed due to the following status code {str(get_response.status_code)} and reason {str(get_response.reason)}" )
-
-
-def add_or_remove_acls(changed_acls):
-    for i, acls in enumerate(changed_acls):
-        acl_configs = list(acls.values())
-        if acls['type'] == 'new':
-            add_new_acl(acl_configs[0])
-        elif acls['type'] == 'removed':
-            delete_acl(acl_configs[0])
-        else:
-            continue
-
-
-def build_connect_rest_url(base_url, connector_name):
-    """
-    Build the REST API URL for Connect cluster on the provided base URL .
-
-    Parameters:
-    - base_url (str): The base URL of the Kafka REST API.
-
-    Returns:
-    str: The constructed REST API URL for connectors.
+    SystemExit: If the change set breaks the policy or an operation can not be applied, the program exits with
+    status code 1.
     """
-    return f'{base_url}/connectors/{connector_name}/config'
-
-
-def process_connector_changes(connector_file):
-    # Add a new connector
-    connector_name = connector_file.split("/connectors/")[1].replace(".json","")
-    json_file = open(connector_file)
-    json_string_template = string.Template(json_file.read())
-    json_string = json_string_template.substitute(**os.environ)
-
-    connector_configs = json.loads(json_string)
-
-    rest_topic_url = build_topic_rest_url(REST_PROXY_URL, CLUSTER_ID)
-    try:
-        topics = connector_configs['topics']
-    except KeyError:
-        logger.info("The topic field name for this connector is not topics or topic.whitelist")
-    try:
-        topics = connector_configs['topic.whitelist']
-    except KeyError:
-        logger.info("The topic field name for this connector is not topics or topic.whitelist")
-
-    if ',' in topics:
-        topic_list = topics.split(',')
-        for topic in topic_list:
-            verify_topic_in_connector(connector_name, rest_topic_url, topic)
-    else:
-        verify_topic_in_connector(connector_name, rest_topic_url, topics)
-
-    logger.info(f"The connector {connector_name} will be added once the PR is merged with the following configs {json_string}")
-
-
-def verify_topic_in_connector(connector_name, rest_topic_url, topic):
-    topic_response = requests.get(rest_topic_url + topic, auth=(REST_BASIC_AUTH_USER, REST_BASIC_AUTH_PASS))
-    if topic_response.status_code == 200:
-        logger.info(f"Topic {topic} for connector {connector_name} currently exists")
-    else:
-        logger.error(
-            f"Topic {topic} for connector {connector_name} currently does not exist - {str(topic_response.status_code)}")
+    if check_policy(phases, env):
         exit(1)
-
-
-def delete_connector(connector_file):
-    # Remove a connector
-    connector_name = connector_file.split("/connectors/")[1].replace(".json","")
-    logger.info(f"The connector {connector_name} will be deleted once the PR is merged")
+    planned_topics = get_cluster_snapshot().topic_names()
+    outcomes = []
+    for _, operations in phases:
+        for operation in operations:
+            if operation.resource_type == 'topic':
+                outcomes.append(check_topic(operation, planned_topics))
+            elif operation.resource_type == 'connector':
+                outcomes.append(check_connector(operation, planned_topics))
+            else:
+                outcomes.append(operation_outcome(operation, SUCCEEDED))
+    failed = [outcome for outcome in outcomes if outcome.failed]
+    logger.info(f"The plan has {len(outcomes)} change(s), {len(failed)} of which can not be applied")
+    if failed:
+        exit(1)
+    return outcomes
 
 
 @click.command()
 @click.argument('pr_id')
-def main(pr_id):
-
-    repo, files_set, head_branch, base_branch = get_files(pr_id)
-    env = base_branch.split('-')[-1]
-    for file in files_set:
-        if f"topics_{env}.json" in file:
-            filename = file.split("-")[0]
-            head_content, base_content = get_content_from_branches(repo, filename, head_branch, base_branch)
-            changed_topics = find_changed_topics(head_content, base_content)
-            process_changed_topics(changed_topics)
-        if f"topic_configs_{env}.csv" in file:
-            filename = file.split("-")[0]
-            get_application_owner(filename)
-        if f"acls_{env}.json" in file:
-            filename = file.split("-")[0]
-            head_content, base_content = get_content_from_branches(repo, filename, head_branch, base_branch)
-            changed_acls = find_changed_acls(head_content, base_content)
-            add_or_remove_acls(changed_acls)
-        if ("connectors" in file) and (f"-{env}" in file) and ('removed' in file):
-            filename = file.rsplit("-", 1)[0]
-            delete_connector(filename)
-        elif (("connectors" in file) and (f"-{env}" in file) and ('added' in file)) or (("connectors" in file) and (f"-{env}" in file) and ('modified' in file)):
-            filename = file.rsplit("-", 1)[0]
-            process_connector_changes(filename)
+@click.option('--local-diff', is_flag=True, help='List the changed files with a local git diff instead of the GitHub API.')
+@click.option('--write-plan', 'write_plan_file', is_flag=True, help='Write the change set to a plan file that the pipeline can apply after the merge.')
+def main(pr_id, local_diff, write_plan_file):
+
+    metrics = get_metrics()
+    try:
+        repo, changes, pull_request = get_files(pr_id, local_diff)
+        env = pull_request.base.ref.split('-')[-1]
+        base_sha, head_sha = pull_request.base.sha, pull_request.head.sha
+        fetcher = LocalBlobFetcher() if local_diff else GitHubBlobFetcher(repo)
+        with fetcher:
+            resource_files = [change.path for change in changes
+                              if change.path.endswith((f"topics_{env}.json", f"acls_{env}.json"))]
+            with metrics.timed('stage', 'git read'):
+                fetcher.prefetch([base_sha, head_sha], resource_files)
+            # SCRAM users are looked up by the pipeline at apply time, the PR agent has no kafka-configs access
+            with metrics.timed('stage', 'build change set'):
+                phases = build_change_set(changes, env, fetcher, base_sha, head_sha, users=False)
+            change_key = change_set_key(changes, env, fetcher, base_sha, head_sha) if write_plan_file else None
+        with metrics.timed('stage', 'validate'):
+            check_change_set(phases, env)
+
+        if write_plan_file:
+            write_plan(phases, plan_path(change_key), change_key, env, plan_fingerprint(phases), head_sha, base_sha)
+
+        # Every BA id in the pull request is resolved at once and the owner file is updated in a single commit
+        with metrics.timed('stage', 'application owners'):
+            sync_application_owners([change.path for change in changes
+                                     if change.path.endswith(f"topic_configs_{env}.csv") and change.status != FILE_REMOVED])
+    finally:
+        metrics.finish()
 
 
 if __name__ == "__main__":
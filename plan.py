@@ -0,0 +1,137 @@
+from apply_engine import Operation
+from dataclasses import asdict
+from differ import TopicChange
+
+import json
+import logging
+import os
+import time
+
+# Constant variables
+PLAN_DIR = os.getenv('PLAN_DIR', '.plans')
+PLAN_VERSION = 3
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def plan_path(change_key, plan_dir=PLAN_DIR):
+    """
+    Return the plan file of a change set, named after its key, see pipeline.change_set_key.
+    """
+    return os.path.join(plan_dir, f'plan-{change_key}.json')
+
+
+def encode_value(value):
+    """
+    Convert an operation argument to json, tagging the TopicChange records so they can be restored.
+    """
+    if isinstance(value, TopicChange):
+        return {'__topic_change__': asdict(value)}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if '__topic_change__' in value:
+            return TopicChange(**value['__topic_change__'])
+        return {key: decode_value(item) for key, item in value.items()}
+    return value
+
+
+def plan_resources(phases):
+    """
+    Return the topic names and ACL bindings touched by a change set, as hashed into its fingerprint.
+
+    Returns:
+    tuple: (topic_names, acls)
+    """
+    topic_names = set()
+    acls = []
+    for _, operations in phases:
+        for operation in operations:
+            if operation.resource_type == 'topic':
+                topic_names.add(operation.resource_id)
+            elif operation.resource_type == 'acl':
+                acls.append(operation.args[0])
+    return topic_names, acls
+
+
+def write_plan(phases, path, change_key, env, fingerprint, commit_sha=None, previous_sha=None):
+    """
+    Serialise a change set to a plan file.
+
+    Parameters:
+    - phases (list of tuples): (phase_name, list of Operation) as returned by build_change_set.
+    - path (str): The plan file to write.
+    - change_key (str): The key of the file changes the plan was built from, see pipeline.change_set_key.
+    - env (str): The environment of the plan.
+    - fingerprint (str): The fingerprint of the cluster state the plan was computed against.
+    - commit_sha (str): The commit the plan was built for, for information only.
+    - previous_sha (str): The commit the plan was diffed against, for information only.
+    """
+    plan = {
+        'version': PLAN_VERSION,
+        'change_key': change_key,
+        'commit_sha': commit_sha,
+        'previous_sha': previous_sha,
+        'env': env,
+        'fingerprint': fingerprint,
+        'created_at': time.time(),
+        'phases': [
+            [phase_name, [[operation.resource_type, operation.resource_id, operation.action, operation.func.__name__,
+                           encode_value(operation.args), operation.cache_entry,
+                           operation.batch.__name__ if operation.batch else None] for operation in operations]]
+            for phase_name, operations in phases
+        ],
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as plan_file:
+        json.dump(plan, plan_file, separators=(',', ':'))
+    logger.info(f"Wrote the plan of {sum(len(operations) for _, operations in phases)} operation(s) to {path}")
+
+
+def read_plan(path, functions):
+    """
+    Load a plan file written by write_plan.
+
+    Parameters:
+    - path (str): The plan file.
+    - functions (dict): {function_name: function} of the functions a plan may call.
+
+    Returns:
+    tuple: (plan, phases) where plan is the plan metadata and phases the restored (phase_name, list of Operation)
+    tuples, or (None, None) if the file does not exist or cannot be used.
+    """
+    try:
+        with open(path, 'r') as plan_file:
+            plan = json.load(plan_file)
+    except FileNotFoundError:
+        return None, None
+    except json.decoder.JSONDecodeError as error:
+        logger.error(f"The plan {path} is not valid json - {error}")
+        return None, None
+    if plan.get('version') != PLAN_VERSION:
+        logger.warning(f"The plan {path} has version {plan.get('version')}, expected {PLAN_VERSION}")
+        return None, None
+
+    phases = []
+    for phase_name, operations in plan['phases']:
+        restored = []
+        for resource_type, resource_id, action, function_name, args, cache_entry, batch_name in operations:
+            for name in (function_name, batch_name):
+                if name is not None and name not in functions:
+                    logger.error(f"The plan {path} calls the unknown function {name}")
+                    return None, None
+            restored.append(Operation(resource_type, resource_id, action, functions[function_name],
+                                      tuple(decode_value(args)), tuple(cache_entry) if cache_entry else None,
+                                      functions[batch_name] if batch_name else None))
+        phases.append((phase_name, restored))
+    return plan, phases
@@ -0,0 +1,203 @@
+from dataclasses import dataclass
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import SchemaError
+
+import json
+import logging
+import os
+import threading
+
+# Constant variables
+POLICY_PATH = os.getenv('POLICY_PATH', 'policy.json')
+TOPIC_NAME_PATTERN = r'^[a-zA-Z0-9]+(?:[_.-][a-zA-Z0-9]+)*$'
+MAX_PARTITIONS_COUNT = 32
+# 7 days
+MAX_RETENTION_MS = 604800000
+# 5 Mebibytes
+MAX_MESSAGE_BYTES = 5242940
+VALID_COMPRESSION_TYPES = ("uncompressed", "zstd", "lz4", "snappy", "gzip", "producer")
+VALID_CLEANUP_POLICY_TYPES = ('compact', 'delete', 'compact,delete')
+ACL_FIELDS = ('resource_type', 'resource_name', 'pattern_type', 'principal', 'host', 'operation', 'permission')
+ACL_RESOURCE_TYPES = ('TOPIC', 'GROUP', 'CLUSTER', 'TRANSACTIONAL_ID', 'DELEGATION_TOKEN')
+ACL_PATTERN_TYPES = ('LITERAL', 'PREFIXED')
+ACL_OPERATIONS = ('ALL', 'READ', 'WRITE', 'CREATE', 'DELETE', 'ALTER', 'DESCRIBE', 'CLUSTER_ACTION',
+                  'DESCRIBE_CONFIGS', 'ALTER_CONFIGS', 'IDEMPOTENT_WRITE')
+ACL_PERMISSIONS = ('ALLOW', 'DENY')
+
+# The guardrails of every environment, as one JSON Schema per kind of document. Topic documents have their configs
+# as a {name: value} object, see topic_document. 'new_topic' only applies to topics being created. ACL enums are
+# matched in any case, like the REST Proxy does.
+DEFAULT_POLICY = {
+    'topic': {
+        'type': 'object',
+        'properties': {
+            'topic_name': {'type': 'string', 'pattern': TOPIC_NAME_PATTERN},
+            'partitions_count': {'type': 'integer', 'minimum': 1, 'maximum': MAX_PARTITIONS_COUNT},
+            'configs': {
+                'type': 'object',
+                'properties': {
+                    'retention.ms': {'type': 'integer', 'minimum': 0, 'maximum': MAX_RETENTION_MS},
+                    'max.message.bytes': {'type': 'integer', 'minimum': 0, 'maximum': MAX_MESSAGE_BYTES},
+                    'compression.type': {'enum': list(VALID_COMPRESSION_TYPES)},
+                    'cleanup.policy': {'enum': list(VALID_CLEANUP_POLICY_TYPES)},
+                },
+            },
+        },
+    },
+    'new_topic': {'required': ['topic_name', 'partitions_count']},
+    'acl': {
+        'type': 'object',
+        'required': list(ACL_FIELDS),
+        'properties': {
+            'resource_type': {'type': 'string', 'pattern': f"(?i)^({'|'.join(ACL_RESOURCE_TYPES)})$"},
+            'resource_name': {'type': 'string', 'minLength': 1},
+            'pattern_type': {'type': 'string', 'pattern': f"(?i)^({'|'.join(ACL_PATTERN_TYPES)})$"},
+            'principal': {'type': 'string', 'pattern': r'^[A-Za-z]+:.+$'},
+            'host': {'type': 'string', 'minLength': 1},
+            'operation': {'type': 'string', 'pattern': f"(?i)^({'|'.join(ACL_OPERATIONS)})$"},
+            'permission': {'type': 'string', 'pattern': f"(?i)^({'|'.join(ACL_PERMISSIONS)})$"},
+        },
+    },
+    'connector': {
+        'type': 'object',
+        'required': ['connector.class'],
+        'properties': {
+            'tasks.max': {'type': ['string', 'integer'], 'pattern': r'^[1-9][0-9]*$', 'minimum': 1},
+        },
+    },
+}
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+@dataclass
+class Violation:
+    """
+    A resource of a change set that breaks a policy rule.
+
+    Attributes:
+    - resource_type (str): 'topic', 'acl' or 'connector'.
+    - resource_id (str): The topic name, acl id or connector name.
+    - field (str): The path of the offending field, e.g. 'configs/retention.ms', or '' for the whole resource.
+    - message (str): What is wrong with it.
+    """
+    resource_type: str
+    resource_id: str
+    field: str
+    message: str
+
+    def __str__(self):
+        field = f" {self.field}" if self.field else ''
+        return f"{self.resource_type} {self.resource_id}{field}: {self.message}"
+
+
+class Policy:
+    """
+    The compiled rule set of one environment.
+
+    Every kind of document has a single validator built from the default rules and the rules of the policy
+    file, so the schemas are checked and compiled once per environment rather than once per resource.
+    """
+
+    def __init__(self, env, schemas):
+        self.env = env
+        self.validators = {kind: Draft7Validator(schema) for kind, schema in schemas.items()}
+
+    def check(self, documents):
+        """
+        Validate documents against the rules of their kind and collect every violation.
+
+        Parameters:
+        - documents (iterable of tuples): (kinds, resource_type, resource_id, document) where kinds is the tuple
+          of rule kinds the document must satisfy, e.g. ('topic', 'new_topic').
+
+        Returns:
+        list: Violation objects, in the order of the documents. The list is empty if every document is valid.
+        """
+        violations = []
+        for kinds, resource_type, resource_id, document in documents:
+            for kind in kinds:
+                validator = self.validators.get(kind)
+                if validator is None:
+                    continue
+                for error in sorted(validator.iter_errors(document), key=lambda error: list(error.absolute_path)):
+                    violations.append(Violation(resource_type, resource_id,
+                                                '/'.join(str(part) for part in error.absolute_path), error.message))
+        return violations
+
+
+def read_policy_file(path=POLICY_PATH):
+    """
+    Read the policy file, or return an empty policy if there is none.
+
+    The file is a json object keyed by environment, plus "default" for rules that apply to every environment.
+    Each entry maps a kind of document ('topic', 'new_topic', 'acl' or 'connector') to a JSON Schema. These
+    rules are added to DEFAULT_POLICY, so they can only tighten it.
+
+    Example:
+        {"prd": {"topic": {"properties": {"replication_factor": {"minimum": 3}}}}}
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as policy_file:
+        return json.load(policy_file)
+
+
+def compile_policy(env, path=POLICY_PATH):
+    """
+    Combine the default rules with the rules of the policy file for an environment and compile them.
+
+    Returns:
+    Policy: The compiled policy.
+
+    Raises:
+    ValueError: If a rule in the policy file is not a valid JSON Schema.
+    """
+    rules = read_policy_file(path)
+    schemas = {}
+    for kind, default_schema in DEFAULT_POLICY.items():
+        extra = [rules[scope][kind] for scope in ('default', env) if kind in rules.get(scope, {})]
+        schemas[kind] = {'allOf': [default_schema] + extra} if extra else default_schema
+        try:
+            Draft7Validator.check_schema(schemas[kind])
+        except SchemaError as e:
+            raise ValueError(f"The {kind} rules of {env} in {path} are not a valid JSON Schema - {e.message}")
+    return Policy(env, schemas)
+
+
+def get_policy(env):
+    """
+    Return the compiled policy of an environment, compiling it on first use.
+    """
+    with _policies_lock:
+        if env not in _policies:
+            _policies[env] = compile_policy(env)
+        return _policies[env]
+
+
+def number(value):
+    """
+    Convert a whole number written as a string, as partitions_count is in the topics files, to an int.
+    """
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    return value
+
+
+def topic_document(topic_name, partitions_count=None, replication_factor=None, configs=None):
+    """
+    Build the document the topic rules are checked against. Fields that are None are left out, so an update
+    is only checked on the fields it changes.
+    """
+    document = {'topic_name': topic_name,
+                'configs': {name: number(value) for name, value in (configs or {}).items()}}
+    if partitions_count is not None:
+        document['partitions_count'] = number(partitions_count)
+    if replication_factor is not None:
+        document['replication_factor'] = number(replication_factor)
+    return document
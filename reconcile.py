@@ -0,0 +1,254 @@
+from dataclasses import asdict, dataclass
+from subprocess import PIPE
+from rest_client import close_sessions
+from cluster_state import ACL_FIELDS, acl_key, connector_differences, get_cluster_snapshot, get_connect_snapshot
+from differ import CONFIG_SET, PARTITION_DECREASE, PARTITION_INCREASE, REPLICATION_CHANGE, TopicChange, normalise_topic
+from resource_stream import iter_resource_file
+from apply_engine import MAX_WORKERS, Operation, run_graph, summarize_outcomes
+from metrics import get_metrics
+from changelog import start_changelog
+from pipeline import (add_new_acl, add_new_topic, admin_batching, check_policy, create_acls_batch, operation_dependencies,
+                      process_connector_changes, refresh_after_apply, rejected_outcomes, render_connector_config,
+                      scram_user_operations, topic_update_operation)
+
+import click
+import glob
+import json
+import logging
+import os
+import subprocess
+
+# Drift kinds
+MISSING = 'missing'
+CHANGED = 'changed'
+UNMANAGED = 'unmanaged'
+INVALID = 'invalid'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Drift:
+    """
+    A difference between the repository and the live cluster.
+
+    Attributes:
+    - resource_type (str): 'topic', 'acl' or 'connector'.
+    - resource_id (str): The topic name, acl id or connector name.
+    - kind (str): MISSING if the resource is only in the repository, UNMANAGED if it is only on the cluster,
+      CHANGED if both have it with different definitions and INVALID if its file in the repository cannot be
+      rendered, e.g. because a connector references an unset environment variable.
+    - detail: The definition in the repository for MISSING topics and ACLs, the live ACL for UNMANAGED ACLs,
+      the TopicChange records for CHANGED topics, and the file path (and differing keys or the rendering error)
+      for connectors.
+    """
+    resource_type: str
+    resource_id: str
+    kind: str
+    detail: object = None
+
+
+def desired_topics(root, env):
+    """
+    Read every topics_{env}.json in the repository.
+
+    Returns:
+    dict: {topic_name: definition}
+    """
+    topics = {}
+    for path in sorted(glob.glob(os.path.join(root, '*', 'topics', f'topics_{env}.json'))):
+        topics.update(iter_resource_file(path))
+    return topics
+
+
+def desired_acls(root, env):
+    """
+    Read every acls_{env}.json in the repository.
+
+    Returns:
+    dict: {acl_key: (acl_id, definition)}
+    """
+    acls = {}
+    for path in sorted(glob.glob(os.path.join(root, '*', 'acls', f'acls_{env}.json'))):
+        for acl_id, acl in iter_resource_file(path):
+            acls[acl_key(acl)] = (acl_id, acl)
+    return acls
+
+
+def desired_connectors(root, env):
+    """
+    Find every connector file of the environment in the repository.
+
+    Returns:
+    dict: {connector_name: path}
+    """
+    return {os.path.basename(path).replace('.json', ''): path
+            for path in sorted(glob.glob(os.path.join(root, '*', 'connectors', f'*-{env}.json')))}
+
+
+def topic_drift(topic_name, desired, live_topic, live_configs):
+    """
+    Compare a topic in the repository with its live definition.
+
+    Only the configs declared in the repository are compared, since the cluster also reports every default.
+
+    Returns:
+    list: TopicChange records turning the live topic into the desired one.
+    """
+    partitions_count, replication_factor, configs = normalise_topic(desired)
+    changes = []
+    live_partitions = live_topic.get('partitions_count')
+    if partitions_count is not None and live_partitions is not None and partitions_count != int(live_partitions):
+        kind = PARTITION_DECREASE if partitions_count < int(live_partitions) else PARTITION_INCREASE
+        changes.append(TopicChange(topic_name, kind, 'partitions_count', int(live_partitions), partitions_count))
+    if replication_factor is not None and str(replication_factor) != str(live_topic.get('replication_factor')):
+        changes.append(TopicChange(topic_name, REPLICATION_CHANGE, 'replication_factor',
+                                   live_topic.get('replication_factor'), replication_factor))
+    for name, value in configs.items():
+        if live_configs.get(name) != str(value):
+            changes.append(TopicChange(topic_name, CONFIG_SET, name, live_configs.get(name), value))
+    return changes
+
+
+def detect_drift(root, env, snapshot, live_connectors):
+    """
+    Compare the whole repository with the live cluster.
+
+    Every comparison is a set operation or a lookup on the indexed snapshot, so no request is made per resource.
+
+    Parameters:
+    - root (str): The repository root.
+    - env (str): The environment to reconcile.
+    - snapshot (ClusterSnapshot): The loaded snapshot of the cluster.
+    - live_connectors (dict): {connector_name: config} from ConnectSnapshot.connector_configs.
+
+    Returns:
+    list: Drift records.
+    """
+    drifts = []
+
+    topics = desired_topics(root, env)
+    live_topic_names = snapshot.topic_names()
+    for topic_name in sorted(topics.keys() - live_topic_names):
+        drifts.append(Drift('topic', topic_name, MISSING, topics[topic_name]))
+    for topic_name in sorted(topics.keys() & live_topic_names):
+        changes = topic_drift(topic_name, topics[topic_name], snapshot.get_topic(topic_name), snapshot.topic_configs(topic_name))
+        if changes:
+            drifts.append(Drift('topic', topic_name, CHANGED, changes))
+    for topic_name in sorted(live_topic_names - topics.keys()):
+        drifts.append(Drift('topic', topic_name, UNMANAGED))
+
+    acls = desired_acls(root, env)
+    live_acl_keys = snapshot.acl_keys()
+    for key in sorted(acls.keys() - live_acl_keys):
+        acl_id, acl = acls[key]
+        drifts.append(Drift('acl', acl_id, MISSING, acl))
+    for key in sorted(live_acl_keys - acls.keys()):
+        acl = dict(zip(ACL_FIELDS, key))
+        drifts.append(Drift('acl', f"{acl['principal']}-{acl['resource_name']}-{acl['operation']}", UNMANAGED, acl))
+
+    connectors = desired_connectors(root, env)
+    for connector_name, path in sorted(connectors.items()):
+        try:
+            desired = json.loads(render_connector_config(path))
+        except KeyError as e:
+            drifts.append(Drift('connector', connector_name, INVALID, {'path': path, 'error': f"the environment variable {e} is not set"}))
+            continue
+        except ValueError as e:
+            drifts.append(Drift('connector', connector_name, INVALID, {'path': path, 'error': str(e)}))
+            continue
+        if connector_name not in live_connectors:
+            drifts.append(Drift('connector', connector_name, MISSING, {'path': path}))
+            continue
+        differences = connector_differences(desired, live_connectors[connector_name])
+        if differences:
+            drifts.append(Drift('connector', connector_name, CHANGED, {'path': path, 'differences': differences}))
+    for connector_name in sorted(live_connectors.keys() - connectors.keys()):
+        drifts.append(Drift('connector', connector_name, UNMANAGED))
+    return drifts
+
+
+def fix_operations(drifts):
+    """
+    Build the phases that bring the cluster back in line with the repository.
+
+    Missing and changed resources are created or updated. Unmanaged resources are only reported, since they
+    may belong to something other than this repository, and invalid ones until their file is fixed.
+
+    Returns:
+    list: (phase_name, list of Operation) tuples, applied with apply_engine.run_graph in the order of
+    pipeline.operation_dependencies, like the change set of the pipeline.
+    """
+    topic_operations, acl_operations, connector_operations = [], [], []
+    for drift in drifts:
+        if drift.resource_type == 'topic' and drift.kind == MISSING:
+            topic_operations.append(Operation('topic', drift.resource_id, 'create', add_new_topic, (drift.detail,)))
+        elif drift.resource_type == 'topic' and drift.kind == CHANGED:
+            topic_operations.append(topic_update_operation(drift.resource_id, drift.detail))
+        elif drift.resource_type == 'acl' and drift.kind == MISSING:
+            acl_operations.append(Operation('acl', drift.resource_id, 'create', add_new_acl, (drift.detail,),
+                                            batch=create_acls_batch))
+        elif drift.resource_type == 'connector' and drift.kind in (MISSING, CHANGED):
+            connector_operations.append(Operation('connector', drift.resource_id, 'deploy', process_connector_changes, (drift.detail['path'],)))
+    return [
+        ('topic', topic_operations),
+        ('user', scram_user_operations(acl_operations)),
+        ('acl', acl_operations),
+        ('connector', connector_operations),
+    ]
+
+
+def summarize_drift(drifts):
+    totals = {}
+    for drift in drifts:
+        key = (drift.resource_type, drift.kind)
+        totals[key] = totals.get(key, 0) + 1
+        detail = f" - {drift.detail}" if drift.kind in (CHANGED, INVALID) else ''
+        logger.warning(f"{drift.kind.upper()} {drift.resource_type} {drift.resource_id}{detail}")
+    for (resource_type, kind), count in sorted(totals.items()):
+        logger.info(f"{count} {kind} {resource_type}(s)")
+    if not drifts:
+        logger.info("The cluster matches the repository")
+
+
+@click.command()
+@click.option('--root', default='.', help='The repository root containing the application folders.')
+@click.option('--env', required=True, help='The environment to reconcile.')
+@click.option('--fix', is_flag=True, help='Create and update the missing and changed resources.')
+@click.option('--report', type=click.Path(), help='Write the drift as json lines to this file.')
+def main(root, env, fix, report):
+    try:
+        snapshot = get_cluster_snapshot()
+        with get_metrics().timed('stage', 'detect drift'):
+            drifts = detect_drift(root, env, snapshot, get_connect_snapshot().connector_configs())
+        summarize_drift(drifts)
+        if report:
+            with open(report, 'w') as report_file:
+                report_file.write(''.join(json.dumps(asdict(drift)) + "\n" for drift in drifts))
+        if not fix:
+            return
+        phases = fix_operations(drifts)
+        violations = check_policy(phases, env)
+        if violations:
+            outcomes = rejected_outcomes(phases, violations)
+        else:
+            commit_sha = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, stdout=PIPE, stderr=PIPE).stdout
+            changelog = start_changelog(commit_sha.decode('utf-8').strip() or None)
+            try:
+                phases = admin_batching(phases)
+                with get_metrics().timed('stage', 'apply'):
+                    outcomes = run_graph(phases, operation_dependencies(phases), MAX_WORKERS)
+                    outcomes += refresh_after_apply()
+            finally:
+                changelog.flush()
+    finally:
+        close_sessions()
+        get_metrics().finish()
+    if not summarize_outcomes(outcomes):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from resource_stream import connector_hash, iter_resource_file, resource_hash
+
+import click
+import glob
+import logging
+import os
+import sqlite3
+import time
+
+# Constant variables
+RESOURCE_CACHE_PATH = os.getenv('RESOURCE_CACHE_PATH', '.resource_cache.db')
+RESOURCE_CACHE_MAX_ENTRIES = int(os.getenv('RESOURCE_CACHE_MAX_ENTRIES', '200000'))
+APPLIED = 'succeeded'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def application_of(filename):
+    """
+    Return the application a resource file belongs to, e.g. application1 for application1/topics/topics_dev.json.
+    """
+    return filename.replace('\\', '/').split('/')[0]
+
+
+class ResourceCache:
+    """
+    Persistent cache of the last applied definition hash and result of every topic, ACL and connector.
+
+    Entries are keyed by application, environment, resource type and resource id. The cache keeps at most
+    max_entries entries and evicts the least recently used ones beyond that.
+    """
+
+    def __init__(self, path=RESOURCE_CACHE_PATH, max_entries=RESOURCE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS resources ('
+                        'application TEXT, env TEXT, resource_type TEXT, resource_id TEXT, '
+                        'hash TEXT, result TEXT, last_used REAL, '
+                        'PRIMARY KEY (application, env, resource_type, resource_id))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS resources_last_used ON resources (last_used)')
+
+    def applied_hashes(self, application, env, resource_type):
+        """
+        Return the hashes of the definitions that were last applied successfully.
+
+        Every entry of the application, environment and resource type is marked as used, since the differ
+        looks all of them up, so entries that are read on every run are not evicted.
+
+        Returns:
+        dict: {resource_id: hash}
+        """
+        self.db.execute('UPDATE resources SET last_used = ? WHERE application = ? AND env = ? AND resource_type = ?',
+                        (time.time(), application, env, resource_type))
+        rows = self.db.execute('SELECT resource_id, hash FROM resources '
+                               'WHERE application = ? AND env = ? AND resource_type = ? AND result = ?',
+                               (application, env, resource_type, APPLIED))
+        return dict(rows.fetchall())
+
+    def record(self, application, env, resource_type, resource_id, definition_hash, result):
+        self.db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (application, env, resource_type, resource_id, definition_hash, result, time.time()))
+
+    def forget(self, application, env, resource_type, resource_id):
+        self.db.execute('DELETE FROM resources WHERE application = ? AND env = ? AND resource_type = ? AND resource_id = ?',
+                        (application, env, resource_type, resource_id))
+
+    def evict(self):
+        """
+        Delete the least recently used entries beyond max_entries.
+
+        Returns:
+        int: The number of evicted entries.
+        """
+        evicted = self.db.execute('DELETE FROM resources WHERE rowid IN ('
+                                  'SELECT rowid FROM resources ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                                  (self.max_entries,)).rowcount
+        if evicted:
+            logger.info(f"Evicted {evicted} resource cache entr(ies)")
+        return evicted
+
+    def clear(self):
+        self.db.execute('DELETE FROM resources')
+
+    def close(self):
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def rebuild_cache(cache, root, envs):
+    """
+    Rebuild the cache from the resource files in the working tree, treating them as applied.
+
+    Parameters:
+    - cache (ResourceCache): The cache to rebuild. Existing entries are removed.
+    - root (str): The repository root.
+    - envs (tuple of str): The environments to rebuild.
+
+    Returns:
+    int: The number of cached resources.
+    """
+    cache.clear()
+    count = 0
+    for env in envs:
+        for resource_type, pattern in (('topic', f'*/topics/topics_{env}.json'), ('acl', f'*/acls/acls_{env}.json')):
+            for path in glob.glob(os.path.join(root, pattern)):
+                application = application_of(os.path.relpath(path, root))
+                for resource_id, definition in iter_resource_file(path):
+                    cache.record(application, env, resource_type, resource_id, resource_hash(definition), APPLIED)
+                    count += 1
+        for path in glob.glob(os.path.join(root, f'*/connectors/*-{env}.json')):
+            application = application_of(os.path.relpath(path, root))
+            connector_name = os.path.basename(path).replace('.json', '')
+            # Rendered like the pipeline renders it, so the hash matches the one computed at deploy time
+            definition_hash = connector_hash(path)
+            if definition_hash is None:
+                logger.warning(f"The connector {connector_name} can not be rendered, it is left out of the cache")
+                continue
+            cache.record(application, env, 'connector', connector_name, definition_hash, APPLIED)
+            count += 1
+    return count
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option('--root', default='.', help='The repository root containing the application folders.')
+@click.option('--env', 'envs', multiple=True, required=True, help='The environment to rebuild. Can be repeated.')
+def rebuild(root, envs):
+    """Rebuild the cache from the resource files in the working tree."""
+    with ResourceCache() as cache:
+        count = rebuild_cache(cache, root, envs)
+    logger.info(f"Rebuilt the resource cache with {count} resource(s)")
+
+
+@cli.command()
+def clear():
+    """Remove every entry from the cache."""
+    with ResourceCache() as cache:
+        cache.clear()
+    logger.info("Cleared the resource cache")
+
+
+if __name__ == "__main__":
+    cli()
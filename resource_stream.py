@@ -0,0 +1,211 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import string
+import tempfile
+
+# Constant variables
+CHUNK_SIZE = 1 << 16
+STREAMING_THRESHOLD_BYTES = int(os.getenv('STREAMING_THRESHOLD_BYTES', str(50 * 1024 * 1024)))
+
+# Change types yielded by diff_resource_streams
+NEW = 'new'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def iter_resources(stream, chunk_size=CHUNK_SIZE):
+    """
+    Lazily yield the resources of a topics or acls file.
+
+    The files hold a json list of single key dictionaries, e.g. [{"topic_a": {...}}, {"topic_b": {...}}].
+    Only one chunk of the file and one resource are held in memory at a time.
+
+    Parameters:
+    - stream (file object): The file to read, opened in text or binary mode.
+    - chunk_size (int): The number of characters read from the stream at a time.
+
+    Returns:
+    generator: (resource_id, definition) tuples in file order. An empty file yields nothing.
+    """
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', ''):
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+    def next_token():
+        # Skip whitespace and return the next significant character without consuming it
+        nonlocal buffer
+        while True:
+            stripped = buffer.lstrip()
+            if stripped or eof:
+                buffer = stripped
+                return buffer[:1]
+            buffer = ''
+            read_more()
+
+    if next_token() == '':
+        return
+    if buffer[0] != '[':
+        raise ValueError("Expected the resources file to contain a json list")
+    buffer = buffer[1:]
+
+    while True:
+        token = next_token()
+        if token == ']':
+            return
+        if token == ',':
+            buffer = buffer[1:]
+            continue
+        if token == '':
+            raise ValueError("Unexpected end of the resources file")
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The element is split across chunks, read more and try again
+            read_more()
+            continue
+        buffer = buffer[end:]
+        if not isinstance(element, dict):
+            raise ValueError(f"Expected a dictionary per resource but found {type(element).__name__}")
+        yield from element.items()
+
+
+def iter_resource_file(path):
+    """
+    Lazily yield the (resource_id, definition) tuples of a topics or acls file on disk.
+    """
+    with open(path, 'r') as resources_file:
+        yield from iter_resources(resources_file)
+
+
+def iter_resource_stream(stream):
+    """
+    Lazily yield the (resource_id, definition) tuples of an open topics or acls file, closing it once done.
+    """
+    with stream:
+        yield from iter_resources(stream)
+
+
+def resource_pairs(resources):
+    """
+    Return (resource_id, definition) tuples for either a loaded resources list or an iterator of pairs.
+
+    Parameters:
+    - resources (list of dicts or iterator): The json list of single key dictionaries, or pairs from iter_resources.
+
+    Returns:
+    iterator: (resource_id, definition) tuples.
+    """
+    if isinstance(resources, list):
+        return (pair for value in resources for pair in value.items())
+    return iter(resources)
+
+
+def write_json(resources, path, stream=False):
+    """
+    Write resources to a json file, as done by generate_topics and generate_acls.
+
+    Parameters:
+    - resources (list): The resources to write.
+    - path (str): The file to write.
+    - stream (bool): Encode and write the json chunk by chunk instead of building the whole document in memory.
+
+    Returns:
+    str: The json document, or None when it was streamed.
+    """
+    with open(path, 'w') as json_file:
+        if stream:
+            for chunk in json.JSONEncoder(indent=4).iterencode(resources):
+                json_file.write(chunk)
+            return None
+        json_output = json.dumps(resources, indent=4)
+        json_file.write(json_output)
+        return json_output
+
+
+def canonical_json(definition):
+    return json.dumps(definition, sort_keys=True, separators=(',', ':'))
+
+
+def resource_hash(definition):
+    """
+    Return the sha256 of the canonical json of a resource definition. Key order and whitespace do not affect the hash.
+    """
+    return hashlib.sha256(canonical_json(definition).encode('utf-8')).hexdigest()
+
+
+def render_connector_config(connector_file):
+    """
+    Return the json of a connector file with the environment variables it references substituted.
+    """
+    with open(connector_file) as json_file:
+        json_string_template = string.Template(json_file.read())
+    return json_string_template.substitute(**os.environ)
+
+
+def connector_hash(connector_file):
+    """
+    Return the hash of the rendered connector config, or None if it cannot be rendered or parsed.
+    """
+    try:
+        return resource_hash(json.loads(render_connector_config(connector_file)))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def diff_resource_streams(source_pairs, feature_pairs, work_dir=None):
+    """
+    Compare two streams of resources by id with bounded memory.
+
+    Both streams are spilled into an on-disk sqlite index keyed by resource id and compared there, so neither
+    side is ever fully loaded in memory. On both sides a later definition of the same id replaces an earlier one,
+    like merging the list into one dictionary does in differ.index_resources.
+
+    Parameters:
+    - source_pairs (iterator): (resource_id, definition) tuples before the change.
+    - feature_pairs (iterator): (resource_id, definition) tuples after the change.
+    - work_dir (str): Directory for the temporary index. Defaults to the system temp directory.
+
+    Returns:
+    generator: (change_type, resource_id, source_definition, feature_definition) tuples where change_type is
+    NEW, REMOVED or CHANGED. The definition of the missing side is None.
+    """
+    with tempfile.TemporaryDirectory(dir=work_dir) as index_dir:
+        index = sqlite3.connect(os.path.join(index_dir, 'resources.db'))
+        try:
+            for table, pairs in (('source', source_pairs), ('feature', feature_pairs)):
+                index.execute(f'CREATE TABLE {table} (id TEXT PRIMARY KEY, body TEXT)')
+                index.executemany(f'INSERT OR REPLACE INTO {table} (id, body) VALUES (?, ?)',
+                                  ((resource_id, canonical_json(definition)) for resource_id, definition in pairs))
+
+            for resource_id, feature_body, source_body in index.execute(
+                    'SELECT feature.id, feature.body, source.body FROM feature '
+                    'LEFT JOIN source ON source.id = feature.id ORDER BY feature.rowid'):
+                if source_body is None:
+                    yield NEW, resource_id, None, json.loads(feature_body)
+                elif source_body != feature_body:
+                    yield CHANGED, resource_id, json.loads(source_body), json.loads(feature_body)
+
+            for resource_id, body in index.execute(
+                    'SELECT id, body FROM source WHERE id NOT IN (SELECT id FROM feature) ORDER BY rowid'):
+                yield REMOVED, resource_id, json.loads(body), None
+        finally:
+            index.close()
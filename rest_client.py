@@ -0,0 +1,181 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import get_metrics, http_call_name
+from cluster_targets import current_target
+
+import logging
+import os
+import requests
+import threading
+import time
+
+# Constant variables
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '5'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+HTTP_RATE_LIMIT = float(os.getenv('HTTP_RATE_LIMIT', '0'))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Methods that can be replayed after the server may have applied them. PUT is the connector config upsert.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT'])
+# Responses that guarantee the server did not apply the request, so any method can be retried on them
+UNPROCESSED_STATUS_CODES = (429, 503)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread using a session.
+
+    Allows bursts of up to one second worth of requests, then spaces them out to rate requests per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class WriteSafeRetry(Retry):
+    """
+    Retry policy that only replays a POST, PATCH or DELETE when the server cannot have applied it.
+
+    Idempotent methods are retried on connection errors, read timeouts and every RETRY_STATUS_CODES response.
+    Other methods are retried on connection errors and UNPROCESSED_STATUS_CODES only: after a read timeout or a
+    500 a create may already have succeeded, and its replay would fail with "already exists".
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if not self._is_method_retryable(method):
+            return bool(self.total) and status_code in UNPROCESSED_STATUS_CODES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to every request that does not set one, optionally
+    limits the rate of requests, and records every call in the run metrics under the session name.
+    """
+
+    def __init__(self, *args, timeout=None, rate_limiter=None, name='http', **kwargs):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.name = name
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        # The latency includes the retries made by urllib3 inside the adapter
+        with get_metrics().timed('http', http_call_name(self.name, request.method, request.url)) as timer:
+            timer.bytes_sent = len(request.body or b'')
+            response = super().send(request, **kwargs)
+            if not kwargs.get('stream'):
+                timer.bytes_received = len(response.content or b'')
+            timer.error = response.status_code >= 400
+        return response
+
+
+def build_session(auth=None, pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES,
+                  backoff_factor=HTTP_BACKOFF_FACTOR, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                  rate_limit=HTTP_RATE_LIMIT, name='http'):
+    """
+    Build a requests Session that keeps connections alive and retries throttled or failed calls.
+
+    Parameters:
+    - auth (tuple): Basic auth (user, password) sent with every request, or None.
+    - pool_size (int): The number of connections kept open per host.
+    - max_retries (int): How many times a request is retried on connection errors, 429 and 5xx responses, see
+      WriteSafeRetry.
+    - backoff_factor (float): Base of the exponential backoff between retries, in seconds.
+    - timeout (tuple): (connect, read) timeout in seconds applied to requests that do not set one.
+    - rate_limit (float): The maximum number of requests per second sent through the session. 0 disables the limit.
+    - name (str): The name the calls of the session are recorded under in the run metrics.
+
+    Returns:
+    requests.Session: The configured session.
+    """
+    retry = WriteSafeRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        # Read timeouts and 5xx responses are only retried for these methods, see WriteSafeRetry
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+    adapter = TimeoutHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, timeout=timeout,
+                                 rate_limiter=rate_limiter, name=name)
+
+    session = requests.Session()
+    session.auth = auth
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(name, auth=None, pool_size=None):
+    """
+    Return the shared session registered under the given name, creating it on first use.
+
+    Parameters:
+    - name (str): The name of the session, e.g. 'rest_proxy' or 'connect'.
+    - auth (tuple): Basic auth (user, password) used when the session is created.
+    - pool_size (int): The number of connections kept open per host, or None for HTTP_POOL_SIZE.
+
+    Returns:
+    requests.Session: The shared session.
+    """
+    pool_size = pool_size or HTTP_POOL_SIZE
+    with _sessions_lock:
+        if name not in _sessions:
+            logger.info(f"Opening a pooled HTTP session for {name} with {pool_size} connection(s)")
+            _sessions[name] = build_session(auth=auth, pool_size=pool_size, name=name)
+        return _sessions[name]
+
+
+def rest_proxy_session():
+    """
+    Return the shared session for the Kafka REST Proxy of the current cluster target.
+    """
+    target = current_target()
+    return get_session(f'{target.name}/rest_proxy', target.rest_auth, target.pool_size)
+
+
+def connect_session():
+    """
+    Return the shared session for the Connect REST API of the current cluster target.
+    """
+    target = current_target()
+    return get_session(f'{target.name}/connect', target.connect_auth, target.pool_size)
+
+
+def close_sessions():
+    """
+    Close every shared session and release its pooled connections.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,76 @@
+from subprocess import PIPE
+from metrics import get_metrics
+from cluster_targets import current_target
+
+import logging
+import os
+import re
+import subprocess
+
+# Constant variables
+KAFKA_CONFIGS = os.getenv('KAFKA_CONFIGS')
+KAFKA_CONFIGS_TIMEOUT = int(os.getenv('KAFKA_CONFIGS_TIMEOUT', '120'))
+USER_PRINCIPAL_PATTERN = re.compile(r"user-principal '([^']+)'")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_scram_users(describe_output):
+    """
+    Extract the user principals from the output of kafka-configs --describe --entity-type users.
+
+    Parameters:
+    - describe_output (str): The output of the describe command, e.g.
+      "SCRAM credential configs for user-principal 'alice' are SCRAM-SHA-256=iterations=8192"
+
+    Returns:
+    set: The names of the users that have SCRAM credentials.
+    """
+    return set(USER_PRINCIPAL_PATTERN.findall(describe_output))
+
+
+def describe_scram_users():
+    """
+    List every SCRAM user on the cluster with a single kafka-configs call.
+
+    Returns:
+    set: The names of the users that have SCRAM credentials.
+
+    Raises:
+    RuntimeError: If kafka-configs fails.
+    """
+    target = current_target()
+    with get_metrics().timed('subprocess', 'kafka-configs --describe') as timer:
+        result = subprocess.run([KAFKA_CONFIGS, '--bootstrap-server', target.bootstrap_url, '--describe', '--entity-type', 'users',
+                                 '--command-config', target.client_properties],
+                                stdout=PIPE, stderr=PIPE, timeout=KAFKA_CONFIGS_TIMEOUT)
+        timer.bytes_received = len(result.stdout)
+        timer.error = result.returncode != 0
+    if result.returncode != 0:
+        raise RuntimeError(f"Describing the SCRAM users failed due to - {result.stderr.decode('utf-8')}")
+    users = parse_scram_users(result.stdout.decode('utf-8'))
+    logger.info(f"Found {len(users)} existing SCRAM user(s)")
+    return users
+
+
+def alter_scram_user(user_principal, password):
+    """
+    Create or update the SCRAM-SHA-256 and SCRAM-SHA-512 credentials of a user and wait for kafka-configs to finish.
+
+    Parameters:
+    - user_principal (str): The name of the user, without the User: prefix.
+    - password (str): The password of the user.
+
+    Returns:
+    subprocess.CompletedProcess: The finished kafka-configs process.
+    """
+    target = current_target()
+    with get_metrics().timed('subprocess', 'kafka-configs --alter') as timer:
+        result = subprocess.run([KAFKA_CONFIGS, '--bootstrap-server', target.bootstrap_url, '--alter', '--add-config',
+                                 f'SCRAM-SHA-256=[password={password}],SCRAM-SHA-512=[password={password}]',
+                                 '--entity-type', 'users', '--entity-name', user_principal, '--command-config', target.client_properties],
+                                stdout=PIPE, stderr=PIPE, timeout=KAFKA_CONFIGS_TIMEOUT)
+        timer.error = result.returncode != 0
+    return result